@@ -3,9 +3,10 @@ app.py — Beach Volley Tournament Manager Pro v2
 Avvia con: streamlit run app.py
 """
 import streamlit as st
-from data_manager import load_state, save_state
+from stato_condiviso import get_stato, sostituisci_stato, salva, modifica
+from tabellone_pubblico import avvia_server
 from theme_manager import load_theme_config, save_theme_config, inject_theme_css, render_personalization_page
-from ranking_page import build_ranking_data
+from ranking_engine import top_ranking
 from fase_setup import render_setup
 from fase_gironi import render_gironi
 from fase_eliminazione import render_eliminazione
@@ -25,8 +26,6 @@ st.set_page_config(
 
 # ─── CARICAMENTO STATO ───────────────────────────────────────────────────────
 
-if "state" not in st.session_state:
-    st.session_state.state = load_state()
 if "theme_cfg" not in st.session_state:
     st.session_state.theme_cfg = load_theme_config()
 if "current_page" not in st.session_state:
@@ -34,7 +33,9 @@ if "current_page" not in st.session_state:
 if "segnapunti_open" not in st.session_state:
     st.session_state.segnapunti_open = False
 
-state = st.session_state.state
+# Stato unico del processo, condiviso da tutte le sessioni (una per campo/postazione)
+state = get_stato()
+indirizzo_pubblico = avvia_server()      # tabellone per il pubblico, una volta per processo
 theme_cfg = st.session_state.theme_cfg
 
 # ─── CSS TEMA ─────────────────────────────────────────────────────────────────
@@ -129,9 +130,9 @@ with st.sidebar:
                 """, unsafe_allow_html=True)
             else:
                 if st.button(label, key=f"nav_{k}", use_container_width=True):
-                    state["fase"] = k
+                    with modifica():
+                        state["fase"] = k
                     st.session_state.current_page = "torneo"
-                    save_state(state)
                     st.rerun()
     
     st.markdown("<hr style='border-color:var(--border);margin:14px 0 12px'>", unsafe_allow_html=True)
@@ -192,7 +193,7 @@ with st.sidebar:
         """, unsafe_allow_html=True)
     
     # ── SEZIONE: TOP RANKING ─────────────────────────────────────────────────
-    ranking_data = build_ranking_data(state)
+    ranking_data = top_ranking(state, 5)
     if ranking_data:
         st.markdown("""
         <div style="font-size:0.6rem;letter-spacing:3px;text-transform:uppercase;
@@ -237,13 +238,21 @@ with st.sidebar:
     col1, col2 = st.columns(2)
     with col1:
         if st.button("💾 Salva", use_container_width=True, key="btn_save"):
-            save_state(state)
+            salva(force=True)
             st.toast("✅ Salvato!", icon="💾")
     with col2:
         if st.button("⚠️ Reset", use_container_width=True, key="btn_reset_toggle"):
             st.session_state.show_reset = not st.session_state.get("show_reset", False)
             st.rerun()
     
+    if st.button("🔄 Ricalcola Classifiche", use_container_width=True, key="btn_ricalcola",
+                 help="Ricostruisce i contatori delle squadre dai risultati delle partite"):
+        from data_manager import ricalcola_classifiche
+        from stato_condiviso import modifica
+        with modifica():
+            ricalcola_classifiche(state)
+        st.toast("✅ Classifiche ricalcolate", icon="🔄")
+    
     if st.session_state.get("show_reset", False):
         st.warning("⚠️ Questa azione cancellerà il torneo corrente. Gli atleti saranno mantenuti.")
         if st.button("🔴 CONFERMA RESET", use_container_width=True, key="btn_reset_confirm"):
@@ -251,8 +260,9 @@ with st.sidebar:
             atleti_bkp = state["atleti"]
             nuovo = empty_state()
             nuovo["atleti"] = atleti_bkp
-            st.session_state.state = nuovo
-            save_state(nuovo)
+            nuovo["archivio_tornei"] = state.get("archivio_tornei", {})
+            nuovo["contatori_id"] = state.get("contatori_id", {})
+            sostituisci_stato(nuovo)
             st.session_state.show_reset = False
             st.session_state.current_page = "torneo"
             st.rerun()
@@ -262,6 +272,14 @@ with st.sidebar:
         📁 beach_volley_data.json
     </div>
     """, unsafe_allow_html=True)
+    if indirizzo_pubblico:
+        host, porta = indirizzo_pubblico
+        if host == "127.0.0.1":
+            st.caption(f"📺 Tabellone pubblico: http://127.0.0.1:{porta} (solo da questo computer; "
+                       f"per la rete locale avvia con BV_PUBBLICO_HOST=0.0.0.0)")
+        else:
+            st.caption(f"📺 Tabellone pubblico: porta {porta} di questo computer "
+                       f"(http://<indirizzo>:{porta})")
 
 
 # ─── ROUTING PRINCIPALE ──────────────────────────────────────────────────────
@@ -310,4 +328,5 @@ elif page == "theme":
     st.session_state.theme_cfg = theme_cfg
 
 # ─── AUTOSAVE SILENZIOSO ─────────────────────────────────────────────────────
-save_state(state)
+# Scrive solo se qualcosa ha chiamato segna_modificato() (in questa o in un'altra sessione)
+salva()
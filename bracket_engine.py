@@ -0,0 +1,363 @@
+"""
+bracket_engine.py — Tabellone a eliminazione (diretta o doppia) come albero di partite
+
+Il tabellone resta la lista piatta state["bracket"] (persistenza, segnapunti e
+backend SQLite non cambiano), in ordine di gioco, ma ogni partita porta i
+collegamenti dell'albero:
+
+    tabellone       "principale" | "vincenti" | "perdenti" | "finale"
+    turno           0 = primo turno del suo tabellone
+    posizione       indice della partita nel turno
+    prossima, lato  id della partita in cui avanza il vincitore e slot (1/2)
+    perdente_verso, lato_perdente   dove va lo sconfitto (finalina, tabellone perdenti)
+
+Gli slot ancora da definire hanno sq1/sq2 = None. I bye non generano partite
+fittizie: la squadra occupa direttamente lo slot in cui sarebbe arrivata.
+"""
+from data_manager import (
+    new_partita, get_partita_bracket, annulla_risultato, segna_partita_modificata
+)
+
+NOMI_TURNO = {
+    0: "🏆 FINALE",
+    1: "🥇 SEMIFINALI",
+    2: "⚡ QUARTI DI FINALE",
+    3: "🎯 OTTAVI DI FINALE",
+    4: "🎯 SEDICESIMI DI FINALE",
+}
+NOME_TERZO_POSTO = "🥉 FINALE 3° POSTO"
+NOME_FINALISSIMA = "🏆 FINALISSIMA"
+NOME_SPAREGGIO = "🔁 FINALISSIMA — SPAREGGIO"
+
+
+def ordine_teste_di_serie(dimensione):
+    """Teste di serie (1-based) per posizione nel primo turno: 1 e 2 si incontrano solo in finale."""
+    ordine = [1]
+    while len(ordine) < dimensione:
+        somma = len(ordine) * 2 + 1
+        ordine = [x for s in ordine for x in (s, somma - s)]
+    return ordine
+
+
+# ─── COSTRUZIONE ─────────────────────────────────────────────────────────────
+# Lo schema è una lista di nodi in ordine di gioco; ogni lato di un nodo ha
+# come sorgente ("squadra", sid), ("vincente", chiave), ("perdente", chiave)
+# oppure None (bye). I nodi con un lato vuoto non diventano partite: il loro
+# vincente è l'altro lato e il loro perdente è un bye.
+
+def _nodo(schema, tabellone, turno, posizione, lati, **extra):
+    schema.append({"chiave": (tabellone, turno, posizione), "tabellone": tabellone,
+                   "turno": turno, "posizione": posizione, "lati": lati, **extra})
+    return (tabellone, turno, posizione)
+
+
+def _schema_albero(schema, qualificate, tabellone):
+    """Eliminazione diretta sulle qualificate; ritorna la chiave della finale."""
+    n = len(qualificate)
+    dimensione = 2
+    while dimensione < n:
+        dimensione *= 2
+    slot = [("squadra", qualificate[s - 1]) if s <= n else None
+            for s in ordine_teste_di_serie(dimensione)]
+    n_turni = dimensione.bit_length() - 1
+    for t in range(n_turni):
+        for i in range(dimensione >> (t + 1)):
+            if t == 0:
+                lati = (slot[2 * i], slot[2 * i + 1])
+            else:
+                lati = (("vincente", (tabellone, t - 1, 2 * i)),
+                        ("vincente", (tabellone, t - 1, 2 * i + 1)))
+            _nodo(schema, tabellone, t, i, lati)
+    return (tabellone, n_turni - 1, 0)
+
+
+def _costruisci(state, schema):
+    partite, reali, esiti = [], {}, {}
+
+    def risolvi(sorgente):
+        while sorgente and sorgente[0] != "squadra" and sorgente[1] in esiti:
+            vincente, perdente_ = esiti[sorgente[1]]
+            sorgente = vincente if sorgente[0] == "vincente" else perdente_
+        return sorgente
+
+    for nodo in schema:
+        a, b = (risolvi(s) for s in nodo["lati"])
+        if a is None or b is None:
+            esiti[nodo["chiave"]] = (b if a is None else a, None)
+            continue
+        p = new_partita(state, None, None, "eliminazione")
+        p.update({
+            "tabellone": nodo["tabellone"],
+            "turno": nodo["turno"],
+            "posizione": nodo["posizione"],
+            "prossima": None,
+            "lato": None,
+            "perdente_verso": None,
+            "lato_perdente": None,
+            "terzo_posto": nodo.get("terzo_posto", False),
+        })
+        for lato, sorgente in ((1, a), (2, b)):
+            tipo, rif = sorgente
+            if tipo == "squadra":
+                p[f"sq{lato}"] = rif
+            elif tipo == "vincente":
+                reali[rif]["prossima"], reali[rif]["lato"] = p["id"], lato
+            else:
+                reali[rif]["perdente_verso"], reali[rif]["lato_perdente"] = p["id"], lato
+        reali[nodo["chiave"]] = p
+        partite.append(p)
+    return partite
+
+
+def genera_tabellone(state, qualificate, terzo_posto=True):
+    """Eliminazione diretta per le qualificate, in ordine di testa di serie.
+
+    Funziona con qualsiasi numero di squadre: il tabellone è portato alla
+    potenza di 2 successiva e i bye vanno alle prime teste di serie.
+    """
+    if len(qualificate) < 2:
+        return []
+    schema = []
+    tab, ultimo, _ = _schema_albero(schema, qualificate, "principale")
+    finale = schema.pop()
+    if terzo_posto and ultimo >= 1:
+        # se una semifinale è un bye la finalina si elimina da sola
+        _nodo(schema, tab, ultimo, 1,
+              (("perdente", (tab, ultimo - 1, 0)), ("perdente", (tab, ultimo - 1, 1))),
+              terzo_posto=True)
+    schema.append(finale)
+    return _costruisci(state, schema)
+
+
+def genera_doppia_eliminazione(state, squadre, spareggio=True):
+    """Doppia eliminazione: tabellone vincenti, tabellone perdenti e finalissima.
+
+    Chi perde nei vincenti scende nei perdenti; chi perde nei perdenti è fuori.
+    Con spareggio=True, se la finalissima la vince chi arriva dai perdenti
+    (alla prima sconfitta) si gioca una seconda finale.
+    """
+    if len(squadre) < 2:
+        return []
+    schema = []
+    finale_v = _schema_albero(schema, squadre, "vincenti")
+    k = finale_v[1] + 1                     # turni del tabellone vincenti
+
+    if k == 1:
+        campione_p = ("perdente", finale_v)
+    else:
+        m = 1 << (k - 2)                    # partite del primo turno perdenti
+        for i in range(m):
+            _nodo(schema, "perdenti", 0, i,
+                  (("perdente", ("vincenti", 0, 2 * i)), ("perdente", ("vincenti", 0, 2 * i + 1))))
+        turno = 0
+        for j in range(1, k):
+            # turno "di innesto": arrivano gli sconfitti del turno j dei vincenti,
+            # in ordine inverso per evitare rivincite immediate
+            m = 1 << (k - 1 - j)
+            for i in range(m):
+                w = m - 1 - i if j % 2 else i
+                _nodo(schema, "perdenti", turno + 1, i,
+                      (("vincente", ("perdenti", turno, i)), ("perdente", ("vincenti", j, w))))
+            turno += 1
+            if j < k - 1:
+                for i in range(m // 2):
+                    _nodo(schema, "perdenti", turno + 1, i,
+                          (("vincente", ("perdenti", turno, 2 * i)),
+                           ("vincente", ("perdenti", turno, 2 * i + 1))))
+                turno += 1
+        campione_p = ("vincente", ("perdenti", turno, 0))
+
+    _nodo(schema, "finale", 0, 0, (("vincente", finale_v), campione_p))
+    partite = _costruisci(state, schema)
+
+    if spareggio:
+        finalissima = partite[-1]
+        ripetizione = new_partita(state, None, None, "eliminazione")
+        ripetizione.update({
+            "tabellone": "finale", "turno": 1, "posizione": 0,
+            "prossima": None, "lato": None, "perdente_verso": None, "lato_perdente": None,
+            "terzo_posto": False, "non_necessaria": False,
+        })
+        finalissima["spareggio_verso"] = ripetizione["id"]
+        partite.append(ripetizione)
+    return partite
+
+
+# ─── AVANZAMENTO ─────────────────────────────────────────────────────────────
+
+def perdente(partita):
+    if not partita["vincitore"]:
+        return None
+    return partita["sq2"] if partita["vincitore"] == partita["sq1"] else partita["sq1"]
+
+
+def avanza_vincitore(state, partita):
+    """Porta vincitore e sconfitto negli slot collegati: O(1).
+
+    Ogni partita toccata cambia revisione, come in ritira_vincitore: chi l'ha
+    letta prima che lo slot si riempisse non può confermarla senza rileggerla.
+    """
+    destinazioni = [
+        (partita.get("prossima"), partita.get("lato"), partita["vincitore"]),
+        (partita.get("perdente_verso"), partita.get("lato_perdente"), perdente(partita)),
+    ]
+    if partita.get("spareggio_verso"):
+        spareggio = get_partita_bracket(state, partita["spareggio_verso"])
+        # sq2 arriva dai perdenti: se vince, entrambe hanno una sconfitta
+        spareggio["non_necessaria"] = partita["vincitore"] != partita["sq2"]
+        segna_partita_modificata(spareggio)
+        if not spareggio["non_necessaria"]:
+            destinazioni += [(spareggio["id"], 1, partita["sq1"]), (spareggio["id"], 2, partita["sq2"])]
+    for pid, lato, squadra in destinazioni:
+        if pid:
+            dest = get_partita_bracket(state, pid)
+            dest[f"sq{lato}"] = squadra
+            segna_partita_modificata(dest)
+            _indice_prossime(state)[squadra] = dest
+    for sid in (partita["sq1"], partita["sq2"]):
+        prossime = _indice_prossime(state)
+        if prossime.get(sid) is partita:
+            del prossime[sid]
+
+
+def ritira_vincitore(state, partita):
+    """Inverso di avanza_vincitore: svuota gli slot riempiti dalla partita.
+
+    Le partite a valle già confermate tornano da giocare a cascata.
+    """
+    destinazioni = [(partita.get("prossima"), partita.get("lato")),
+                    (partita.get("perdente_verso"), partita.get("lato_perdente"))]
+    spareggio = None
+    if partita.get("spareggio_verso"):
+        spareggio = get_partita_bracket(state, partita["spareggio_verso"])
+        destinazioni += [(spareggio["id"], 1), (spareggio["id"], 2)]
+    prossime = _indice_prossime(state)
+    for pid, lato in destinazioni:
+        if not pid:
+            continue
+        dest = get_partita_bracket(state, pid)
+        annulla_risultato(state, dest)
+        squadra = dest[f"sq{lato}"]
+        dest[f"sq{lato}"] = None
+        segna_partita_modificata(dest)
+        if squadra is not None and prossime.get(squadra) is dest:
+            del prossime[squadra]
+    if spareggio:
+        spareggio["non_necessaria"] = False
+    for sid in (partita["sq1"], partita["sq2"]):
+        if sid is not None:
+            prossime[sid] = partita
+
+
+def giocabile(partita):
+    """Entrambe le squadre sono note e il risultato non è ancora confermato."""
+    return partita["sq1"] is not None and partita["sq2"] is not None and not partita["confermata"]
+
+
+def tabellone_concluso(bracket):
+    return bool(bracket) and all(p["confermata"] or p.get("non_necessaria") for p in bracket)
+
+
+def _indice_prossime(state):
+    """{squadra_id: partita non confermata in cui è già collocata}, runtime."""
+    bracket = state["bracket"]
+    idx = state.get("_idx_prossime")
+    if idx is None or idx[0] is not bracket:
+        mappa = {}
+        for p in bracket:
+            if not p["confermata"] and not p.get("non_necessaria"):
+                for sid in (p["sq1"], p["sq2"]):
+                    if sid is not None:
+                        mappa.setdefault(sid, p)
+        idx = (bracket, mappa)
+        state["_idx_prossime"] = idx
+    return idx[1]
+
+
+def ricostruisci_indice_prossime(state):
+    state.pop("_idx_prossime", None)
+    _indice_prossime(state)
+
+
+def prossima_partita(state, sid):
+    """Prossima partita della squadra nel tabellone (None se eliminata o campione)."""
+    p = _indice_prossime(state).get(sid)
+    if p is not None and (p["confermata"] or sid not in (p["sq1"], p["sq2"])):
+        # risultato inserito senza avanza_vincitore: si ricostruisce
+        state.pop("_idx_prossime", None)
+        p = _indice_prossime(state).get(sid)
+    return p
+
+
+# ─── LETTURA ─────────────────────────────────────────────────────────────────
+
+def finale_tabellone(bracket):
+    """La partita che assegna il titolo (lo spareggio, se si gioca)."""
+    for p in reversed(bracket):
+        if p.get("prossima") is None and not p.get("terzo_posto") and not p.get("non_necessaria"):
+            return p
+    return None
+
+
+def _nome_turno(p, ultimo, numero):
+    tabellone = p.get("tabellone", "principale")
+    if p.get("terzo_posto"):
+        return NOME_TERZO_POSTO
+    if tabellone == "finale":
+        return NOME_SPAREGGIO if p["turno"] else NOME_FINALISSIMA
+    if tabellone == "vincenti":
+        return f"🏆 Tabellone Vincenti — Turno {numero}"
+    if tabellone == "perdenti":
+        return f"🔻 Tabellone Perdenti — Turno {numero}"
+    return NOMI_TURNO.get(ultimo - p["turno"], f"⚡ {numero}° TURNO")
+
+
+def turni_tabellone(bracket):
+    """[(nome turno, partite)] nell'ordine di gioco."""
+    if bracket and "turno" not in bracket[0]:
+        return [("⚡ Fase Eliminazione", bracket)]     # tabellone senza albero
+    ultimo = max((p["turno"] for p in bracket if p.get("tabellone", "principale") == "principale"),
+                 default=0)
+    # turni interamente di bye non hanno partite: la numerazione mostrata li salta
+    numeri = {}
+    for p in bracket:
+        chiave = (p.get("tabellone", "principale"), p["turno"])
+        numeri.setdefault(chiave, sum(1 for t, _ in numeri if t == chiave[0]) + 1)
+    gruppi = {}
+    for p in bracket:
+        if p.get("non_necessaria"):
+            continue
+        numero = numeri[(p.get("tabellone", "principale"), p["turno"])]
+        gruppi.setdefault(_nome_turno(p, ultimo, numero), []).append(p)
+    return list(gruppi.items())
+
+
+def podio_da_tabellone(bracket):
+    """[(posizione, squadra_id)] dalle partite finali; None se il titolo non è assegnato.
+
+    Doppia eliminazione: terza è la sconfitta della finale perdenti. Eliminazione
+    diretta: vincente della finalina o, se manca, i perdenti delle semifinali
+    a pari merito. Con meno di tre squadre restano solo le posizioni che
+    esistono: nessuna squadra compare due volte, nessuno slot vuoto.
+    """
+    finale = finale_tabellone(bracket)
+    if not finale or not finale["confermata"]:
+        return None
+    podio = [(1, finale["vincitore"]), (2, perdente(finale))]
+    perdenti = [p for p in bracket if p.get("tabellone") == "perdenti"]
+    finalina = next((p for p in bracket if p.get("terzo_posto")), None)
+    if perdenti:
+        podio.append((3, perdente(perdenti[-1])))
+    elif finalina:
+        if finalina["confermata"]:
+            podio.append((3, finalina["vincitore"]))
+    else:
+        podio += [(3, perdente(p)) for p in bracket
+                  if p.get("prossima") == finale["id"] and p["confermata"]
+                  and p.get("tabellone", "principale") == "principale"]
+    assegnate, visti = [], set()
+    for pos, sid in podio:
+        if sid is not None and sid not in visti:
+            assegnate.append((pos, sid))
+            visti.add(sid)
+    return assegnate
@@ -0,0 +1,183 @@
+"""
+calendario.py — Assegnazione di campi e orari alle partite (gironi e tabellone)
+
+Il tempo è diviso in slot di durata fissa; in ogni slot si gioca al massimo
+una partita per campo. Vincoli:
+  - un atleta non gioca due partite nello stesso slot (vale anche per chi è
+    iscritto in più squadre/categorie) e riposa `riposo` slot tra una partita
+    e l'altra;
+  - una partita del tabellone si gioca dopo le partite che la alimentano
+    (vincente/perdente), con lo stesso riposo.
+
+Euristica: assegnazione greedy slot per slot seguendo le giornate dei
+gironi e, a parità, le squadre con più partite ancora da piazzare, poi
+ricerca locale che anticipa le partite finché trova slot liberi
+compatibili. Le partite confermate con uno slot già assegnato restano
+ferme. Il risultato va in partita["slot"], partita["campo"] e
+partita["orario"].
+"""
+import time
+from datetime import datetime, timedelta
+
+from data_manager import get_squadra_by_id
+
+TEMPO_RICERCA_S = 0.3
+
+
+def _atleti(state, partita):
+    atleti = set()
+    for k in ("sq1", "sq2"):
+        sq = get_squadra_by_id(state, partita[k]) if partita[k] else None
+        if sq:
+            atleti.update(sq["atleti"])
+    return atleti
+
+
+def _collegamenti(bracket):
+    """{id: partite che la alimentano}, {id: partite che alimenta}."""
+    prima = {p["id"]: [] for p in bracket}
+    dopo = {p["id"]: [] for p in bracket}
+    for p in bracket:
+        for chiave in ("prossima", "perdente_verso", "spareggio_verso"):
+            dest = p.get(chiave)
+            if dest in prima:
+                prima[dest].append(p["id"])
+                dopo[p["id"]].append(dest)
+    return prima, dopo
+
+
+def orario_slot(inizio, durata_slot, slot):
+    t = datetime.strptime(inizio, "%H:%M") + timedelta(minutes=durata_slot * slot)
+    return t.strftime("%H:%M")
+
+
+def pianifica(state, campi, durata_slot, inizio="09:00", riposo=1, da_slot=0,
+              tempo_max=TEMPO_RICERCA_S):
+    """Pianifica tutte le partite non confermate; ritorna il numero di slot usati."""
+    partite = [p for g in state["gironi"] for p in g["partite"]] + list(state["bracket"])
+    per_id = {p["id"]: p for p in partite}
+    prima, dopo = _collegamenti(state["bracket"])
+    atleti = {p["id"]: _atleti(state, p) for p in partite}
+
+    slot = {}
+    occupati = {}        # slot -> n partite
+    impegni = {}         # atleta -> {slot}
+    for p in partite:
+        if p["confermata"] and p.get("slot") is not None:
+            slot[p["id"]] = p["slot"]
+    confermate = {p["id"] for p in partite if p["confermata"]}
+    da_piazzare = [p["id"] for p in partite if not p["confermata"]]
+
+    def occupa(pid, t, segno=1):
+        occupati[t] = occupati.get(t, 0) + segno
+        for a in atleti[pid]:
+            s = impegni.setdefault(a, set())
+            if segno > 0:
+                s.add(t)
+            else:
+                s.discard(t)
+        if segno > 0:
+            slot[pid] = t
+        else:
+            del slot[pid]
+
+    for pid, t in list(slot.items()):
+        del slot[pid]
+        occupa(pid, t)
+
+    def fattibile(pid, t):
+        if t < da_slot or occupati.get(t, 0) >= campi:
+            return False
+        for a in atleti[pid]:
+            s = impegni.get(a, ())
+            if any(t + d in s for d in range(-riposo, riposo + 1)):
+                return False
+        for f in prima.get(pid, ()):
+            if f in slot:
+                if slot[f] + riposo + 1 > t:
+                    return False
+            elif f not in confermate:
+                return False
+        return all(d not in slot or t + riposo + 1 <= slot[d] for d in dopo.get(pid, ()))
+
+    # ── greedy: slot per slot, prima le squadre con più partite in sospeso ──
+    residue = {}
+    for pid in da_piazzare:
+        for k in ("sq1", "sq2"):
+            if per_id[pid][k]:
+                residue[per_id[pid][k]] = residue.get(per_id[pid][k], 0) + 1
+    ordine = {pid: i for i, pid in enumerate(da_piazzare)}
+
+    def priorita(pid):
+        # prima le giornate dei gironi in ordine, poi chi ha più partite in sospeso
+        p = per_id[pid]
+        carico = residue.get(p["sq1"], 0) + residue.get(p["sq2"], 0)
+        return (p.get("giornata") or 0, -carico, ordine[pid])
+
+    restanti = set(da_piazzare)
+    t = da_slot
+    limite = da_slot + (len(partite) + 1) * (riposo + 2) + max(slot.values(), default=0)
+    while restanti and t <= limite:
+        for pid in sorted(restanti, key=priorita):
+            if occupati.get(t, 0) >= campi:
+                break
+            if fattibile(pid, t):
+                occupa(pid, t)
+                restanti.discard(pid)
+                for k in ("sq1", "sq2"):
+                    if per_id[pid][k]:
+                        residue[per_id[pid][k]] -= 1
+        t += 1
+
+    # ── ricerca locale: anticipa le partite più tardive finché si può ──
+    scadenza = time.perf_counter() + tempo_max
+    migliorato = True
+    while migliorato and time.perf_counter() < scadenza:
+        migliorato = False
+        for pid in sorted(da_piazzare, key=lambda x: -slot.get(x, -1)):
+            if pid not in slot:
+                continue
+            attuale = slot[pid]
+            occupa(pid, attuale, -1)
+            nuovo = next((s for s in range(da_slot, attuale) if fattibile(pid, s)), attuale)
+            occupa(pid, nuovo)
+            migliorato |= nuovo < attuale
+
+    # ── campi: per slot, nell'ordine dei campi liberi ──
+    liberi = {}
+    for pid, t in slot.items():
+        p = per_id[pid]
+        if p["confermata"] and p.get("campo"):
+            liberi.setdefault(t, set(range(1, campi + 1))).discard(p["campo"])
+    for pid in sorted(slot, key=lambda x: (slot[x], ordine.get(x, -1))):
+        p = per_id[pid]
+        if pid not in ordine:
+            continue
+        disponibili = liberi.setdefault(slot[pid], set(range(1, campi + 1)))
+        p["slot"] = slot[pid]
+        p["campo"] = min(disponibili) if disponibili else None
+        disponibili.discard(p["campo"])
+        p["orario"] = orario_slot(inizio, durata_slot, slot[pid])
+    for pid in restanti:
+        per_id[pid].update({"slot": None, "campo": None, "orario": None})
+    return max(slot.values(), default=-1) + 1
+
+
+def pianifica_torneo(state):
+    """Pianifica con le impostazioni del torneo, a partire dal primo slot non ancora giocato."""
+    torneo = state["torneo"]
+    giocati = [p["slot"] for g in state["gironi"] for p in g["partite"]
+               if p["confermata"] and p.get("slot") is not None]
+    giocati += [p["slot"] for p in state["bracket"] if p["confermata"] and p.get("slot") is not None]
+    return pianifica(state, torneo["campi"], torneo["durata_slot"], torneo["ora_inizio"],
+                     riposo=torneo["riposo_slot"], da_slot=max(giocati, default=-1) + 1)
+
+
+def tabella_orari(state):
+    """{slot: {campo: partita}} per le partite pianificate."""
+    tabella = {}
+    partite = [p for g in state["gironi"] for p in g["partite"]] + list(state["bracket"])
+    for p in partite:
+        if p.get("slot") is not None and p.get("campo"):
+            tabella.setdefault(p["slot"], {})[p["campo"]] = p
+    return dict(sorted(tabella.items()))
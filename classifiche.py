@@ -0,0 +1,163 @@
+"""
+classifiche.py — Classifiche dei gironi e teste di serie per il tabellone
+
+Le classifiche si calcolano dalle partite confermate del girone in un solo
+passaggio, senza dipendere dai contatori delle squadre. Criteri in ordine:
+punti, vittorie, quoziente set, quoziente punti, scontro diretto tra le
+squadre ancora a pari merito; infine l'ordine del sorteggio del girone.
+"""
+import math
+from itertools import groupby
+
+from bracket_engine import ordine_teste_di_serie
+
+PUNTI_VITTORIA = 3
+PUNTI_SCONFITTA = 1      # come contributo_partita()
+
+
+def _quoziente(fatti, subiti):
+    if subiti:
+        return fatti / subiti
+    return math.inf if fatti else 0.0
+
+
+def _chiave_girone(r):
+    return (-r["punti"], -r["vittorie"], -r["quoziente_set"], -r["quoziente_punti"])
+
+
+def classifica_girone(girone):
+    """Righe {id, posizione, giocate, punti, vittorie, ...} in ordine di classifica."""
+    righe = {
+        sid: {"id": sid, "giocate": 0, "punti": 0, "vittorie": 0, "sconfitte": 0,
+              "set_vinti": 0, "set_persi": 0, "punti_fatti": 0, "punti_subiti": 0}
+        for sid in girone["squadre"]
+    }
+    scontri = {}     # {frozenset(coppia): vincitore}
+    for p in girone["partite"]:
+        if not p["confermata"] or p["sq1"] not in righe or p["sq2"] not in righe:
+            continue
+        pf1 = sum(x[0] for x in p["punteggi"])
+        pf2 = sum(x[1] for x in p["punteggi"])
+        for sid, sv, sp, pf, ps in ((p["sq1"], p["set_sq1"], p["set_sq2"], pf1, pf2),
+                                    (p["sq2"], p["set_sq2"], p["set_sq1"], pf2, pf1)):
+            r = righe[sid]
+            vinta = p["vincitore"] == sid
+            r["giocate"] += 1
+            r["vittorie"] += vinta
+            r["sconfitte"] += not vinta
+            r["punti"] += PUNTI_VITTORIA if vinta else PUNTI_SCONFITTA
+            r["set_vinti"] += sv; r["set_persi"] += sp
+            r["punti_fatti"] += pf; r["punti_subiti"] += ps
+        scontri[frozenset((p["sq1"], p["sq2"]))] = p["vincitore"]
+
+    for r in righe.values():
+        r["quoziente_set"] = _quoziente(r["set_vinti"], r["set_persi"])
+        r["quoziente_punti"] = _quoziente(r["punti_fatti"], r["punti_subiti"])
+
+    classifica = []
+    # sorted è stabile: a parità completa resta l'ordine di girone["squadre"]
+    for _, pari in groupby(sorted(righe.values(), key=_chiave_girone), key=_chiave_girone):
+        pari = list(pari)
+        if len(pari) > 1:
+            ids = [r["id"] for r in pari]
+            vinti = {a: sum(scontri.get(frozenset((a, b))) == a for b in ids if b != a) for a in ids}
+            pari.sort(key=lambda r: -vinti[r["id"]])
+        classifica.extend(pari)
+    for pos, r in enumerate(classifica, 1):
+        r["posizione"] = pos
+    return classifica
+
+
+# ─── TESTE DI SERIE ──────────────────────────────────────────────────────────
+
+def _chiave_fascia(r):
+    # gironi di dimensioni diverse: si confrontano le medie per partita
+    g = max(r["giocate"], 1)
+    return (-r["punti"] / g, -r["vittorie"] / g, -r["quoziente_set"], -r["quoziente_punti"])
+
+
+def ordine_tabellone(fasce):
+    """Squadre in ordine di testa di serie, dalle fasce [(girone, squadra), ...].
+
+    Ogni fascia (prime dei gironi, seconde, ...) occupa il blocco successivo di
+    teste di serie; dentro la fascia ogni squadra, in ordine di merito, prende
+    il numero che rimanda il più possibile l'incontro con una squadra del suo
+    girone (a parità, il numero più alto in classifica).
+    """
+    n = sum(len(f) for f in fasce)
+    dimensione = 2
+    while dimensione < n:
+        dimensione *= 2
+    posizione = {seed: pos for pos, seed in enumerate(ordine_teste_di_serie(dimensione))}
+    occupate = {}        # girone -> posizioni già assegnate nel primo turno
+    ordine = [None] * n
+    base = 0
+    for fascia in fasce:
+        liberi = list(range(base + 1, base + len(fascia) + 1))
+        for girone, squadra in fascia:
+            def turno_incontro(seed):
+                # due posizioni si incontrano al turno dato dal bit più alto in cui differiscono
+                pos = posizione[seed]
+                return min(((pos ^ altra).bit_length() for altra in occupate.get(girone, ())),
+                           default=dimensione)
+            scelto = max(liberi, key=lambda s: (turno_incontro(s), -s))
+            liberi.remove(scelto)
+            ordine[scelto - 1] = squadra
+            occupate.setdefault(girone, []).append(posizione[scelto])
+        base += len(fascia)
+    return ordine
+
+
+def fasce_qualificate(gironi, qualificate_per_girone=2, ripescate=0):
+    """Qualificate per fascia: [[(girone, squadra), ...], ...] in ordine di merito.
+
+    Le ripescate sono le migliori `ripescate` classificate alla posizione
+    successiva all'ultima qualificata e formano l'ultima fascia.
+    """
+    return _fasce([classifica_girone(g) for g in gironi], qualificate_per_girone, ripescate)
+
+
+def _fasce(classifiche, qualificate_per_girone, ripescate):
+    fasce = []
+    for r in range(qualificate_per_girone + (1 if ripescate else 0)):
+        fascia = sorted(
+            ((gi, c[r]) for gi, c in enumerate(classifiche) if len(c) > r),
+            key=lambda x: (_chiave_fascia(x[1]), x[0]),
+        )
+        if r == qualificate_per_girone:
+            fascia = fascia[:ripescate]
+        fasce.append([(gi, riga["id"]) for gi, riga in fascia])
+    return fasce
+
+
+def classifiche_gironi(gironi, qualificate_per_girone=2, ripescate=0):
+    """[(girone, righe)] come classifica_girone(), con riga["qualifica"] =
+    "diretta", "ripescata" o None."""
+    classifiche = [classifica_girone(g) for g in gironi]
+    ripescate_ids = set()
+    if ripescate:
+        ripescate_ids = {sid for _, sid in _fasce(classifiche, qualificate_per_girone,
+                                                  ripescate)[qualificate_per_girone]}
+    for righe in classifiche:
+        for r in righe:
+            r["qualifica"] = ("diretta" if r["posizione"] <= qualificate_per_girone
+                              else "ripescata" if r["id"] in ripescate_ids else None)
+    return list(zip(gironi, classifiche))
+
+
+def teste_di_serie_da_gironi(gironi, qualificate_per_girone=2, ripescate=0):
+    """Qualificate in ordine di testa di serie, pronte per genera_tabellone()."""
+    return ordine_tabellone(fasce_qualificate(gironi, qualificate_per_girone, ripescate))
+
+
+def accoppiamenti_proiettati(gironi, qualificate_per_girone=2, ripescate=0):
+    """Primo turno del tabellone con le classifiche attuali: [(sq1, sq2)], None = bye."""
+    ordine = teste_di_serie_da_gironi(gironi, qualificate_per_girone, ripescate)
+    n = len(ordine)
+    if n < 2:
+        return []
+    dimensione = 2
+    while dimensione < n:
+        dimensione *= 2
+    slot = [ordine[s - 1] if s <= n else None for s in ordine_teste_di_serie(dimensione)]
+    return [(slot[i], slot[i + 1]) for i in range(0, dimensione, 2)]
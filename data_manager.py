@@ -1,11 +1,25 @@
 """
 data_manager.py — Gestione persistenza JSON e modelli dati
 """
-import json, os, random
+import json, math, os, random, shutil, tempfile, time
 from datetime import datetime
-from pathlib import Path
+from functools import lru_cache
 
 DATA_FILE = "beach_volley_data.json"
+INCASSI_FILE = "beach_volley_incassi.json"
+
+# "json" (file unico, installazioni piccole) | "sqlite" (vedi storage_sqlite.py)
+STORAGE_BACKEND = os.environ.get("BV_STORAGE", "json").lower()
+
+# Secondi minimi tra due scritture su disco (0 = al massimo una per interazione)
+AUTOSAVE_DEBOUNCE_S = float(os.environ.get("BV_AUTOSAVE_DEBOUNCE", "0") or 0)
+# Copie precedenti mantenute accanto al file (<file>.1 = la più recente)
+BACKUP_GENERAZIONI = 3
+# Secondi minimi tra due rotazioni dei backup dello stesso file: con un
+# salvataggio per interazione le generazioni coprirebbero pochi secondi
+BACKUP_INTERVALLO_S = 300
+
+_ultima_rotazione = {}      # {percorso assoluto: time.monotonic() dell'ultima rotazione}
 
 # ─── STRUTTURA DATI DEFAULT ──────────────────────────────────────────────────
 
@@ -18,38 +32,289 @@ def empty_state():
             "formato_set": "Set Unico",              # o "Best of 3"
             "punteggio_max": 21,
             "data": str(datetime.today().date()),
+            "seed": nuovo_seed(),                    # vedi rng_torneo()
+            "campi": 2,                              # calendario.py
+            "durata_slot": 30,                       # minuti
+            "ora_inizio": "09:00",
+            "riposo_slot": 1,                        # slot di pausa tra due partite
+            "sorteggio_gironi": "Teste di serie",    # o "Casuale"
+            "squadre_per_girone": 4,                 # piano_gironi.py
+            "girone_min": 3,
+            "girone_max": 5,
+            "qualificate_girone": 2,
+            "ripescate": 0,                          # migliori (qualificate+1)ª classificate
         },
         "atleti": [],             # lista globale atleti: {id, nome, stats}
         "squadre": [],            # {id, nome, atleti:[id,id]}
         "gironi": [],             # [{nome, squadre:[id], partite:[...]}]
         "bracket": [],            # partite eliminazione diretta
         "ranking_globale": [],    # storico tornei per atleta
+        "archivio_tornei": {},    # {torneo_id: riepilogo torneo concluso}
+        "contatori_id": {},       # {prefisso: ultimo numero assegnato}, vedi nuovo_id()
         "vincitore": None,
         "simulazione_al_ranking": True,
+        "revisione": 0,           # incrementata da segna_modificato()
+        "ranking_versione": 0,    # incrementata quando cambiano le stats atleti
     }
 
+# ─── RNG RIPRODUCIBILE ───────────────────────────────────────────────────────
+
+def nuovo_seed():
+    return random.SystemRandom().randrange(2**32)
+
+def rng_torneo(state, *contesto):
+    """random.Random derivato dal seed del torneo e da un contesto (es. "gironi", id partita).
+
+    Stesso seed + stesso contesto = stessa sequenza, indipendentemente dall'ordine
+    delle chiamate, dai riavvii e dal thread/processo che la usa.
+    """
+    torneo = state["torneo"]
+    if torneo.get("seed") is None:
+        torneo["seed"] = nuovo_seed()
+    return random.Random(":".join(map(str, (torneo["seed"], *contesto))))
+
+# ─── SCRITTURA ATOMICA ───────────────────────────────────────────────────────
+
+def _fsync_dir(cartella):
+    """Rende persistente la rename (no-op dove le directory non si aprono)."""
+    try:
+        fd = os.open(cartella, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _ruota_backup(path, generazioni):
+    """<file>.N-1 → <file>.N ... <file> → <file>.1, senza mai togliere <file>.
+
+    Al più una rotazione ogni BACKUP_INTERVALLO_S per file (la prima del
+    processo sempre): nel frattempo le scritture sostituiscono solo <file>.
+    """
+    if generazioni <= 0 or not os.path.exists(path):
+        return
+    chiave, adesso = os.path.abspath(path), time.monotonic()
+    ultima = _ultima_rotazione.get(chiave)
+    if ultima is not None and adesso - ultima < BACKUP_INTERVALLO_S:
+        return
+    _ultima_rotazione[chiave] = adesso
+    for i in range(generazioni - 1, 0, -1):
+        src = f"{path}.{i}"
+        if os.path.exists(src):
+            os.replace(src, f"{path}.{i+1}")
+    dst = f"{path}.1"
+    try:
+        os.link(path, dst)          # hard link: nessuna copia dei dati
+    except OSError:
+        shutil.copy2(path, dst)
+
+def scrivi_file_atomico(path, testo, generazioni=BACKUP_GENERAZIONI):
+    """Scrive su file temporaneo nella stessa cartella, fsync e rename atomica.
+
+    Un crash a metà scrittura lascia intatto il file precedente.
+    """
+    cartella = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=cartella)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(testo)
+            f.flush()
+            os.fsync(f.fileno())
+        _ruota_backup(path, generazioni)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(cartella)
+
+def leggi_json_con_recupero(path, generazioni=BACKUP_GENERAZIONI):
+    """Legge il JSON; se illeggibile ripiega sulla generazione valida più recente.
+
+    Ritorna None se non esiste nessun file leggibile.
+    """
+    candidati = [path] + [f"{path}.{i}" for i in range(1, generazioni + 1)]
+    for c in candidati:
+        if not os.path.exists(c):
+            continue
+        try:
+            with open(c, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return None
+
 # ─── LOAD / SAVE ─────────────────────────────────────────────────────────────
 
+def storage_backend():
+    """Backend SQLite condiviso se BV_STORAGE=sqlite, altrimenti None (file JSON)."""
+    if STORAGE_BACKEND != "sqlite":
+        return None
+    from storage_sqlite import get_backend
+    return get_backend()
+
 def load_state():
-    if Path(DATA_FILE).exists():
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    backend = storage_backend()
+    data = backend.carica() if backend else leggi_json_con_recupero(DATA_FILE)
+    if data is not None:
         # merge keys mancanti con default
         base = empty_state()
         for k, v in base.items():
             data.setdefault(k, v)
+        for k, v in base["torneo"].items():
+            data["torneo"].setdefault(k, v)
+        # lo stato appena letto coincide con il file: niente da riscrivere
+        data["_rev_salvata"] = data["revisione"]
+        migra_storico_posizioni(data)
+        ricostruisci_indici(data)
+        migra_contributi_classifica(data)
         return data
     return empty_state()
 
-def save_state(state):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+def segna_modificato(state):
+    """Segnala che lo stato è cambiato: verrà scritto al prossimo save_state()."""
+    state["revisione"] = state.get("revisione", 0) + 1
+
+def segna_partita_modificata(partita):
+    """Nuova revisione della partita: risultato o squadre cambiati (concorrenza ottimistica)."""
+    partita["rev"] = partita.get("rev", 0) + 1
+
+def stato_modificato(state):
+    return state.get("_rev_salvata") != state.get("revisione", 0)
+
+def _serializzabile(state):
+    """Copia superficiale senza le chiavi runtime (prefisso '_'), non persistite."""
+    # list(): copia atomica, un'altra sessione può aggiungere chiavi runtime intanto
+    return {k: v for k, v in list(state.items()) if not k.startswith("_")}
+
+def save_state(state, force=False):
+    """Scrive lo stato su disco solo se modificato dall'ultimo salvataggio.
+
+    Con AUTOSAVE_DEBOUNCE_S > 0 le scritture ravvicinate vengono accorpate:
+    lo stato resta "sporco" e sarà scritto alla prima chiamata utile.
+    force=True scrive comunque (salvataggio manuale, reset).
+    Ritorna True se il file è stato scritto.
+    """
+    if not force:
+        if not stato_modificato(state):
+            return False
+        ultimo = state.get("_ultimo_salvataggio", 0.0)
+        if AUTOSAVE_DEBOUNCE_S > 0 and time.monotonic() - ultimo < AUTOSAVE_DEBOUNCE_S:
+            return False
+    backend = storage_backend()
+    if backend:
+        # solo le righe cambiate (es. una partita confermata)
+        backend.salva(_serializzabile(state))
+    else:
+        # Encoder C di json (senza indent): molto più veloce sui file grandi
+        testo = json.dumps(_serializzabile(state), ensure_ascii=False, separators=(",", ":"))
+        scrivi_file_atomico(DATA_FILE, testo)
+    state["_rev_salvata"] = state.get("revisione", 0)
+    state["_ultimo_salvataggio"] = time.monotonic()
+    return True
+
+# ─── INDICI ──────────────────────────────────────────────────────────────────
+# Dizionari id→oggetto (e nome→atleta) tenuti in chiavi runtime "_idx_*".
+# Ogni indice ricorda la lista e la lunghezza da cui è stato costruito: se la
+# lista viene sostituita o modificata senza passare dagli helper, si ricostruisce.
+
+def _indice(state, lista_key, campo):
+    chiave = f"_idx_{lista_key}_{campo}"
+    lista = state[lista_key]
+    idx = state.get(chiave)
+    if idx is None or idx[0] is not lista or idx[1] != len(lista):
+        idx = (lista, len(lista), {x[campo]: x for x in lista})
+        state[chiave] = idx
+    return idx[2]
+
+def _aggiorna_indici(state, lista_key, obj, rimosso=False):
+    """Aggiornamento O(1) degli indici già costruiti dopo append/remove."""
+    prefisso = f"_idx_{lista_key}_"
+    lista = state[lista_key]
+    for chiave in [k for k in state if k.startswith(prefisso)]:
+        vecchia, n, mappa = state[chiave]
+        if vecchia is not lista or n != len(lista) + (1 if rimosso else -1):
+            del state[chiave]       # non allineato: verrà ricostruito
+            continue
+        campo = chiave[len(prefisso):]
+        if rimosso:
+            mappa.pop(obj[campo], None)
+        else:
+            mappa[obj[campo]] = obj
+        state[chiave] = (lista, len(lista), mappa)
+
+def ricostruisci_indici(state):
+    for k in [k for k in state if k.startswith("_idx_")]:
+        del state[k]
+    _indice(state, "atleti", "id")
+    _indice(state, "atleti", "nome")
+    _indice(state, "squadre", "id")
+    state.pop("_id_usati", None)
+
+def prepara_indici(state):
+    """Costruisce subito gli indici mancanti o non allineati (e il registro degli id).
+
+    Per lo stato condiviso tra sessioni: chiamata sotto il lock alla fine di
+    ogni modifica, così le letture trovano gli indici pronti e non scrivono.
+    """
+    _indice(state, "atleti", "id")
+    _indice(state, "atleti", "nome")
+    _indice(state, "squadre", "id")
+    _indice(state, "bracket", "id")
+    _registro_id(state)
+
+# ─── ID ──────────────────────────────────────────────────────────────────────
+# Id compatti e monotoni per entità: "a_1", "sq_1", "p_1"... Il contatore è
+# persistito in state["contatori_id"] e non torna mai indietro (nemmeno con un
+# nuovo torneo), quindi un id non viene mai riassegnato; la parte numerica è
+# un offset denso utilizzabile per array di statistiche.
+
+def _registro_id(state):
+    """Insieme runtime di tutti gli id in uso, compresi quelli archiviati e legacy."""
+    usati = state.get("_id_usati")
+    if usati is None:
+        usati = {x["id"] for x in state.get("atleti", [])}
+        usati.update(sq["id"] for sq in state.get("squadre", []))
+        usati.update(p["id"] for g in state.get("gironi", []) for p in g["partite"])
+        usati.update(p["id"] for p in state.get("bracket", []))
+        for t in state.get("archivio_tornei", {}).values():
+            usati.update(t["squadre"])
+            usati.update(p["id"] for p in t["partite"])
+        state["_id_usati"] = usati
+    return usati
+
+def nuovo_id(state, prefisso):
+    """Prossimo id libero per il prefisso ("a", "sq", "p")."""
+    contatori = state.setdefault("contatori_id", {})
+    usati = _registro_id(state)
+    n = contatori.get(prefisso, 0)
+    while True:
+        n += 1
+        eid = f"{prefisso}_{n}"
+        if eid not in usati:     # salta eventuali id importati con lo stesso formato
+            break
+    contatori[prefisso] = n
+    usati.add(eid)
+    return eid
+
+def offset_id(eid):
+    """Parte numerica di un id "<prefisso>_<n>" (0-based), None per gli id legacy."""
+    _, _, coda = eid.partition("_")
+    return int(coda) - 1 if coda.isdigit() else None
+
+def _registra_id(state, obj, tipo):
+    if obj["id"] in _indice(state, tipo, "id"):
+        raise ValueError(f"Id duplicato: {obj['id']}")
+    _registro_id(state).add(obj["id"])
 
 # ─── ATLETI ──────────────────────────────────────────────────────────────────
 
-def new_atleta(nome):
+def new_atleta(state, nome):
     return {
-        "id": f"a_{nome.lower().replace(' ','_')}_{random.randint(1000,9999)}",
+        "id": nuovo_id(state, "a"),
         "nome": nome,
         "stats": {
             "tornei": 0,
@@ -59,21 +324,36 @@ def new_atleta(nome):
             "set_persi": 0,
             "punti_fatti": 0,
             "punti_subiti": 0,
-            "storico_posizioni": [],   # [(torneo_nome, posizione)]
+            "storico_posizioni": [],   # [(torneo_nome, posizione, torneo_id)]
         }
     }
 
 def get_atleta_by_id(state, aid):
-    for a in state["atleti"]:
-        if a["id"] == aid:
-            return a
-    return None
+    return _indice(state, "atleti", "id").get(aid)
+
+def get_atleta_by_nome(state, nome):
+    return _indice(state, "atleti", "nome").get(nome)
+
+def aggiungi_atleta(state, atleta):
+    _registra_id(state, atleta, "atleti")
+    state["atleti"].append(atleta)
+    _aggiorna_indici(state, "atleti", atleta)
+    return atleta
+
+def nomi_atleti_squadra(state, sq):
+    """Nomi degli atleti della squadra (salta gli id non trovati)."""
+    nomi = []
+    for aid in sq["atleti"]:
+        a = get_atleta_by_id(state, aid)
+        if a:
+            nomi.append(a["nome"])
+    return nomi
 
 # ─── SQUADRE ─────────────────────────────────────────────────────────────────
 
-def new_squadra(nome, atleta1_id, atleta2_id):
+def new_squadra(state, nome, atleta1_id, atleta2_id):
     return {
-        "id": f"sq_{random.randint(10000,99999)}",
+        "id": nuovo_id(state, "sq"),
         "nome": nome,
         "atleti": [atleta1_id, atleta2_id],
         "punti_classifica": 0,
@@ -86,10 +366,20 @@ def new_squadra(nome, atleta1_id, atleta2_id):
     }
 
 def get_squadra_by_id(state, sid):
-    for s in state["squadre"]:
-        if s["id"] == sid:
-            return s
-    return None
+    return _indice(state, "squadre", "id").get(sid)
+
+def aggiungi_squadra(state, sq):
+    _registra_id(state, sq, "squadre")
+    state["squadre"].append(sq)
+    _aggiorna_indici(state, "squadre", sq)
+    return sq
+
+def rimuovi_squadra(state, sid):
+    sq = get_squadra_by_id(state, sid)
+    if sq:
+        state["squadre"].remove(sq)
+        _aggiorna_indici(state, "squadre", sq, rimosso=True)
+    return sq
 
 def nome_squadra(state, sid):
     s = get_squadra_by_id(state, sid)
@@ -97,9 +387,9 @@ def nome_squadra(state, sid):
 
 # ─── PARTITE ─────────────────────────────────────────────────────────────────
 
-def new_partita(sq1_id, sq2_id, fase="girone", girone=None):
+def new_partita(state, sq1_id, sq2_id, fase="girone", girone=None):
     return {
-        "id": f"p_{random.randint(100000,999999)}",
+        "id": nuovo_id(state, "p"),
         "sq1": sq1_id,
         "sq2": sq2_id,
         "fase": fase,
@@ -110,31 +400,67 @@ def new_partita(sq1_id, sq2_id, fase="girone", girone=None):
         "in_battuta": 1,         # 1 o 2
         "confermata": False,
         "vincitore": None,
+        "rev": 0,                # revisione, vedi segna_partita_modificata()
     }
 
+def get_partita_bracket(state, pid):
+    return _indice(state, "bracket", "id").get(pid)
+
 # ─── SIMULAZIONE ─────────────────────────────────────────────────────────────
 
-def simula_set(pmax, tie_break=False):
+@lru_cache(maxsize=256)
+def distribuzione_set(limit, p=0.5):
+    """Distribuzione esatta del punteggio finale di un set (rally point, 2 di scarto).
+
+    p = probabilità che la squadra 1 vinca un rally. Ritorna (esiti, probabilità):
+    gli esiti (a, b) chiusi senza vantaggi, più None per l'arrivo a
+    (limit-1, limit-1), da cui si prosegue ai vantaggi.
+    """
+    q = 1 - p
+    esiti, prob = [], []
+    for k in range(limit - 1):
+        # binomiale negativa: il vincitore fa il limit-esimo punto dopo k punti avversari
+        c = math.comb(limit - 1 + k, k)
+        esiti.append((limit, k)); prob.append(c * p**limit * q**k)
+        esiti.append((k, limit)); prob.append(c * q**limit * p**k)
+    esiti.append(None); prob.append(math.comb(2*limit - 2, limit - 1) * (p*q)**(limit - 1))
+    return tuple(esiti), tuple(prob)
+
+def esito_vantaggi(limit, p, u_durata, u_vincitore):
+    """Punteggio finale da (limit-1, limit-1), dati due numeri uniformi in [0, 1).
+
+    Ogni coppia di rally divisa (prob. 2pq) aggiunge un punto a testa: il numero
+    di coppie è geometrico; la coppia decisiva va a 1 con prob. p²/(p²+q²).
+    """
+    q = 1 - p
+    pareggio = 2 * p * q
+    extra = int(math.log(1 - u_durata) / math.log(pareggio)) if pareggio > 0 else 0
+    vince_1 = u_vincitore < p*p / (p*p + q*q)
+    w, l = limit + 1 + extra, limit - 1 + extra
+    return (w, l) if vince_1 else (l, w)
+
+def simula_set(pmax, tie_break=False, p=0.5, rng=random):
+    """Estrae direttamente il punteggio finale, senza simulare rally per rally."""
     limit = 15 if tie_break else pmax
-    a, b = 0, 0
-    while True:
-        if random.random() > 0.5:
-            a += 1
-        else:
-            b += 1
-        if a >= limit or b >= limit:
-            if abs(a - b) >= 2:
-                return a, b
-            if a > limit + 6 or b > limit + 6:
-                return (a, b) if a > b else (b, a)
-
-def simula_partita(state, partita):
+    esiti, prob = distribuzione_set(limit, p)
+    esito = rng.choices(esiti, weights=prob)[0]
+    if esito is None:
+        esito = esito_vantaggi(limit, p, rng.random(), rng.random())
+    return esito
+
+def simula_partita(state, partita, p=0.5, rng=None):
+    """Simula e conferma la partita; p = prob. che sq1 vinca un rally.
+
+    Senza rng esplicito l'esito dipende solo dal seed del torneo e dall'id partita.
+    """
+    if rng is None:
+        rng = rng_torneo(state, "simula", partita["id"])
     torneo = state["torneo"]
     pmax = torneo["punteggio_max"]
     formato = torneo["formato_set"]
     
     if formato == "Set Unico":
-        p1, p2 = simula_set(pmax)
+        p1, p2 = simula_set(pmax, p=p, rng=rng)
         partita["punteggi"] = [(p1, p2)]
         partita["set_sq1"] = 1 if p1 > p2 else 0
         partita["set_sq2"] = 1 if p2 > p1 else 0
@@ -143,7 +469,7 @@ def simula_partita(state, partita):
         punteggi = []
         while sets_1 < 2 and sets_2 < 2:
             tie = (sets_1 == 1 and sets_2 == 1)
-            p1, p2 = simula_set(pmax, tie_break=tie)
+            p1, p2 = simula_set(pmax, tie_break=tie, p=p, rng=rng)
             punteggi.append((p1, p2))
             if p1 > p2: sets_1 += 1
             else: sets_2 += 1
@@ -153,39 +479,256 @@ def simula_partita(state, partita):
     
     partita["vincitore"] = partita["sq1"] if partita["set_sq1"] > partita["set_sq2"] else partita["sq2"]
     partita["confermata"] = True
+    segna_partita_modificata(partita)
     return partita
 
 # ─── CLASSIFICA GIRONE ───────────────────────────────────────────────────────
 
-def aggiorna_classifica_squadra(state, partita):
-    """Aggiorna stats squadra dopo conferma risultato."""
-    sq1 = get_squadra_by_id(state, partita["sq1"])
-    sq2 = get_squadra_by_id(state, partita["sq2"])
-    if not sq1 or not sq2:
-        return
+# I contatori delle squadre sono dati derivati: ogni partita contata ricorda in
+# partita["in_classifica"] il contributo applicato ({sid: [contatori]}), così
+# riconfermarla sostituisce il contributo invece di sommarlo due volte,
+# annullarla lo sottrae e ricalcola_classifiche() ricostruisce tutto da zero.
 
+CONTATORI_SQUADRA = ("punti_classifica", "vittorie", "sconfitte",
+                     "set_vinti", "set_persi", "punti_fatti", "punti_subiti")
+
+def contributo_partita(partita):
+    """{sid: [valori di CONTATORI_SQUADRA]} portati da una partita confermata."""
     s1v, s2v = partita["set_sq1"], partita["set_sq2"]
     p1_tot = sum(p[0] for p in partita["punteggi"])
     p2_tot = sum(p[1] for p in partita["punteggi"])
+    v1 = partita["vincitore"] == partita["sq1"]
+    return {
+        partita["sq1"]: [3 if v1 else 1, int(v1), int(not v1), s1v, s2v, p1_tot, p2_tot],
+        partita["sq2"]: [1 if v1 else 3, int(not v1), int(v1), s2v, s1v, p2_tot, p1_tot],
+    }
 
-    sq1["set_vinti"] += s1v; sq1["set_persi"] += s2v
-    sq2["set_vinti"] += s2v; sq2["set_persi"] += s1v
-    sq1["punti_fatti"] += p1_tot; sq1["punti_subiti"] += p2_tot
-    sq2["punti_fatti"] += p2_tot; sq2["punti_subiti"] += p1_tot
+def _applica_contributo(state, contributo, segno):
+    for sid, valori in contributo.items():
+        sq = get_squadra_by_id(state, sid)
+        if sq:
+            for campo, v in zip(CONTATORI_SQUADRA, valori):
+                sq[campo] += segno * v
 
-    if partita["vincitore"] == partita["sq1"]:
-        sq1["vittorie"] += 1; sq1["punti_classifica"] += 3
-        sq2["sconfitte"] += 1; sq2["punti_classifica"] += 1
-    else:
-        sq2["vittorie"] += 1; sq2["punti_classifica"] += 3
-        sq1["sconfitte"] += 1; sq1["punti_classifica"] += 1
+def aggiorna_classifica_squadra(state, partita):
+    """Conta la partita confermata nei contatori delle squadre (idempotente)."""
+    if not get_squadra_by_id(state, partita["sq1"]) or not get_squadra_by_id(state, partita["sq2"]):
+        return
+    annulla_classifica_squadra(state, partita)
+    partita["in_classifica"] = contributo_partita(partita)
+    _applica_contributo(state, partita["in_classifica"], 1)
+
+def annulla_classifica_squadra(state, partita):
+    """Toglie dai contatori il contributo della partita, se era contata."""
+    contributo = partita.pop("in_classifica", None)
+    if contributo:
+        _applica_contributo(state, contributo, -1)
+
+def _tutte_le_partite(state):
+    return [p for g in state["gironi"] for p in g["partite"]] + list(state["bracket"])
+
+def aggrega_partite(partite, squadre_ids):
+    """Somma vettoriale dei contributi: matrice (len(squadre_ids), len(CONTATORI_SQUADRA))."""
+    import numpy as np
+    pos = {sid: i for i, sid in enumerate(squadre_ids)}
+    righe, valori = [], []
+    for p in partite:
+        if p["sq1"] in pos and p["sq2"] in pos:
+            righe += [pos[p["sq1"]], pos[p["sq2"]]]
+            valori.append([p["set_sq1"], p["set_sq2"], p["vincitore"] == p["sq1"],
+                           sum(x[0] for x in p["punteggi"]), sum(x[1] for x in p["punteggi"])])
+    totali = np.zeros((len(squadre_ids), len(CONTATORI_SQUADRA)), dtype=np.int64)
+    if not valori:
+        return totali
+    s1, s2, v1, p1, p2 = np.array(valori, dtype=np.int64).T
+    v2 = 1 - v1
+    # una riga per squadra e partita: sq1 e sq2 alternate
+    contributi = np.stack([
+        np.column_stack(c) for c in (
+            (1 + 2 * v1, v1, v2, s1, s2, p1, p2),
+            (1 + 2 * v2, v2, v1, s2, s1, p2, p1),
+        )
+    ], axis=1).reshape(-1, len(CONTATORI_SQUADRA))
+    np.add.at(totali, np.array(righe), contributi)
+    return totali
+
+def ricalcola_classifiche(state):
+    """Ricostruisce da zero i contatori delle squadre dalle partite contate.
+
+    Dà lo stesso risultato della sequenza di aggiornamenti incrementali; serve
+    dopo modifiche manuali ai risultati o per verificare la coerenza.
+    """
+    contate = [p for p in _tutte_le_partite(state) if p.get("in_classifica") and p["confermata"]]
+    sids = [sq["id"] for sq in state["squadre"]]
+    totali = aggrega_partite(contate, sids)
+    for sq, riga in zip(state["squadre"], totali.tolist()):
+        sq.update(zip(CONTATORI_SQUADRA, riga))
+    for p in _tutte_le_partite(state):
+        if p.get("in_classifica"):
+            if p["confermata"]:
+                p["in_classifica"] = contributo_partita(p)
+            else:
+                del p["in_classifica"]
+
+# ─── CORREZIONE RISULTATI ────────────────────────────────────────────────────
+
+def imposta_risultato(partita, punteggi):
+    """Set, vincitore e conferma da [(p1, p2), ...] (set con almeno un punto)."""
+    s1v = sum(1 for p1, p2 in punteggi if p1 > p2)
+    partita["punteggi"] = [tuple(x) for x in punteggi]
+    partita["set_sq1"] = s1v
+    partita["set_sq2"] = len(punteggi) - s1v
+    partita["vincitore"] = partita["sq1"] if s1v > partita["set_sq2"] else partita["sq2"]
+    partita["confermata"] = True
+    segna_partita_modificata(partita)
+
+def annulla_risultato(state, partita):
+    """Riporta una partita confermata a "da giocare".
+
+    Toglie il suo contributo ai contatori delle squadre e, nel tabellone,
+    svuota gli slot che aveva riempito: le partite a valle già giocate
+    tornano da giocare a cascata (bracket_engine.ritira_vincitore).
+    """
+    if not partita["confermata"]:
+        return
+    if partita.get("tabellone"):
+        from bracket_engine import ritira_vincitore
+        ritira_vincitore(state, partita)
+    annulla_classifica_squadra(state, partita)
+    partita.pop("registro_punti", None)
+    partita.update({"punteggi": [], "set_sq1": 0, "set_sq2": 0, "vincitore": None, "confermata": False})
+    segna_partita_modificata(partita)
+
+def correggi_risultato(state, partita, punteggi):
+    """Sostituisce il risultato di una partita confermata.
+
+    Se il vincitore non cambia si sostituisce solo il contributo in classifica
+    (O(1)); nel tabellone un cambio di vincitore riapre le partite a valle.
+    """
+    contata = "in_classifica" in partita
+    vincitore = partita["vincitore"]
+    partita.pop("registro_punti", None)      # il registro live non descrive più il risultato
+    if partita.get("tabellone"):
+        from bracket_engine import avanza_vincitore
+        prova = dict(partita)
+        imposta_risultato(prova, punteggi)
+        if prova["vincitore"] != vincitore:
+            annulla_risultato(state, partita)
+            imposta_risultato(partita, punteggi)
+            if contata:
+                aggiorna_classifica_squadra(state, partita)
+            avanza_vincitore(state, partita)
+            return
+    imposta_risultato(partita, punteggi)
+    if contata:
+        aggiorna_classifica_squadra(state, partita)
+
+def partite_a_valle(state, partita):
+    """Partite confermate del tabellone che dipendono dall'esito di questa."""
+    if not partita.get("tabellone"):
+        return []
+    trovate, coda = [], [partita]
+    while coda:
+        p = coda.pop()
+        for chiave in ("prossima", "perdente_verso", "spareggio_verso"):
+            dest = get_partita_bracket(state, p.get(chiave)) if p.get(chiave) else None
+            if dest and dest["confermata"] and dest not in trovate:
+                trovate.append(dest)
+                coda.append(dest)
+    return trovate
+
+def migra_contributi_classifica(state):
+    """Stati salvati prima di partita["in_classifica"]: contatori non vuoti = partite
+    confermate già contate (quelle simulate senza invio al ranking non si distinguono)."""
+    partite = _tutte_le_partite(state)
+    if any("in_classifica" in p for p in partite):
+        return
+    if not any(sq.get(c) for sq in state["squadre"] for c in CONTATORI_SQUADRA):
+        return
+    for p in partite:
+        if p["confermata"] and get_squadra_by_id(state, p["sq1"]) and get_squadra_by_id(state, p["sq2"]):
+            p["in_classifica"] = contributo_partita(p)
+
+# ─── ARCHIVIO TORNEI ─────────────────────────────────────────────────────────
+
+def _nuovo_torneo_id(state):
+    # l'archivio cresce soltanto: il contatore non si ripete
+    return f"t{len(state['archivio_tornei']) + 1:04d}"
+
+def archivia_torneo(state, podio):
+    """Registra il torneo concluso in state["archivio_tornei"] e ne ritorna l'id.
+
+    Il record è immutabile: numero squadre e classifica finale non dipendono
+    più dal torneo caricato, quindi i punti ranking calcolati su di esso
+    restano validi per sempre. Richiamarla sullo stesso torneo aggiorna il record.
+    """
+    archivio = state.setdefault("archivio_tornei", {})
+    torneo = state["torneo"]
+    tid = torneo.get("id")
+    if not tid or tid not in archivio:
+        tid = _nuovo_torneo_id(state)
+        torneo["id"] = tid
+
+    n_squadre = len(state["squadre"])
+    classifica = [[pos, sid] for pos, sid in podio]
+    sul_podio = {sid for _, sid in podio}
+    classifica += [[n_squadre // 2, sq["id"]] for sq in state["squadre"] if sq["id"] not in sul_podio]
+
+    partite = [
+        p for p in [*(p for g in state["gironi"] for p in g["partite"]), *state["bracket"]]
+        if p["confermata"]
+    ]
+    archivio[tid] = {
+        "id": tid,
+        "nome": torneo["nome"],
+        "data": torneo["data"],
+        "tipo_tabellone": torneo["tipo_tabellone"],
+        "formato_set": torneo["formato_set"],
+        "punteggio_max": torneo["punteggio_max"],
+        "n_squadre": n_squadre,
+        "squadre": {sq["id"]: {"nome": sq["nome"], "atleti": list(sq["atleti"])} for sq in state["squadre"]},
+        "classifica_finale": classifica,
+        "partite": [
+            {"id": p["id"], "sq1": p["sq1"], "sq2": p["sq2"], "fase": p["fase"],
+             "punteggi": [list(x) for x in p["punteggi"]], "vincitore": p["vincitore"]}
+            for p in partite
+        ],
+    }
+    return tid
+
+def get_torneo_archiviato(state, torneo_id):
+    return state.get("archivio_tornei", {}).get(torneo_id)
+
+def migra_storico_posizioni(state):
+    """Converte le voci (nome, pos) dei vecchi salvataggi in (nome, pos, torneo_id).
+
+    Per i tornei senza record si crea una voce "ricostruita" con il numero di
+    squadre usato finora nel calcolo, congelato da qui in avanti.
+    """
+    archivio = state.setdefault("archivio_tornei", {})
+    per_nome = {t["nome"]: tid for tid, t in archivio.items()}
+    n_fallback = max(len(state["squadre"]), 4)
+    for a in state["atleti"]:
+        storico = a["stats"]["storico_posizioni"]
+        for i, voce in enumerate(storico):
+            if len(voce) >= 3:
+                continue
+            nome, pos = voce[0], voce[1]
+            if nome not in per_nome:
+                tid = _nuovo_torneo_id(state)
+                archivio[tid] = {"id": tid, "nome": nome, "n_squadre": n_fallback, "ricostruito": True}
+                per_nome[nome] = tid
+            storico[i] = [nome, pos, per_nome[nome]]
 
 # ─── TRASFERIMENTO RANKING ATLETI ────────────────────────────────────────────
 
-def trasferisci_al_ranking(state, podio):
+def trasferisci_al_ranking(state, podio, torneo_id=None):
     """podio = [(1, sq_id), (2, sq_id), (3, sq_id)]"""
+    if torneo_id is None:
+        torneo_id = archivia_torneo(state, podio)
     nome_torneo = state["torneo"]["nome"]
     n_squadre = len(state["squadre"])
+    toccati = {aid for sq in state["squadre"] for aid in sq["atleti"]}
     # Tutti gli atleti partecipanti ricevono aggiornamento stats
     atleti_aggiornati = set()
     
@@ -210,7 +753,7 @@ def trasferisci_al_ranking(state, podio):
             if not atleta: continue
             s = atleta["stats"]
             s["tornei"] += 1
-            s["storico_posizioni"].append((nome_torneo, pos))
+            s["storico_posizioni"].append((nome_torneo, pos, torneo_id))
             if pos == 1: s["vittorie"] += 1
             else: s["sconfitte"] += 1
     
@@ -224,21 +767,117 @@ def trasferisci_al_ranking(state, podio):
                     atleta["stats"]["tornei"] += 1
                     atleta["stats"]["sconfitte"] += 1
                     # Posizione approssimativa
-                    atleta["stats"]["storico_posizioni"].append((nome_torneo, n_squadre // 2))
+                    atleta["stats"]["storico_posizioni"].append((nome_torneo, n_squadre // 2, torneo_id))
+
+    # La classifica materializzata (ranking_engine) ricalcola solo questi atleti
+    state.setdefault("_ranking_sporchi", set()).update(toccati)
+    state["ranking_versione"] = state.get("ranking_versione", 0) + 1
 
 # ─── GENERAZIONE GIRONI ──────────────────────────────────────────────────────
 
-def genera_gironi(squadre_ids, num_gironi=2):
-    random.shuffle(squadre_ids)
+def giornate_girone(squadre):
+    """Accoppiamenti del girone all'italiana divisi in giornate (metodo del cerchio).
+
+    Ogni squadra gioca al massimo una partita per giornata; con un numero
+    dispari di squadre una riposa a turno. La prima resta ferma, le altre
+    ruotano di una posizione a ogni giornata.
+    """
+    ruota = list(squadre)
+    if len(ruota) % 2:
+        ruota.append(None)
+    n = len(ruota)
+    giornate = []
+    for g in range(n - 1):
+        coppie = []
+        for i in range(n // 2):
+            a, b = ruota[i], ruota[n - 1 - i]
+            if a is None or b is None:
+                continue
+            if i == 0 and g % 2:
+                a, b = b, a         # la squadra fissa alterna il lato
+            coppie.append((a, b))
+        giornate.append(coppie)
+        ruota = [ruota[0], ruota[-1], *ruota[1:-1]]
+    return giornate
+
+def sorteggio_serpentina(squadre_ids, num_gironi, forza, rng=random, ottimizza=True):
+    """Composizione dei gironi per forza: [[sid, ...] per girone].
+
+    Le squadre, in ordine di forza (parità sorteggiate), formano fasce di
+    num_gironi squadre distribuite a serpentina (A→H, poi H→A, ...). Con
+    ottimizza=True scambi tra gironi dentro la stessa fascia riducono la
+    varianza della forza totale dei gironi finché nessuno scambio migliora.
+    """
+    ordine = list(squadre_ids)
+    rng.shuffle(ordine)
+    ordine.sort(key=lambda sid: -forza.get(sid, 0))
+    fasce = [ordine[i:i + num_gironi] for i in range(0, len(ordine), num_gironi)]
+    composizione = [[] for _ in range(num_gironi)]
+    for f, fascia in enumerate(fasce):
+        gironi_fascia = range(num_gironi) if f % 2 == 0 else reversed(range(num_gironi))
+        for sid, g in zip(fascia, gironi_fascia):
+            composizione[g].append(sid)
+    if not ottimizza:
+        return composizione
+
+    somme = [sum(forza.get(s, 0) for s in g) for g in composizione]
+    migliorato = True
+    while migliorato:
+        migliorato = False
+        for f in range(len(fasce)):
+            membri = [(g, forza.get(c[f], 0)) for g, c in enumerate(composizione) if len(c) > f]
+            for x, (gi, a) in enumerate(membri):
+                for gj, b in membri[x + 1:]:
+                    d = a - b
+                    # variazione della somma dei quadrati scambiando a (gi) con b (gj)
+                    if d and 2 * d * (d + somme[gj] - somme[gi]) < -1e-9:
+                        ci, cj = composizione[gi], composizione[gj]
+                        ci[f], cj[f] = cj[f], ci[f]
+                        somme[gi] -= d
+                        somme[gj] += d
+                        migliorato = True
+                        break
+                if migliorato:
+                    break
+    return composizione
+
+def nome_girone(i):
+    """A, B, ..., Z, AA, AB, ... per qualsiasi numero di gironi."""
+    nome = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        nome = chr(ord("A") + r) + nome
+    return f"Girone {nome}"
+
+def composizione_gironi(squadre_ids, num_gironi, rng=random, forza=None):
+    """Squadre di ogni girone [[sid, ...]], senza creare partite né id (anteprima).
+
+    forza: {sid: punteggio} per il sorteggio a serpentina (sorteggio_serpentina);
+    senza, le squadre sono distribuite a caso.
+    """
+    if forza is None:
+        squadre_ids = list(squadre_ids)     # non mescolare la lista del chiamante
+        rng.shuffle(squadre_ids)
+        return [squadre_ids[i::num_gironi] for i in range(num_gironi)]
+    return sorteggio_serpentina(squadre_ids, num_gironi, forza, rng)
+
+def genera_gironi(state, squadre_ids, num_gironi=2, rng=random, forza=None):
+    """Gironi con partite divise in giornate (vedi composizione_gironi)."""
+    return gironi_da_composizione(state, composizione_gironi(squadre_ids, num_gironi, rng, forza))
+
+def gironi_da_composizione(state, composizione):
+    """Crea i gironi e le loro partite: alloca gli id, da chiamare solo all'avvio."""
     gironi = []
-    for i in range(num_gironi):
-        squadre_girone = squadre_ids[i::num_gironi]
+    for i, squadre_girone in enumerate(composizione):
         partite = []
-        for j in range(len(squadre_girone)):
-            for k in range(j+1, len(squadre_girone)):
-                partite.append(new_partita(squadre_girone[j], squadre_girone[k], "girone", i))
+        for g, coppie in enumerate(giornate_girone(squadre_girone), 1):
+            for sq1, sq2 in coppie:
+                p = new_partita(state, sq1, sq2, "girone", i)
+                p["giornata"] = g
+                partite.append(p)
         gironi.append({
-            "nome": f"Girone {'ABCDEFGH'[i]}",
+            "nome": nome_girone(i),
             "squadre": squadre_girone,
             "partite": partite,
         })
@@ -246,23 +885,12 @@ def genera_gironi(squadre_ids, num_gironi=2):
 
 # ─── GENERAZIONE BRACKET ─────────────────────────────────────────────────────
 
-def genera_bracket_da_gironi(gironi):
-    """Prende le prime 2 di ogni girone per il bracket."""
-    teste_di_serie = []
-    for g in gironi:
-        classifica = sorted(
-            g["squadre"],
-            key=lambda sid: (
-                next((sq for sq in []), {"punti_classifica": 0}).get("punti_classifica", 0)
-            ),
-            reverse=True
-        )
-        # usiamo l'ordine di squadre come proxy
-        teste_di_serie.extend(g["squadre"][:2])
-    
-    bracket = []
-    random.shuffle(teste_di_serie)
-    for i in range(0, len(teste_di_serie), 2):
-        if i+1 < len(teste_di_serie):
-            bracket.append(new_partita(teste_di_serie[i], teste_di_serie[i+1], "eliminazione"))
-    return bracket
+def genera_bracket_da_gironi(state, gironi, qualificate_per_girone=2, ripescate=0):
+    """Le prime di ogni girone (più le ripescate) nel tabellone, con teste di serie dalla classifica.
+
+    Vedi classifiche.teste_di_serie_da_gironi (criteri e separazione dei gironi)
+    e bracket_engine.genera_tabellone.
+    """
+    from bracket_engine import genera_tabellone
+    from classifiche import teste_di_serie_da_gironi
+    return genera_tabellone(state, teste_di_serie_da_gironi(gironi, qualificate_per_girone, ripescate))
@@ -3,10 +3,18 @@ fase_eliminazione.py — Fase 3: Eliminazione Diretta / Playoffs
 """
 import streamlit as st
 from data_manager import (
-    save_state, simula_partita, aggiorna_classifica_squadra,
-    get_squadra_by_id, new_partita
+    simula_partita, aggiorna_classifica_squadra,
+    get_squadra_by_id, nome_squadra, archivia_torneo, trasferisci_al_ranking, imposta_risultato
 )
-from ui_components import render_match_card
+from bracket_engine import (
+    avanza_vincitore, giocabile, turni_tabellone, podio_da_tabellone,
+    tabellone_concluso, prossima_partita, NOME_SPAREGGIO
+)
+from ui_components import (
+    render_match_card, render_calendario, render_correzione_risultato, revisione_letta,
+    applica_a_partita
+)
+from stato_condiviso import modifica
 
 
 def render_eliminazione(state):
@@ -16,23 +24,39 @@ def render_eliminazione(state):
     
     col_a, col_b = st.columns([2, 2])
     with col_a:
-        state["simulazione_al_ranking"] = st.toggle(
+        sim_al_ranking = st.toggle(
             "📊 Invia dati simulati al Ranking",
             value=state["simulazione_al_ranking"]
         )
+        if sim_al_ranking != state["simulazione_al_ranking"]:
+            with modifica():
+                state["simulazione_al_ranking"] = sim_al_ranking
     with col_b:
         if st.button("🎲 Simula TUTTI i Playoff", use_container_width=True):
             _simula_tutti_playoff(state)
     
+    if state["torneo"]["tipo_tabellone"] == "Doppia Eliminazione":
+        _render_prossima_partita(state)
+    
+    with st.expander("🗓️ Calendario Campi", expanded=False):
+        render_calendario(state)
+    
     st.divider()
     
     # Raggruppa per round
-    rounds = _raggruppa_round(bracket)
-    
-    for round_name, partite in rounds.items():
+    for round_name, partite in turni_tabellone(bracket):
         st.markdown(f"### {round_name}")
         
         for i, partita in enumerate(partite):
+            if partita["sq1"] is None or partita["sq2"] is None:
+                nomi = [nome_squadra(state, partita[k]) if partita[k] else "da definire"
+                        for k in ("sq1", "sq2")]
+                attesa = ("si gioca solo se vince chi arriva dai perdenti"
+                          if round_name == NOME_SPAREGGIO else "in attesa del turno precedente")
+                st.caption(f"⏳ {nomi[0]} vs {nomi[1]} — {attesa}")
+                st.markdown("---")
+                continue
+            
             render_match_card(state, partita, label=round_name)
             
             if not partita["confermata"]:
@@ -42,6 +66,8 @@ def render_eliminazione(state):
                 sq = get_squadra_by_id(state, partita["vincitore"])
                 if sq:
                     st.success(f"✅ Vincitore: **{sq['nome']}** → avanza al turno successivo")
+                if state["fase"] == "eliminazione":
+                    render_correzione_risultato(state, partita, f"pl_{partita['id']}")
             
             st.markdown("---")
     
@@ -49,16 +75,22 @@ def render_eliminazione(state):
     _check_finale(state)
 
 
-def _raggruppa_round(bracket):
-    """Raggruppa partite in round con nomi."""
-    n = len(bracket)
-    if n == 0: return {}
-    
-    if n == 1: return {"🏆 FINALE": bracket}
-    if n == 2: return {"🥇 SEMIFINALI": bracket}
-    if n <= 4: return {"⚡ QUARTI DI FINALE": bracket[:n//2], "🏆 SEMIFINALI": bracket[n//2:]}
-    
-    return {"⚡ Fase Eliminazione": bracket}
+def _render_prossima_partita(state):
+    with st.expander("🔎 Prossima partita di una squadra", expanded=False):
+        squadre = {sq["id"]: sq["nome"] for sq in state["squadre"]}
+        sid = st.selectbox("Squadra", list(squadre), format_func=squadre.get, key="sel_prossima_sq")
+        if sid is None:
+            return
+        p = prossima_partita(state, sid)
+        if p is None:
+            st.info("Nessuna partita in programma: eliminata o campione.")
+            return
+        avversario = p["sq2"] if p["sq1"] == sid else p["sq1"]
+        nome_turno = next(nome for nome, partite in turni_tabellone(state["bracket"]) if p in partite)
+        if avversario:
+            st.success(f"**{nome_turno}** — contro **{nome_squadra(state, avversario)}**")
+        else:
+            st.info(f"**{nome_turno}** — avversario da definire")
 
 
 def _render_scoreboard_playoff(state, partita, key_prefix):
@@ -66,6 +98,7 @@ def _render_scoreboard_playoff(state, partita, key_prefix):
     sq2 = get_squadra_by_id(state, partita["sq2"])
     torneo = state["torneo"]
     formato = torneo["formato_set"]
+    revisione_letta(partita, key_prefix)
     
     with st.expander("📝 Inserisci Risultato", expanded=False):
         n_set = 1 if formato == "Set Unico" else 3
@@ -82,69 +115,40 @@ def _render_scoreboard_playoff(state, partita, key_prefix):
             punteggi_inseriti.append((p1, p2))
         
         if st.button("✅ CONFERMA RISULTATO", key=f"{key_prefix}_confirm", use_container_width=True):
-            s1v, s2v = 0, 0
-            punteggi_validi = []
-            for p1, p2 in punteggi_inseriti:
-                if p1 > 0 or p2 > 0:
-                    if p1 > p2: s1v += 1
-                    else: s2v += 1
-                    punteggi_validi.append((p1, p2))
+            punteggi_validi = [(p1, p2) for p1, p2 in punteggi_inseriti if p1 > 0 or p2 > 0]
             
             if not punteggi_validi:
                 st.error("Inserisci almeno un set.")
                 return
             
-            partita["punteggi"] = punteggi_validi
-            partita["set_sq1"] = s1v
-            partita["set_sq2"] = s2v
-            partita["vincitore"] = partita["sq1"] if s1v > s2v else partita["sq2"]
-            partita["confermata"] = True
-            aggiorna_classifica_squadra(state, partita)
-            
-            # Genera prossimo round se necessario
-            _genera_prossimo_round(state, partita)
-            save_state(state)
-            st.rerun()
+            def conferma():
+                imposta_risultato(partita, punteggi_validi)
+                aggiorna_classifica_squadra(state, partita)
+                # Porta il vincitore nel turno successivo
+                avanza_vincitore(state, partita)
+            if applica_a_partita(state, partita, key_prefix, conferma):
+                st.rerun()
         
         if st.button("🎲 Simula", key=f"{key_prefix}_sim"):
-            simula_partita(state, partita)
-            if state["simulazione_al_ranking"]:
-                aggiorna_classifica_squadra(state, partita)
-            _genera_prossimo_round(state, partita)
-            save_state(state)
-            st.rerun()
-
-
-def _genera_prossimo_round(state, partita_confermata):
-    """Controlla se creare nuove partite dal bracket."""
-    bracket = state["bracket"]
-    
-    # Trova partite non confermate dello stesso livello
-    non_confermate = [p for p in bracket if not p["confermata"]]
-    confermate_correnti = [p for p in bracket if p["confermata"]]
-    
-    if len(non_confermate) == 0 and len(confermate_correnti) >= 2:
-        # Controlla se ci sono già future partite da generare
-        vincitori = [p["vincitore"] for p in confermate_correnti]
-        # Se numero pari di vincitori senza match successivo
-        vincitori_senza_match = []
-        for v in vincitori:
-            ha_match = any(
-                (p["sq1"] == v or p["sq2"] == v) 
-                for p in bracket 
-                if not p["confermata"] or p == partita_confermata
-            )
-            # logica semplificata: aggiungi nuove partite se necessario
-        pass
+            def simula():
+                simula_partita(state, partita)
+                if state["simulazione_al_ranking"]:
+                    aggiorna_classifica_squadra(state, partita)
+                avanza_vincitore(state, partita)
+            if applica_a_partita(state, partita, key_prefix, simula):
+                st.rerun()
 
 
 def _simula_tutti_playoff(state):
-    for partita in state["bracket"]:
-        if not partita["confermata"]:
-            simula_partita(state, partita)
-            if state["simulazione_al_ranking"]:
-                aggiorna_classifica_squadra(state, partita)
-    save_state(state)
+    # il tabellone è ordinato per turno: quando si arriva a una partita,
+    # i turni precedenti l'hanno già riempita
+    with modifica():
+        for partita in state["bracket"]:
+            if giocabile(partita):
+                simula_partita(state, partita)
+                if state["simulazione_al_ranking"]:
+                    aggiorna_classifica_squadra(state, partita)
+                avanza_vincitore(state, partita)
     st.rerun()
 
 
@@ -153,14 +157,14 @@ def _check_finale(state):
     bracket = state["bracket"]
     if not bracket: return
     
-    tutti_confermati = all(p["confermata"] for p in bracket)
+    tutti_confermati = tabellone_concluso(bracket)
+    podio = podio_da_tabellone(bracket)
     
-    if tutti_confermati:
+    if tutti_confermati and podio:
         st.divider()
         col1, col2 = st.columns([3, 1])
         
-        vincitori = [p["vincitore"] for p in bracket]
-        finale_winner = vincitori[-1] if vincitori else None
+        finale_winner = podio[0][1]
         
         with col1:
             if finale_winner:
@@ -170,20 +174,14 @@ def _check_finale(state):
         
         with col2:
             if st.button("🏆 PROCLAMAZIONE →", use_container_width=True):
-                state["vincitore"] = finale_winner
-                # Calcola podio (1°: ultimo vincitore, 2°: ultimo sconfitto, 3°: semifinalisti)
-                perdenti = [p["sq1"] if p["vincitore"] == p["sq2"] else p["sq2"] for p in bracket]
-                podio = [(1, finale_winner)]
-                if perdenti:
-                    podio.append((2, perdenti[-1]))
-                if len(perdenti) > 1:
-                    podio.append((3, perdenti[-2]))
-                
-                state["podio"] = podio
-                if state["simulazione_al_ranking"]:
-                    from data_manager import trasferisci_al_ranking
-                    trasferisci_al_ranking(state, podio)
-                
-                state["fase"] = "proclamazione"
-                save_state(state)
+                with modifica():
+                    # controllo e passaggio di fase sotto lo stesso lock: due sessioni
+                    # che confermano insieme non archiviano né trasferiscono il podio due volte
+                    if state["fase"] == "eliminazione":
+                        state["vincitore"] = finale_winner
+                        state["podio"] = podio
+                        torneo_id = archivia_torneo(state, podio)
+                        if state["simulazione_al_ranking"]:
+                            trasferisci_al_ranking(state, podio, torneo_id)
+                        state["fase"] = "proclamazione"
                 st.rerun()
@@ -3,10 +3,19 @@ fase_gironi.py — Fase 2: Fase a Gironi con scoreboard live
 """
 import streamlit as st
 from data_manager import (
-    save_state, simula_partita, aggiorna_classifica_squadra,
-    get_squadra_by_id, nome_squadra, genera_bracket_da_gironi
+    simula_partita, aggiorna_classifica_squadra,
+    get_squadra_by_id, nome_squadra, genera_bracket_da_gironi, imposta_risultato
 )
-from ui_components import render_match_card
+from classifiche import accoppiamenti_proiettati, classifiche_gironi
+from calendario import pianifica_torneo
+from ui_components import (
+    render_match_card, render_calendario, render_correzione_risultato, revisione_letta,
+    applica_a_partita
+)
+from stato_condiviso import modifica
+
+PREVISIONI_N_SIM = 20000
+MAX_TAB_GIRONI = 8       # oltre, un selettore al posto di una tab per girone
 
 
 def render_gironi(state):
@@ -15,11 +24,14 @@ def render_gironi(state):
     # Controllo simulatore ON/OFF
     col_a, col_b, col_c = st.columns([2, 2, 2])
     with col_a:
-        state["simulazione_al_ranking"] = st.toggle(
+        sim_al_ranking = st.toggle(
             "📊 Invia dati simulati al Ranking",
             value=state["simulazione_al_ranking"],
             help="Se OFF, la simulazione è solo demo e non aggiorna statistiche atleti"
         )
+        if sim_al_ranking != state["simulazione_al_ranking"]:
+            with modifica():
+                state["simulazione_al_ranking"] = sim_al_ranking
     with col_b:
         if st.button("🎲 Simula TUTTI i Risultati", use_container_width=True):
             _simula_tutti(state)
@@ -31,9 +43,14 @@ def render_gironi(state):
         )
         if tutti_confermati:
             if st.button("⚡ AVANZA ALL'ELIMINAZIONE →", use_container_width=True):
-                state["bracket"] = genera_bracket_da_gironi(state["gironi"])
-                state["fase"] = "eliminazione"
-                save_state(state)
+                with modifica():
+                    # un'altra sessione può aver già generato il tabellone
+                    if state["fase"] == "gironi":
+                        state["bracket"] = genera_bracket_da_gironi(
+                            state, state["gironi"], state["torneo"]["qualificate_girone"],
+                            state["torneo"]["ripescate"])
+                        pianifica_torneo(state)
+                        state["fase"] = "eliminazione"
                 st.rerun()
         else:
             st.info("Conferma tutti i match per avanzare")
@@ -41,26 +58,42 @@ def render_gironi(state):
     st.divider()
     
     # Tabs per girone
-    nomi_gironi = [g["nome"] for g in state["gironi"]]
+    gironi = state["gironi"]
+    nomi_gironi = [g["nome"] for g in gironi] if len(gironi) <= MAX_TAB_GIRONI else ["🏐 Gironi"]
     nomi_gironi.append("📊 Classifiche")
+    nomi_gironi.append("🗓️ Calendario")
     tabs = st.tabs(nomi_gironi)
     
-    for i, g in enumerate(state["gironi"]):
-        with tabs[i]:
-            _render_girone(state, g, i)
+    if len(gironi) <= MAX_TAB_GIRONI:
+        for i, g in enumerate(gironi):
+            with tabs[i]:
+                _render_girone(state, g, i)
+    else:
+        with tabs[0]:
+            i = st.selectbox("Girone", range(len(gironi)), format_func=lambda i: gironi[i]["nome"],
+                             key="sel_girone")
+            _render_girone(state, gironi[i], i)
     
-    with tabs[-1]:
+    with tabs[-2]:
         _render_classifiche_gironi(state)
+    
+    with tabs[-1]:
+        render_calendario(state)
 
 
 def _render_girone(state, girone, girone_idx):
     st.markdown(f"### {girone['nome']}")
     
     for j, partita in enumerate(girone["partite"]):
-        render_match_card(state, partita, label=f"{girone['nome']} · Match {j+1}")
+        giornata = partita.get("giornata")
+        dettaglio = f"Giornata {giornata}" if giornata else f"Match {j+1}"
+        render_match_card(state, partita, label=f"{girone['nome']} · {dettaglio}")
         
         if not partita["confermata"]:
             _render_scoreboard_live(state, partita, f"g{girone_idx}_p{j}")
+        elif state["fase"] == "gironi":
+            # a tabellone generato le teste di serie non cambiano più
+            render_correzione_risultato(state, partita, f"g{girone_idx}_p{j}")
         
         st.markdown("---")
 
@@ -72,6 +105,7 @@ def _render_scoreboard_live(state, partita, key_prefix):
     torneo = state["torneo"]
     formato = torneo["formato_set"]
     pmax = torneo["punteggio_max"]
+    revisione_letta(partita, key_prefix)
     
     with st.expander("📝 Inserisci Risultato", expanded=False):
         n_set = 1 if formato == "Set Unico" else 3
@@ -89,64 +123,52 @@ def _render_scoreboard_live(state, partita, key_prefix):
                                      key=f"{key_prefix}_s{s}_p2")
             punteggi_inseriti.append((p1, p2))
         
-        # Battuta
-        battuta = st.radio(
+        # Battuta: scritta solo quando questa postazione la cambia, così due
+        # sessioni aperte sulla stessa partita non se la contendono a ogni rerun
+        st.radio(
             "🏐 In battuta",
-            [sq1["nome"], sq2["nome"]],
+            [1, 2],
+            index=partita["in_battuta"] - 1,
+            format_func=lambda i: sq1["nome"] if i == 1 else sq2["nome"],
             horizontal=True,
-            key=f"{key_prefix}_battuta"
+            key=f"{key_prefix}_battuta",
+            on_change=_cambia_battuta, args=(state, partita, f"{key_prefix}_battuta")
         )
-        partita["in_battuta"] = 1 if battuta == sq1["nome"] else 2
         
         if st.button("✅ CONFERMA RISULTATO", key=f"{key_prefix}_confirm", use_container_width=True):
-            # Calcola set vinti
-            s1v, s2v = 0, 0
-            punteggi_validi = []
-            for p1, p2 in punteggi_inseriti:
-                if p1 > 0 or p2 > 0:
-                    if p1 > p2: s1v += 1
-                    else: s2v += 1
-                    punteggi_validi.append((p1, p2))
+            punteggi_validi = [(p1, p2) for p1, p2 in punteggi_inseriti if p1 > 0 or p2 > 0]
             
             if not punteggi_validi:
                 st.error("Inserisci almeno un set con punteggio.")
                 return
             
-            partita["punteggi"] = punteggi_validi
-            partita["set_sq1"] = s1v
-            partita["set_sq2"] = s2v
-            partita["vincitore"] = partita["sq1"] if s1v > s2v else partita["sq2"]
-            partita["confermata"] = True
-            aggiorna_classifica_squadra(state, partita)
-            save_state(state)
-            st.success("✅ Risultato confermato e classifica aggiornata!")
-            st.rerun()
+            def conferma():
+                imposta_risultato(partita, punteggi_validi)
+                aggiorna_classifica_squadra(state, partita)
+            if applica_a_partita(state, partita, key_prefix, conferma):
+                st.success("✅ Risultato confermato e classifica aggiornata!")
+                st.rerun()
         
         if st.button("🎲 Simula questo match", key=f"{key_prefix}_sim"):
-            simula_partita(state, partita)
-            if state["simulazione_al_ranking"]:
-                aggiorna_classifica_squadra(state, partita)
-            save_state(state)
-            st.rerun()
+            def simula():
+                simula_partita(state, partita)
+                if state["simulazione_al_ranking"]:
+                    aggiorna_classifica_squadra(state, partita)
+            if applica_a_partita(state, partita, key_prefix, simula):
+                st.rerun()
+
+
+def _cambia_battuta(state, partita, key):
+    with modifica():
+        partita["in_battuta"] = st.session_state[key]
 
 
 def _render_classifiche_gironi(state):
-    for girone in state["gironi"]:
+    q, ripescate = state["torneo"]["qualificate_girone"], state["torneo"]["ripescate"]
+    # Classifiche dal vivo (dalle partite confermate), come sul tabellone pubblico
+    for girone, squadre_ord in classifiche_gironi(state["gironi"], q, ripescate):
         st.markdown(f"### 📊 Classifica {girone['nome']}")
         
-        # Calcola classifica dal vivo
-        squadre_dati = []
-        for sid in girone["squadre"]:
-            sq = get_squadra_by_id(state, sid)
-            if sq:
-                squadre_dati.append(sq)
-        
-        squadre_ord = sorted(squadre_dati, key=lambda s: (
-            -s["punti_classifica"], -s["vittorie"],
-            -(s["set_vinti"] - s["set_persi"]),
-            -(s["punti_fatti"] - s["punti_subiti"])
-        ))
-        
         # HTML table
         html = """
         <table class="rank-table">
@@ -156,15 +178,15 @@ def _render_classifiche_gironi(state):
         </tr>"""
         
         pos_cls = {1: "gold", 2: "silver", 3: "bronze"}
-        for i, sq in enumerate(squadre_ord):
-            pos = i + 1
+        for sq in squadre_ord:
+            pos = sq["posizione"]
             cls = pos_cls.get(pos, "")
-            qualif = "🟢" if pos <= 2 else ""
+            qualif = {"diretta": "🟢", "ripescata": "🟡"}.get(sq["qualifica"], "")
             html += f"""
             <tr>
                 <td><span class="rank-pos {cls}">{pos}</span></td>
-                <td style="text-align:left;font-weight:600">{qualif} {sq['nome']}</td>
-                <td style="font-weight:700;color:var(--accent-gold)">{sq['punti_classifica']}</td>
+                <td style="text-align:left;font-weight:600">{qualif} {nome_squadra(state, sq['id'])}</td>
+                <td style="font-weight:700;color:var(--accent-gold)">{sq['punti']}</td>
                 <td style="color:var(--green)">{sq['vittorie']}</td>
                 <td style="color:var(--accent-red)">{sq['sconfitte']}</td>
                 <td>{sq['set_vinti']}</td><td>{sq['set_persi']}</td>
@@ -173,17 +195,75 @@ def _render_classifiche_gironi(state):
         
         html += "</table>"
         st.markdown(html, unsafe_allow_html=True)
-        st.caption("🟢 Le prime 2 qualificate ai Playoff")
+        st.caption(f"🟢 Le prime {q} qualificate ai Playoff"
+                   + (f" · 🟡 tra le {ripescate} migliori {q + 1}ª" if ripescate else "")
+                   + " · Parità: vittorie, quoziente set, quoziente punti, scontro diretto")
         st.markdown("---")
+    
+    _render_tabellone_proiettato(state)
+    
+    if st.toggle("📈 Probabilità live (Monte Carlo)", key="toggle_previsioni"):
+        _render_probabilita(state)
+
+
+def _render_tabellone_proiettato(state):
+    """Primo turno del tabellone se i gironi finissero adesso."""
+    accoppiamenti = accoppiamenti_proiettati(state["gironi"], state["torneo"]["qualificate_girone"],
+                                             state["torneo"]["ripescate"])
+    if not accoppiamenti:
+        return
+    st.markdown("### 🔮 Tabellone Proiettato")
+    righe = []
+    for sq1, sq2 in accoppiamenti:
+        if sq1 and sq2:
+            righe.append(f"- **{nome_squadra(state, sq1)}** vs **{nome_squadra(state, sq2)}**")
+        elif sq1 or sq2:
+            righe.append(f"- **{nome_squadra(state, sq1 or sq2)}** — bye al turno successivo")
+    st.markdown("\n".join(righe))
+    st.caption("Teste di serie dalle classifiche attuali; squadre dello stesso girone il più lontano possibile")
+
+
+def _render_probabilita(state):
+    """Probabilità di qualificazione/semifinale/vittoria, ricalcolate solo se cambia un risultato."""
+    from simulazione import prevedi_torneo
+    
+    impronta = tuple(
+        (p["id"], p["confermata"], tuple(map(tuple, p["punteggi"])))
+        for g in state["gironi"] for p in g["partite"]
+    )
+    # cache della sessione: lo stato condiviso non si scrive durante una lettura
+    cache = st.session_state.get("previsioni")
+    if not cache or cache[0] != impronta:
+        with st.spinner("Simulazione tornei in corso..."):
+            cache = (impronta, prevedi_torneo(state, n_sim=PREVISIONI_N_SIM,
+                                                seed=state["torneo"]["seed"]))
+        st.session_state["previsioni"] = cache
+    prob = cache[1]
+    
+    righe = sorted(prob.items(), key=lambda kv: (-kv[1]["vittoria"], -kv[1]["qualificazione"]))
+    html = """
+    <table class="rank-table">
+    <tr><th style="text-align:left">SQUADRA</th><th>QUALIFICAZIONE</th><th>SEMIFINALE</th><th>VITTORIA</th></tr>"""
+    for sid, p in righe:
+        html += f"""
+        <tr>
+            <td style="text-align:left;font-weight:600">{nome_squadra(state, sid)}</td>
+            <td>{p['qualificazione']*100:.1f}%</td>
+            <td>{p['semifinale']*100:.1f}%</td>
+            <td style="font-weight:700;color:var(--accent-gold)">{p['vittoria']*100:.1f}%</td>
+        </tr>"""
+    html += "</table>"
+    st.markdown(html, unsafe_allow_html=True)
+    st.caption(f"Su {PREVISIONI_N_SIM:,} tornei simulati · forza squadre da punti fatti/subiti storici".replace(",", "."))
 
 
 def _simula_tutti(state):
-    for girone in state["gironi"]:
-        for partita in girone["partite"]:
-            if not partita["confermata"]:
-                simula_partita(state, partita)
-                if state["simulazione_al_ranking"]:
-                    aggiorna_classifica_squadra(state, partita)
-    save_state(state)
+    with modifica():
+        for girone in state["gironi"]:
+            for partita in girone["partite"]:
+                if not partita["confermata"]:
+                    simula_partita(state, partita)
+                    if state["simulazione_al_ranking"]:
+                        aggiorna_classifica_squadra(state, partita)
     st.success("🎲 Tutti i match simulati!")
     st.rerun()
@@ -3,9 +3,8 @@ fase_proclamazione.py — Fase 4: Proclamazione vincitori e Ranking globale
 """
 import streamlit as st
 import pandas as pd
-from data_manager import (
-    save_state, get_squadra_by_id, get_atleta_by_id
-)
+from data_manager import get_squadra_by_id, get_atleta_by_id
+from stato_condiviso import sostituisci_stato
 from ui_components import render_winner_banner, render_podio, render_career_card
 
 
@@ -58,7 +57,7 @@ def render_ranking_globale(state):
         
         # Punteggio ranking: punti per posizioni
         rank_pts = 0
-        for _, pos in s["storico_posizioni"]:
+        for _, pos, *_ in s["storico_posizioni"]:
             rank_pts += {1: 100, 2: 70, 3: 50}.get(pos, 20)
         
         atleti_stats.append({
@@ -161,8 +160,8 @@ def render_schede_carriera(state):
         storico = s["storico_posizioni"]
         
         df_data = {
-            "Torneo": [t for t, _ in storico],
-            "Posizione": [p for _, p in storico],
+            "Torneo": [t for t, *_ in storico],
+            "Posizione": [p for _, p, *_ in storico],
         }
         df = pd.DataFrame(df_data)
         
@@ -178,7 +177,7 @@ def render_schede_carriera(state):
         # Storico tabella
         st.markdown("##### Storico Tornei")
         medals = {1: "🥇", 2: "🥈", 3: "🥉"}
-        for torneo_nome, pos in storico:
+        for torneo_nome, pos, *_ in storico:
             icon = medals.get(pos, f"#{pos}")
             st.markdown(f"• {icon} **{torneo_nome}** — {pos}° posto")
 
@@ -197,10 +196,12 @@ def _render_nuovo_torneo(state):
         nuovo = empty_state()
         nuovo["atleti"] = atleti_preservati
         nuovo["ranking_globale"] = ranking_preservato
+        nuovo["archivio_tornei"] = state.get("archivio_tornei", {})
+        nuovo["contatori_id"] = state.get("contatori_id", {})
         
         # Resetta sessione
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         
-        save_state(nuovo)
+        sostituisci_stato(nuovo)
         st.rerun()
@@ -2,37 +2,82 @@
 fase_setup.py — Fase 1: Configurazione torneo e iscrizione squadre
 """
 import streamlit as st
+from datetime import datetime
 from data_manager import (
-    new_atleta, new_squadra, get_atleta_by_id,
-    save_state, genera_gironi
+    new_atleta, new_squadra, get_atleta_by_nome, nomi_atleti_squadra,
+    aggiungi_atleta, aggiungi_squadra, rimuovi_squadra,
+    composizione_gironi, gironi_da_composizione, nome_girone,
+    rng_torneo, nuovo_seed, get_squadra_by_id
 )
+from bracket_engine import genera_doppia_eliminazione
+from calendario import pianifica_torneo
+from ranking_engine import punti_squadre
+from stato_condiviso import modifica
+from piano_gironi import piano_torneo
 
 
 def render_setup(state):
     st.markdown("## ⚙️ Configurazione Torneo")
     
     col1, col2 = st.columns([1, 1])
+    # i widget scrivono su una copia: lo stato condiviso cambia solo sotto modifica()
+    torneo = dict(state["torneo"])
     
     with col1:
         st.markdown("### 📋 Impostazioni Generali")
         
-        nome = st.text_input("Nome Torneo", value=state["torneo"]["nome"], placeholder="es. Summer Cup 2025")
-        state["torneo"]["nome"] = nome
+        nome = st.text_input("Nome Torneo", value=torneo["nome"], placeholder="es. Summer Cup 2025")
+        torneo["nome"] = nome
         
         tipo = st.selectbox("Tipo Tabellone", ["Gironi + Playoff", "Doppia Eliminazione"],
-                            index=["Gironi + Playoff", "Doppia Eliminazione"].index(state["torneo"]["tipo_tabellone"]))
-        state["torneo"]["tipo_tabellone"] = tipo
+                            index=["Gironi + Playoff", "Doppia Eliminazione"].index(torneo["tipo_tabellone"]))
+        torneo["tipo_tabellone"] = tipo
         
         formato = st.selectbox("Formato Set", ["Set Unico", "Best of 3"],
-                               index=["Set Unico", "Best of 3"].index(state["torneo"]["formato_set"]))
-        state["torneo"]["formato_set"] = formato
+                               index=["Set Unico", "Best of 3"].index(torneo["formato_set"]))
+        torneo["formato_set"] = formato
         
         pmax = st.number_input("Punteggio Massimo Set", min_value=11, max_value=30,
-                               value=state["torneo"]["punteggio_max"])
-        state["torneo"]["punteggio_max"] = pmax
+                               value=torneo["punteggio_max"])
+        torneo["punteggio_max"] = pmax
         
         data = st.date_input("Data Torneo")
-        state["torneo"]["data"] = str(data)
+        torneo["data"] = str(data)
+        
+        seed = st.number_input("Seed Casuale", min_value=0, max_value=2**32 - 1,
+                               value=int(torneo["seed"]),
+                               help="Stesso seed = stessi gironi, sorteggi e simulazioni")
+        torneo["seed"] = int(seed)
+        
+        sorteggio = st.selectbox("Sorteggio Gironi", ["Teste di serie", "Casuale"],
+                                 index=["Teste di serie", "Casuale"].index(torneo["sorteggio_gironi"]),
+                                 help="Teste di serie: squadre distribuite a serpentina per punti ranking")
+        torneo["sorteggio_gironi"] = sorteggio
+        
+        st.markdown("### 🗓️ Campi e Orari")
+        c1, c2, c3, c4 = st.columns(4)
+        with c1:
+            torneo["campi"] = int(st.number_input("Campi", 1, 40, torneo["campi"]))
+        with c2:
+            torneo["durata_slot"] = int(st.number_input(
+                "Min. per partita", 10, 120, torneo["durata_slot"], step=5))
+        with c3:
+            inizio = st.text_input("Inizio", torneo["ora_inizio"], help="Formato HH:MM")
+            try:
+                torneo["ora_inizio"] = datetime.strptime(inizio, "%H:%M").strftime("%H:%M")
+            except ValueError:
+                st.error("Formato HH:MM")
+        with c4:
+            torneo["riposo_slot"] = int(st.number_input(
+                "Riposo (slot)", 0, 5, torneo["riposo_slot"],
+                help="Turni di pausa minimi tra due partite dello stesso atleta"))
+        
+        if tipo == "Gironi + Playoff":
+            _render_formula_gironi(torneo)
+    
+    if torneo != state["torneo"]:
+        with modifica():
+            state["torneo"].update(torneo)
     
     with col2:
         st.markdown("### 👤 Gestione Atleti")
@@ -45,6 +90,13 @@ def render_setup(state):
     st.divider()
     
     n_squadre = len(state["squadre"])
+    con_gironi = state["torneo"]["tipo_tabellone"] == "Gironi + Playoff"
+    piano = piano_torneo(state) if con_gironi and n_squadre >= 4 else None
+    if piano and not piano["errori"]:
+        _render_anteprima_gironi(state, piano)
+    if n_squadre >= 4:
+        _render_scenari(state, piano)
+    
     col_a, col_b = st.columns([2, 1])
     
     with col_a:
@@ -52,33 +104,100 @@ def render_setup(state):
             st.warning(f"⚠️ Servono almeno 4 squadre per avviare il torneo. ({n_squadre}/4 iscritte)")
         elif not nome:
             st.warning("⚠️ Inserisci il nome del torneo.")
+        elif piano and piano["errori"]:
+            for errore in piano["errori"]:
+                st.warning(f"⚠️ {errore}")
         else:
             st.success(f"✅ {n_squadre} squadre iscritte. Pronto per avviare!")
+            if piano:
+                _render_riepilogo_piano(piano)
     
     with col_b:
-        if n_squadre >= 4 and nome:
+        if n_squadre >= 4 and nome and not (piano and piano["errori"]):
             if st.button("🚀 AVVIA TORNEO →", use_container_width=True):
-                # Genera gironi
-                ids = [s["id"] for s in state["squadre"]]
-                num_gironi = max(2, n_squadre // 4)
-                state["gironi"] = genera_gironi(ids, num_gironi)
-                state["fase"] = "gironi"
-                save_state(state)
+                with modifica():
+                    # un'altra sessione può aver già avviato il torneo
+                    if state["fase"] == "setup":
+                        ids = [s["id"] for s in state["squadre"]]
+                        if state["torneo"]["tipo_tabellone"] == "Doppia Eliminazione":
+                            # Niente gironi: sorteggio diretto nel tabellone vincenti
+                            rng_torneo(state, "bracket").shuffle(ids)
+                            state["bracket"] = genera_doppia_eliminazione(state, ids)
+                            state["fase"] = "eliminazione"
+                        else:
+                            state["gironi"] = gironi_da_composizione(state, _sorteggia_gironi(state, piano))
+                            state["fase"] = "gironi"
+                        pianifica_torneo(state)
                 st.rerun()
 
 
+def _render_formula_gironi(t):
+    st.markdown("### 🧩 Formula Gironi")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        t["squadre_per_girone"] = int(st.number_input("Squadre per girone", 2, 16, t["squadre_per_girone"],
+                                                      help="Dimensione ideale dei gironi"))
+    with c2:
+        t["girone_min"] = int(st.number_input("Minimo", 2, 16, t["girone_min"]))
+    with c3:
+        t["girone_max"] = int(st.number_input("Massimo", 2, 16, t["girone_max"]))
+    c1, c2 = st.columns(2)
+    with c1:
+        t["qualificate_girone"] = int(st.number_input("Qualificate per girone", 1, 8, t["qualificate_girone"]))
+    with c2:
+        t["ripescate"] = int(st.number_input(
+            f"Migliori {t['qualificate_girone'] + 1}ª ripescate", 0, 64, t["ripescate"],
+            help="Posti extra nel tabellone per le migliori classificate alla posizione successiva"))
+
+
+def _render_riepilogo_piano(piano):
+    conteggio = {}
+    for d in piano["dimensioni"]:
+        conteggio[d] = conteggio.get(d, 0) + 1
+    gironi = " + ".join(f"{n}×{d}" for d, n in sorted(conteggio.items(), reverse=True))
+    ore, minuti = divmod(piano["durata_min"], 60)
+    st.info(f"🧩 {piano['num_gironi']} gironi ({gironi} squadre) · {piano['qualificate']} qualificate · "
+            f"{piano['partite_gironi']} + {piano['partite_tabellone']} partite · "
+            f"durata stimata {ore}h{minuti:02d} (fine ~{piano['fine']})")
+
+
+def _sorteggia_gironi(state, piano):
+    """Composizione dei gironi dal seed del torneo: l'anteprima e l'avvio danno
+    lo stesso sorteggio. Non crea partite, quindi non consuma id."""
+    ids = [s["id"] for s in state["squadre"]]
+    forza = punti_squadre(state, ids) if state["torneo"]["sorteggio_gironi"] == "Teste di serie" else None
+    return composizione_gironi(ids, piano["num_gironi"], rng=rng_torneo(state, "gironi"), forza=forza)
+
+
+def _render_anteprima_gironi(state, piano):
+    with st.expander("🎲 Anteprima Sorteggio Gironi", expanded=False):
+        composizione = _sorteggia_gironi(state, piano)
+        forza = punti_squadre(state, [s["id"] for s in state["squadre"]])
+        cols = st.columns(min(len(composizione), 4))
+        for i, squadre in enumerate(composizione):
+            with cols[i % len(cols)]:
+                totale = sum(forza[sid] for sid in squadre)
+                st.markdown(f"**{nome_girone(i)}** · {totale} pt")
+                for sid in squadre:
+                    sq = get_squadra_by_id(state, sid)
+                    st.markdown(f"• {sq['nome']} ({forza[sid]})")
+        if st.button("🔀 Nuovo Sorteggio", key="btn_risorteggio"):
+            with modifica():
+                state["torneo"]["seed"] = nuovo_seed()
+            st.rerun()
+
+
 def _render_atleti_manager(state):
-    nomi_esistenti = [a["nome"] for a in state["atleti"]]
-    
     with st.expander("➕ Aggiungi Nuovo Atleta", expanded=False):
         nuovo_nome = st.text_input("Nome Atleta", key="new_atleta_name", placeholder="Nome Cognome")
         if st.button("Aggiungi Atleta", key="btn_add_atleta"):
-            if nuovo_nome.strip() and nuovo_nome.strip() not in nomi_esistenti:
-                state["atleti"].append(new_atleta(nuovo_nome.strip()))
-                save_state(state)
+            gia_presente = get_atleta_by_nome(state, nuovo_nome.strip()) is not None
+            if nuovo_nome.strip() and not gia_presente:
+                with modifica():
+                    aggiungi_atleta(state, new_atleta(state, nuovo_nome.strip()))
                 st.success(f"✅ {nuovo_nome} aggiunto!")
                 st.rerun()
-            elif nuovo_nome.strip() in nomi_esistenti:
+            elif gia_presente:
                 st.error("Atleta già presente.")
             else:
                 st.error("Inserisci un nome valido.")
@@ -116,8 +235,8 @@ def _render_squadre_manager(state):
     
     if st.button("➕ Iscrive Squadra", key="btn_add_squadra"):
         # Trova atleta IDs
-        a1_obj = next((a for a in state["atleti"] if a["nome"] == atleta1), None)
-        a2_obj = next((a for a in state["atleti"] if a["nome"] == atleta2), None)
+        a1_obj = get_atleta_by_nome(state, atleta1)
+        a2_obj = get_atleta_by_nome(state, atleta2)
         
         if not a1_obj or not a2_obj:
             st.error("Atleti non trovati.")
@@ -125,13 +244,12 @@ def _render_squadre_manager(state):
             st.error("Inserisci il nome della squadra.")
         else:
             # Verifica atleti non già in squadra
-            atleti_in_squadra = [aid for sq in state["squadre"] for aid in sq["atleti"]]
+            atleti_in_squadra = {aid for sq in state["squadre"] for aid in sq["atleti"]}
             if a1_obj["id"] in atleti_in_squadra or a2_obj["id"] in atleti_in_squadra:
                 st.warning("⚠️ Uno degli atleti è già iscritto in un'altra squadra.")
             else:
-                sq = new_squadra(nome_sq, a1_obj["id"], a2_obj["id"])
-                state["squadre"].append(sq)
-                save_state(state)
+                with modifica():
+                    aggiungi_squadra(state, new_squadra(state, nome_sq, a1_obj["id"], a2_obj["id"]))
                 st.success(f"✅ Squadra '{nome_sq}' iscritta!")
                 st.rerun()
     
@@ -139,12 +257,62 @@ def _render_squadre_manager(state):
     if state["squadre"]:
         st.markdown(f"#### Squadre Iscritte ({len(state['squadre'])})")
         for i, sq in enumerate(state["squadre"]):
-            a_names = [get_atleta_by_id(state, aid)["nome"] for aid in sq["atleti"] if get_atleta_by_id(state, aid)]
+            a_names = nomi_atleti_squadra(state, sq)
             col_s, col_btn = st.columns([4, 1])
             with col_s:
                 st.markdown(f"**{sq['nome']}** — {' / '.join(a_names)}")
             with col_btn:
                 if st.button("🗑️", key=f"del_sq_{i}"):
-                    state["squadre"].pop(i)
-                    save_state(state)
+                    with modifica():
+                        rimuovi_squadra(state, sq["id"])
                     st.rerun()
+
+
+def _render_scenari(state, piano=None):
+    """Confronto di formati alternativi simulando il torneo con le squadre iscritte."""
+    with st.expander("🧪 Scenari What-If (simulazione formati)", expanded=False):
+        n_squadre = len(state["squadre"])
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            opzioni_gironi = list(range(1, max(2, n_squadre // 2) + 1))
+            num_gironi = st.multiselect("N° gironi", opzioni_gironi,
+                                        default=[piano["num_gironi"] if piano and not piano["errori"]
+                                                 else max(2, n_squadre // 4)],
+                                        key="wi_gironi")
+        with col2:
+            punteggi = st.multiselect("Punteggio max", [15, 18, 21, 25],
+                                      default=[state["torneo"]["punteggio_max"]], key="wi_pmax")
+        with col3:
+            formati = st.multiselect("Formato", ["Set Unico", "Best of 3"],
+                                     default=["Set Unico", "Best of 3"], key="wi_formati")
+        with col4:
+            n_rep = st.number_input("Tornei per scenario", 50, 20000, 500, step=50, key="wi_rep")
+        
+        if st.button("▶️ Simula Scenari", key="btn_scenari", use_container_width=True):
+            import pandas as pd
+            from scenari import griglia_scenari, esegui_scenari
+            from simulazione import forza_squadre
+            
+            sids = [sq["id"] for sq in state["squadre"]]
+            forza = dict(zip(sids, forza_squadre(state, sids)))
+            scenari = griglia_scenari(num_gironi, punteggi, formati,
+                                      state["torneo"]["qualificate_girone"], state["torneo"]["ripescate"])
+            if not scenari:
+                st.warning("Seleziona almeno un valore per ogni parametro.")
+                return
+            with st.spinner(f"Simulazione di {len(scenari) * n_rep} tornei..."):
+                risultati = esegui_scenari(sids, forza, scenari, n_rep=int(n_rep),
+                                           seed=state["torneo"]["seed"])
+            
+            df = pd.DataFrame(risultati).rename(columns={
+                "num_gironi": "Gironi", "punteggio_max": "Pt max", "formato_set": "Formato",
+                "qualificate_girone": "Qualificate", "ripescate": "Ripescate",
+                "tornei_simulati": "Tornei", "partite_per_torneo": "Partite",
+                "rally_per_torneo": "Rally totali", "rally_per_partita": "Rally/partita",
+                "tasso_sorprese": "% sorprese", "vittoria_favorita": "% vince favorita",
+                "squilibrio_gironi": "Squilibrio gironi",
+            })
+            df["% sorprese"] = (df["% sorprese"] * 100).round(1)
+            df["% vince favorita"] = (df["% vince favorita"] * 100).round(1)
+            st.dataframe(df.round(2), use_container_width=True, hide_index=True)
+            st.caption("Rally totali ≈ durata attesa · Squilibrio gironi = dev. standard della forza media dei gironi")
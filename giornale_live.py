@@ -0,0 +1,204 @@
+"""
+giornale_live.py — Giornale su disco del segnapunti live, per riprendere dopo un crash
+
+Ogni azione del segnapunti (apertura partita, evento, annullamento,
+chiusura) è una riga JSON in coda a GIORNALE_FILE. La scrittura arriva al
+sistema operativo a ogni punto (flush), quindi un refresh del browser, una
+websocket caduta o il riavvio del server non perdono nulla; l'fsync su disco
+è invece accorpato (al più uno ogni FSYNC_OGNI_S) per non rallentare il
+segnapunti; un timer sincronizza le righe rimaste in sospeso anche se non
+arrivano altri punti, così al più FSYNC_OGNI_S di gioco è esposto a un
+blackout. Le partite chiuse (risultato inviato o reset) vengono scartate
+quando il giornale si compatta: ogni COMPATTA_OLTRE righe scritte, contando
+anche quelle già nel file all'avvio, così il file (che recupera() e
+punteggi_live() rileggono per intero) non cresce da un torneo all'altro.
+
+All'apertura di una sessione recupera(pid) rigioca le righe della partita e
+restituisce il registro (registro_punti.py) da cui riprendere.
+punteggi_live() dà lo stato corrente di tutte le partite aperte, tenuto in
+memoria a ogni scrittura (per il tabellone pubblico, senza rileggere il file).
+"""
+import atexit, json, os, threading, time
+
+from data_manager import scrivi_file_atomico
+from registro_punti import nuovo_registro, aggiungi_evento, annulla_ultimo, ultimo_evento
+
+GIORNALE_FILE = "beach_volley_live.jsonl"
+FSYNC_OGNI_S = 1.0
+# Righe scritte dall'ultima compattazione oltre le quali il giornale si riscrive compatto
+COMPATTA_OLTRE = 5000
+
+_lock = threading.Lock()        # le sessioni Streamlit girano su thread diversi
+_file = None
+_ultimo_fsync = 0.0
+_timer = None           # fsync programmato per le righe in sospeso
+_righe = 0              # righe nel file (contate alla prima apertura)
+_righe_compatte = 0     # righe rimaste dopo l'ultima compattazione
+_live = None            # {pid: stato dopo l'ultimo evento}, caricato al primo punteggi_live()
+_versione = 0           # cresce a ogni scrittura
+
+
+def _apri_file():
+    """Apre il giornale in coda (sotto _lock); alla prima apertura conta le righe e compatta se serve."""
+    global _file, _righe
+    if _file is not None:
+        return
+    _file = open(GIORNALE_FILE, "a+", encoding="utf-8")
+    _file.seek(0)
+    _righe = 0
+    while blocco := _file.read(1 << 16):
+        _righe += blocco.count("\n")
+    if _file.tell():
+        _file.seek(_file.tell() - 1)
+        if _file.read(1) != "\n":
+            _file.write("\n")   # non incollare la riga nuova a una troncata dal crash
+            _righe += 1
+    if _righe - _righe_compatte >= COMPATTA_OLTRE:
+        _compatta()
+        _apri_file()
+
+
+def _scrivi(record, fsync=False):
+    global _ultimo_fsync, _timer, _righe
+    riga = json.dumps(record, separators=(",", ":")) + "\n"
+    with _lock:
+        _apri_file()
+        _file.write(riga)
+        _file.flush()
+        _righe += 1
+        adesso = time.monotonic()
+        if fsync or adesso - _ultimo_fsync >= FSYNC_OGNI_S:
+            os.fsync(_file.fileno())
+            _ultimo_fsync = adesso
+        elif _timer is None:
+            _timer = threading.Timer(FSYNC_OGNI_S - (adesso - _ultimo_fsync), sincronizza)
+            _timer.daemon = True
+            _timer.start()
+        if _righe - _righe_compatte >= COMPATTA_OLTRE:
+            _compatta()
+
+
+@atexit.register
+def sincronizza():
+    """fsync delle righe ancora in attesa (dal timer e all'uscita)."""
+    global _ultimo_fsync, _timer
+    with _lock:
+        _timer = None
+        if _file is not None and not _file.closed:
+            _file.flush()
+            os.fsync(_file.fileno())
+            _ultimo_fsync = time.monotonic()
+
+
+def _pubblica(pid, reg=None):
+    global _versione
+    with _lock:
+        if _live is not None:
+            if reg is None:
+                _live.pop(pid, None)
+            else:
+                _live[pid] = reg["stati"][-1]
+        _versione += 1
+
+
+# ─── SCRITTURA ───────────────────────────────────────────────────────────────
+
+def apri(pid, reg):
+    """Apre la partita nel giornale: al primo rally, non alla sola selezione."""
+    reg["nel_giornale"] = True
+    _scrivi({"p": pid, "o": "apri", "pmax": reg["pmax"], "formato": reg["formato"],
+             "inizio": reg["inizio"]})
+    _pubblica(pid, reg)
+
+
+def evento(pid, reg):
+    """Registra l'ultimo evento del registro (appena aggiunto con registra())."""
+    tipo, decimi = ultimo_evento(reg)
+    _scrivi({"p": pid, "o": "e", "t": tipo, "d": decimi})
+    _pubblica(pid, reg)
+
+
+def annulla(pid, reg, n=1):
+    """Registra n eventi appena tolti dal registro."""
+    if n:
+        _scrivi({"p": pid, "o": "u", "n": n})
+        _pubblica(pid, reg)
+
+
+def chiudi(pid):
+    """La partita non ha più stato live: risultato inviato o segnapunti azzerato."""
+    _scrivi({"p": pid, "o": "chiudi"}, fsync=True)
+    _pubblica(pid)
+
+
+# ─── LETTURA ─────────────────────────────────────────────────────────────────
+
+def _leggi():
+    """{pid: [record]} delle partite aperte, nell'ordine del giornale."""
+    aperte = {}
+    try:
+        with open(GIORNALE_FILE, encoding="utf-8") as f:
+            for riga in f:
+                try:
+                    r = json.loads(riga)
+                except ValueError:
+                    continue        # riga troncata da un crash a metà scrittura
+                if r["o"] == "apri":
+                    aperte[r["p"]] = [r]
+                elif r["o"] == "chiudi":
+                    aperte.pop(r["p"], None)
+                elif r["p"] in aperte:
+                    aperte[r["p"]].append(r)
+    except FileNotFoundError:
+        pass
+    return aperte
+
+
+def _rigioca(records):
+    testa = records[0]
+    reg = nuovo_registro(testa["pmax"], testa["formato"], testa["inizio"])
+    reg["nel_giornale"] = True
+    for r in records[1:]:
+        if r["o"] == "e":
+            aggiungi_evento(reg, r["t"], r["d"])
+        else:
+            for _ in range(r["n"]):
+                annulla_ultimo(reg)
+    return reg
+
+
+def recupera(pid):
+    """Registro live della partita dal giornale, o None se non c'è nulla da riprendere."""
+    with _lock:
+        _apri_file()
+        _file.flush()
+        records = _leggi().get(pid)
+    return _rigioca(records) if records else None
+
+
+def punteggi_live():
+    """(versione, {pid: stato}) delle partite aperte; la versione cambia a ogni scrittura."""
+    global _live
+    with _lock:
+        if _live is None:
+            _apri_file()
+            _file.flush()
+            _live = {pid: _rigioca(records)["stati"][-1] for pid, records in _leggi().items()}
+        return _versione, dict(_live)
+
+
+def compatta():
+    """Riscrive il giornale con le sole partite aperte, un evento per riga."""
+    with _lock:
+        _compatta()
+
+
+def _compatta():
+    global _file, _righe, _righe_compatte
+    if _file is not None:
+        _file.close()
+        _file = None
+    righe = [json.dumps(r, separators=(",", ":"))
+             for records in _leggi().values() for r in records]
+    scrivi_file_atomico(GIORNALE_FILE, "".join(r + "\n" for r in righe), generazioni=0)
+    _righe = _righe_compatte = len(righe)
@@ -3,21 +3,25 @@ incassi.py — Gestione incassi torneo + PDF grafici
 """
 import streamlit as st
 import json
-from pathlib import Path
-from data_manager import save_state, get_squadra_by_id, get_atleta_by_id
-
-INCASSI_FILE = "beach_volley_incassi.json"
+from data_manager import (
+    get_squadra_by_id, nomi_atleti_squadra, INCASSI_FILE,
+    scrivi_file_atomico, leggi_json_con_recupero, storage_backend
+)
 
 
 def load_incassi():
-    if Path(INCASSI_FILE).exists():
-        with open(INCASSI_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"tornei": {}}
+    backend = storage_backend()
+    if backend:
+        return backend.carica_incassi()
+    data = leggi_json_con_recupero(INCASSI_FILE)
+    return data if data is not None else {"tornei": {}}
 
 def save_incassi(data):
-    with open(INCASSI_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    backend = storage_backend()
+    if backend:
+        backend.salva_incassi(data)
+        return
+    scrivi_file_atomico(INCASSI_FILE, json.dumps(data, ensure_ascii=False, indent=2))
 
 
 def render_incassi(state):
@@ -79,7 +83,7 @@ def _render_torneo_corrente(state, torneo_inc, torneo_nome, incassi_data):
         col1, col2, col3, col4 = st.columns([3, 1, 1, 2])
         
         # Nomi atleti
-        atleti_nomi = [get_atleta_by_id(state, aid)["nome"] for aid in sq["atleti"] if get_atleta_by_id(state, aid)]
+        atleti_nomi = nomi_atleti_squadra(state, sq)
         
         with col1:
             st.markdown(f"""
@@ -285,7 +289,7 @@ def _genera_pdf_incassi(state, incassi_data, torneo_nome, includi_dettaglio, inc
             sq = get_squadra_by_id(state, p["squadra_id"])
             if not sq:
                 continue
-            atleti = [get_atleta_by_id(state, aid)["nome"] for aid in sq["atleti"] if get_atleta_by_id(state, aid)]
+            atleti = nomi_atleti_squadra(state, sq)
             stato = "✓ PAGATO" if p.get("pagato") else "⏳ PENDENTE"
             if p.get("pagato"):
                 totale_inc += p["importo"]
@@ -0,0 +1,106 @@
+"""
+piano_gironi.py — Formula a gironi: quanti gironi, di che dimensione, quante qualificate
+
+Dal numero di iscritti e dalle preferenze dell'organizzatore (dimensione
+ideale, minima e massima dei gironi, qualificate per girone, ripescate tra
+le migliori classificate alla posizione successiva) calcola il numero di
+gironi e stima partite e durata con lo stesso modello a slot di
+calendario.py, prima di generare qualsiasi partita.
+"""
+import math
+from datetime import datetime
+
+from calendario import orario_slot
+
+
+def dimensioni_gironi(n_squadre, num_gironi):
+    """Dimensioni dei gironi come le produce genera_gironi(): differiscono al più di 1."""
+    base, extra = divmod(n_squadre, num_gironi)
+    return [base + 1] * extra + [base] * (num_gironi - extra)
+
+
+def numero_gironi(n_squadre, dimensione=4, minimo=3, massimo=5):
+    """Numero di gironi con dimensioni tra minimo e massimo, il più vicino alla dimensione ideale.
+
+    None se nessuna suddivisione rispetta i limiti.
+    """
+    possibili = [g for g in range(1, n_squadre // max(minimo, 1) + 1)
+                 if math.ceil(n_squadre / g) <= massimo and n_squadre // g >= minimo]
+    if not possibili:
+        return None
+    # a parità di distanza, più gironi = gironi più corti
+    return min(possibili, key=lambda g: (abs(n_squadre / g - dimensione), -g))
+
+
+def _giornate(dimensione):
+    return dimensione - 1 if dimensione % 2 == 0 else dimensione
+
+
+def _slot_tabellone(qualificate, campi, riposo):
+    """Slot del tabellone a eliminazione diretta, turno dopo turno."""
+    if qualificate < 2:
+        return 0
+    dim = 2 ** math.ceil(math.log2(qualificate))
+    turni = [qualificate - dim // 2]           # primo turno senza i bye
+    m = dim // 4
+    while m >= 1:
+        turni.append(m)
+        m //= 2
+    if qualificate >= 4:
+        turni[-1] += 1                          # finale 3°/4° posto
+    return sum(math.ceil(t / campi) for t in turni) + riposo * (len(turni) - 1)
+
+
+def _fine(inizio, durata_slot, slot):
+    """Orario di fine, con i giorni in più se si va oltre la mezzanotte."""
+    t = datetime.strptime(inizio, "%H:%M")
+    giorni = (t.hour * 60 + t.minute + durata_slot * slot) // (24 * 60)
+    return orario_slot(inizio, durata_slot, slot) + (f" (+{giorni}g)" if giorni else "")
+
+
+def piano_gironi(n_squadre, dimensione=4, minimo=3, massimo=5, qualificate=2, ripescate=0,
+                 campi=2, durata_slot=30, riposo=1, inizio="09:00"):
+    """Formula del torneo e stima dei tempi; "errori" non vuoto = formula non valida."""
+    errori = []
+    num = numero_gironi(n_squadre, dimensione, minimo, massimo)
+    if num is None:
+        errori.append(f"Impossibile dividere {n_squadre} squadre in gironi da {minimo} a {massimo}.")
+        num = max(1, round(n_squadre / max(dimensione, 1)))
+    dimensioni = dimensioni_gironi(n_squadre, num)
+    if qualificate > min(dimensioni):
+        errori.append(f"{qualificate} qualificate per girone ma il girone più piccolo ha "
+                      f"{min(dimensioni)} squadre.")
+    candidate = sum(d > qualificate for d in dimensioni)
+    if ripescate > candidate:
+        errori.append(f"Solo {candidate} gironi hanno una {qualificate + 1}ª classificata "
+                      f"da ripescare.")
+    totale_qualificate = num * qualificate + ripescate
+    if totale_qualificate < 2:
+        errori.append("Servono almeno 2 qualificate per il tabellone.")
+
+    partite_gironi = sum(d * (d - 1) // 2 for d in dimensioni)
+    partite_tabellone = max(totale_qualificate - 1, 0) + (totale_qualificate >= 4)
+    # limite di capienza dei campi o catena di giornate con il riposo, il più lungo dei due
+    slot_gironi = max(math.ceil(partite_gironi / campi),
+                      (_giornate(max(dimensioni)) - 1) * (riposo + 1) + 1)
+    slot_tabellone = _slot_tabellone(totale_qualificate, campi, riposo)
+    slot_totali = slot_gironi + (riposo + slot_tabellone if slot_tabellone else 0)
+    return {
+        "num_gironi": num,
+        "dimensioni": dimensioni,
+        "qualificate": totale_qualificate,
+        "partite_gironi": partite_gironi,
+        "partite_tabellone": partite_tabellone,
+        "slot": slot_totali,
+        "durata_min": slot_totali * durata_slot,
+        "fine": _fine(inizio, durata_slot, slot_totali),
+        "errori": errori,
+    }
+
+
+def piano_torneo(state):
+    """piano_gironi() con gli iscritti e le impostazioni del torneo."""
+    t = state["torneo"]
+    return piano_gironi(len(state["squadre"]), t["squadre_per_girone"], t["girone_min"],
+                        t["girone_max"], t["qualificate_girone"], t["ripescate"],
+                        t["campi"], t["durata_slot"], t["riposo_slot"], t["ora_inizio"])
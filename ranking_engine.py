@@ -0,0 +1,163 @@
+"""
+ranking_engine.py — Classifica globale materializzata e aggiornata in modo incrementale
+
+I punti di ogni voce dello storico dipendono solo dal record del torneo in
+state["archivio_tornei"], che non cambia più dopo la proclamazione.
+La tabella vive nella chiave runtime state["_ranking"] ed è legata a
+state["ranking_versione"], che trasferisci_al_ranking() incrementa segnando in
+state["_ranking_sporchi"] gli atleti toccati: alla lettura successiva si
+ricalcolano solo quelle righe e si riposizionano nella lista ordinata.
+"""
+from bisect import bisect_left, insort
+
+
+def calcola_punti_ranking(pos, n_squadre):
+    """Assegna punti in proporzione al numero di squadre, a scaglioni da 10."""
+    # n_squadre * 10 = punteggio massimo (1° posto)
+    # Ogni posizione sottrae 10 punti
+    pts_massimi = n_squadre * 10
+    pts = pts_massimi - ((pos - 1) * 10)
+    return max(0, pts)
+
+
+def _get_n_squadre_torneo(state, torneo_id):
+    """Numero di squadre del torneo archiviato (4 se il record manca)."""
+    t = state.get("archivio_tornei", {}).get(torneo_id)
+    return max(t["n_squadre"], 4) if t else 4
+
+
+def punti_voce_storico(state, voce):
+    """Punti ranking di una voce (torneo_nome, posizione, torneo_id) dello storico."""
+    _, pos, *resto = voce
+    return calcola_punti_ranking(pos, _get_n_squadre_torneo(state, resto[0] if resto else None))
+
+
+def _riga_ranking(state, a):
+    s = a["stats"]
+    # Punti con formula proporzione squadre, sul numero squadre archiviato
+    rank_pts = sum(punti_voce_storico(state, voce) for voce in s["storico_posizioni"])
+
+    quoziente_punti = round(s["punti_fatti"] / max(s["set_vinti"] + s["set_persi"], 1), 2)
+    quoziente_set = round(s["set_vinti"] / max(s["set_persi"], 1), 2)
+    quoziente_vittorie = round(s["vittorie"] / max(s["tornei"], 1), 2)
+    win_rate = round(s["vittorie"] / max(s["tornei"], 1) * 100, 1)
+
+    # Medaglie
+    medaglie_oro = sum(1 for _, pos, *_ in s["storico_posizioni"] if pos == 1)
+    medaglie_argento = sum(1 for _, pos, *_ in s["storico_posizioni"] if pos == 2)
+    medaglie_bronzo = sum(1 for _, pos, *_ in s["storico_posizioni"] if pos == 3)
+
+    return {
+        "atleta": a,
+        "id": a["id"],
+        "nome": a["nome"],
+        "tornei": s["tornei"],
+        "vittorie": s["vittorie"],
+        "sconfitte": s["sconfitte"],
+        "set_vinti": s["set_vinti"],
+        "set_persi": s["set_persi"],
+        "punti_fatti": s["punti_fatti"],
+        "punti_subiti": s["punti_subiti"],
+        "quoziente_punti": quoziente_punti,
+        "quoziente_set": quoziente_set,
+        "quoziente_vittorie": quoziente_vittorie,
+        "win_rate": win_rate,
+        "rank_pts": rank_pts,
+        "oro": medaglie_oro,
+        "argento": medaglie_argento,
+        "bronzo": medaglie_bronzo,
+        "storico": s["storico_posizioni"],
+    }
+
+
+def _chiave(riga, pos):
+    # pos (ordine di inserimento dell'atleta) rende l'ordinamento stabile
+    return (-riga["rank_pts"], -riga["oro"], -riga["argento"], -riga["win_rate"], pos, riga["id"])
+
+
+def _valida(tab, state):
+    """La tabella vale finché atleti e archivio tornei sono gli stessi oggetti."""
+    return tab["atleti"] is state["atleti"] and tab["archivio"] is state.get("archivio_tornei")
+
+
+def _costruisci(state):
+    righe, posizioni, ordine = {}, {}, []
+    for pos, a in enumerate(state["atleti"]):
+        posizioni[a["id"]] = pos
+        if a["stats"]["tornei"] == 0:
+            continue
+        r = _riga_ranking(state, a)
+        righe[a["id"]] = r
+        ordine.append(_chiave(r, pos))
+    ordine.sort()
+    return {
+        "versione": state.get("ranking_versione", 0),
+        "atleti": state["atleti"],
+        "archivio": state.get("archivio_tornei"),
+        "righe": righe,
+        "posizioni": posizioni,
+        "ordine": ordine,
+        "lista": None,
+    }
+
+
+def _aggiorna(state, tab, ids):
+    """Ricalcola solo le righe degli atleti indicati: O(k log n) + spostamenti."""
+    from data_manager import get_atleta_by_id
+    for aid in ids:
+        vecchia = tab["righe"].pop(aid, None)
+        if vecchia is not None:
+            k = _chiave(vecchia, tab["posizioni"][aid])
+            i = bisect_left(tab["ordine"], k)
+            if i < len(tab["ordine"]) and tab["ordine"][i] == k:
+                del tab["ordine"][i]
+        a = get_atleta_by_id(state, aid)
+        if not a or a["stats"]["tornei"] == 0:
+            continue
+        if aid not in tab["posizioni"]:
+            tab["posizioni"][aid] = state["atleti"].index(a)
+        r = _riga_ranking(state, a)
+        tab["righe"][aid] = r
+        insort(tab["ordine"], _chiave(r, tab["posizioni"][aid]))
+    tab["versione"] = state.get("ranking_versione", 0)
+    tab["lista"] = None
+
+
+def tabella_ranking(state):
+    """Restituisce la tabella materializzata, aggiornandola se la versione è cambiata."""
+    tab = state.get("_ranking")
+    versione = state.get("ranking_versione", 0)
+    sporchi = state.pop("_ranking_sporchi", None)
+    if tab is None or not _valida(tab, state) or (tab["versione"] != versione and sporchi is None):
+        tab = _costruisci(state)
+        state["_ranking"] = tab
+    elif tab["versione"] != versione:
+        _aggiorna(state, tab, sporchi)
+    return tab
+
+
+def build_ranking_data(state):
+    """Costruisce la classifica globale da tutti gli atleti."""
+    tab = tabella_ranking(state)
+    if tab["lista"] is None:
+        tab["lista"] = [tab["righe"][k[-1]] for k in tab["ordine"]]
+    return tab["lista"]
+
+
+def top_ranking(state, k):
+    """Prime k righe della classifica, senza materializzare l'intera lista."""
+    tab = tabella_ranking(state)
+    if tab["lista"] is not None:
+        return tab["lista"][:k]
+    return [tab["righe"][c[-1]] for c in tab["ordine"][:k]]
+
+
+def punti_squadre(state, squadre_ids):
+    """{sid: somma dei punti ranking degli atleti} — forza per il sorteggio dei gironi."""
+    from data_manager import get_squadra_by_id
+    righe = tabella_ranking(state)["righe"]
+    forza = {}
+    for sid in squadre_ids:
+        sq = get_squadra_by_id(state, sid)
+        forza[sid] = sum(righe[aid]["rank_pts"] for aid in (sq["atleti"] if sq else ()) if aid in righe)
+    return forza
@@ -3,72 +3,7 @@ ranking_page.py — Pagina ranking completa + esportazione PDF grafico
 """
 import streamlit as st
 import pandas as pd
-from data_manager import get_atleta_by_id, get_squadra_by_id
-
-
-def calcola_punti_ranking(pos, n_squadre):
-    """Assegna punti in proporzione al numero di squadre, a scaglioni da 10."""
-    # n_squadre * 10 = punteggio massimo (1° posto)
-    # Ogni posizione sottrae 10 punti
-    pts_massimi = n_squadre * 10
-    pts = pts_massimi - ((pos - 1) * 10)
-    return max(0, pts)
-
-
-def build_ranking_data(state):
-    """Costruisce la classifica globale da tutti gli atleti."""
-    atleti_stats = []
-    
-    for a in state["atleti"]:
-        s = a["stats"]
-        if s["tornei"] == 0:
-            continue
-        
-        # Ricalcola punti ranking con formula proporzione squadre
-        rank_pts = sum(
-            calcola_punti_ranking(pos, _get_n_squadre_torneo(state, torneo_nome))
-            for torneo_nome, pos in s["storico_posizioni"]
-        )
-        
-        quoziente_punti = round(s["punti_fatti"] / max(s["set_vinti"] + s["set_persi"], 1), 2)
-        quoziente_set = round(s["set_vinti"] / max(s["set_persi"], 1), 2)
-        quoziente_vittorie = round(s["vittorie"] / max(s["tornei"], 1), 2)
-        win_rate = round(s["vittorie"] / max(s["tornei"], 1) * 100, 1)
-        
-        # Medaglie
-        medaglie_oro = sum(1 for _, pos in s["storico_posizioni"] if pos == 1)
-        medaglie_argento = sum(1 for _, pos in s["storico_posizioni"] if pos == 2)
-        medaglie_bronzo = sum(1 for _, pos in s["storico_posizioni"] if pos == 3)
-        
-        atleti_stats.append({
-            "atleta": a,
-            "id": a["id"],
-            "nome": a["nome"],
-            "tornei": s["tornei"],
-            "vittorie": s["vittorie"],
-            "sconfitte": s["sconfitte"],
-            "set_vinti": s["set_vinti"],
-            "set_persi": s["set_persi"],
-            "punti_fatti": s["punti_fatti"],
-            "punti_subiti": s["punti_subiti"],
-            "quoziente_punti": quoziente_punti,
-            "quoziente_set": quoziente_set,
-            "quoziente_vittorie": quoziente_vittorie,
-            "win_rate": win_rate,
-            "rank_pts": rank_pts,
-            "oro": medaglie_oro,
-            "argento": medaglie_argento,
-            "bronzo": medaglie_bronzo,
-            "storico": s["storico_posizioni"],
-        })
-    
-    atleti_stats.sort(key=lambda x: (-x["rank_pts"], -x["oro"], -x["argento"], -x["win_rate"]))
-    return atleti_stats
-
-
-def _get_n_squadre_torneo(state, torneo_nome):
-    """Cerca il numero di squadre di un torneo passato (usa len squadre correnti come fallback)."""
-    return max(len(state["squadre"]), 4)
+from ranking_engine import punti_voce_storico, build_ranking_data
 
 
 def render_ranking_page(state):
@@ -216,8 +151,8 @@ def _render_schede_atleti(state, ranking):
         with col1:
             st.markdown("#### 📈 Andamento Posizioni")
             df_pos = pd.DataFrame({
-                "Torneo": [t for t, _ in a["storico"]],
-                "Posizione": [p for _, p in a["storico"]],
+                "Torneo": [t for t, *_ in a["storico"]],
+                "Posizione": [p for _, p, *_ in a["storico"]],
             }).set_index("Torneo")
             # Inverti: 1° = valore alto
             max_pos = df_pos["Posizione"].max()
@@ -227,20 +162,19 @@ def _render_schede_atleti(state, ranking):
         
         with col2:
             st.markdown("#### 📊 Punti Ranking per Torneo")
-            n_sq = len(state["squadre"]) or 8
             df_pts = pd.DataFrame({
-                "Torneo": [t for t, _ in a["storico"]],
-                "Punti": [calcola_punti_ranking(p, n_sq) for _, p in a["storico"]],
+                "Torneo": [t for t, *_ in a["storico"]],
+                "Punti": [punti_voce_storico(state, voce) for voce in a["storico"]],
             }).set_index("Torneo")
             st.bar_chart(df_pts, height=200, color="#ffd700")
         
         # Storico dettagliato
         st.markdown("#### 📋 Storico Tornei")
         medals = {1: "🥇", 2: "🥈", 3: "🥉"}
-        n_sq_curr = len(state["squadre"]) or 8
-        for t_nome, pos in a["storico"]:
+        for voce in a["storico"]:
+            t_nome, pos = voce[0], voce[1]
             icon = medals.get(pos, f"#{pos}")
-            pts = calcola_punti_ranking(pos, n_sq_curr)
+            pts = punti_voce_storico(state, voce)
             st.markdown(f"• {icon} **{t_nome}** — {pos}° posto → +{pts} pt ranking")
 
 
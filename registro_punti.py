@@ -0,0 +1,131 @@
+"""
+registro_punti.py — Registro rally per rally del segnapunti live (event sourcing)
+
+Ogni azione del segnapunti è un evento in coda a un registro solo-aggiunta:
+punto (squadra 1/2) o cambio manuale di battuta. Punteggio, set vinti e
+battuta non si salvano: si ricavano dagli eventi. Il registro tiene anche
+lo stato dopo ogni evento, quindi annullare l'ultimo evento è O(1) ed
+esatto (set chiusi e battuta compresi).
+
+Formato compatto: 5 byte per evento, struct "<BI" = tipo + decimi di secondo
+dall'inizio della partita. Una partita da 3 set sta sotto il kilobyte.
+"""
+import base64, struct, time
+
+PUNTO_SQ1, PUNTO_SQ2, BATTUTA_SQ1, BATTUTA_SQ2 = 1, 2, 3, 4
+_EVENTO = struct.Struct("<BI")
+
+# (punti sq1, punti sq2, set sq1, set sq2, battuta, set chiusi ((p1, p2), ...))
+STATO_INIZIALE = (0, 0, 0, 0, 1, ())
+
+
+def applica_evento(stato, tipo, pmax, formato):
+    """Stato dopo un evento: funzione pura, stesse regole del segnapunti."""
+    p1, p2, s1, s2, battuta, sets = stato
+    if tipo in (BATTUTA_SQ1, BATTUTA_SQ2):
+        return (p1, p2, s1, s2, tipo - 2, sets)
+    if tipo == PUNTO_SQ1:
+        p1 += 1
+    else:
+        p2 += 1
+    battuta = tipo          # chi fa il punto va in battuta
+    # In Best of 3, il terzo set (tie-break) si gioca a 15
+    limite = 15 if formato == "Best of 3" and s1 + s2 == 2 else pmax
+    if p1 >= limite and p1 - p2 >= 2:
+        return (0, 0, s1 + 1, s2, battuta, sets + ((p1, p2),))
+    if p2 >= limite and p2 - p1 >= 2:
+        return (0, 0, s1, s2 + 1, battuta, sets + ((p1, p2),))
+    return (p1, p2, s1, s2, battuta, sets)
+
+
+def nuovo_registro(pmax, formato, inizio=None):
+    return {
+        "pmax": pmax,
+        "formato": formato,
+        "inizio": time.time() if inizio is None else inizio,
+        "eventi": bytearray(),
+        "stati": [STATO_INIZIALE],       # stato dopo ogni evento (runtime, non serializzato)
+    }
+
+
+def aggiungi_evento(reg, tipo, decimi):
+    """Accoda un evento già datato (decimi dall'inizio) e ne calcola lo stato: O(1)."""
+    reg["eventi"] += _EVENTO.pack(tipo, decimi)
+    reg["stati"].append(applica_evento(reg["stati"][-1], tipo, reg["pmax"], reg["formato"]))
+
+
+def registra(reg, tipo, istante=None):
+    """Aggiunge un evento adesso (o all'istante dato, in secondi epoch)."""
+    decimi = int(((time.time() if istante is None else istante) - reg["inizio"]) * 10)
+    aggiungi_evento(reg, tipo, max(decimi, 0))
+
+
+def annulla_ultimo(reg):
+    """Toglie l'ultimo evento; False se il registro è vuoto."""
+    if not reg["eventi"]:
+        return False
+    del reg["eventi"][-_EVENTO.size:]
+    reg["stati"].pop()
+    return True
+
+
+def annulla_set_corrente(reg):
+    """Toglie gli eventi del set in corso, fino all'ultimo set chiuso; ritorna quanti."""
+    chiusi = len(reg["stati"][-1][5])
+    n = 0
+    while reg["eventi"] and len(reg["stati"][-2][5]) == chiusi:
+        annulla_ultimo(reg)
+        n += 1
+    return n
+
+
+def stato(reg):
+    p1, p2, s1, s2, battuta, sets = reg["stati"][-1]
+    return {"p1": p1, "p2": p2, "s1": s1, "s2": s2, "battuta": battuta, "sets": list(sets)}
+
+
+def ultimo_evento(reg):
+    """(tipo, decimi) dell'ultimo evento (None se vuoto), senza decodificare il registro."""
+    if not reg["eventi"]:
+        return None
+    return _EVENTO.unpack_from(reg["eventi"], len(reg["eventi"]) - _EVENTO.size)
+
+
+def eventi(reg):
+    """[(tipo, secondi dall'inizio)] in ordine."""
+    return [(tipo, decimi / 10) for tipo, decimi in _EVENTO.iter_unpack(bytes(reg["eventi"]))]
+
+
+# ─── PERSISTENZA ─────────────────────────────────────────────────────────────
+
+def serializza(reg):
+    """Dict JSON-serializzabile: eventi in base64, senza gli stati derivati."""
+    return {"pmax": reg["pmax"], "formato": reg["formato"], "inizio": reg["inizio"],
+            "eventi": base64.b64encode(bytes(reg["eventi"])).decode("ascii")}
+
+
+def ricostruisci(dati):
+    """Registro da serializza(): rigioca gli eventi per ricavare gli stati."""
+    reg = nuovo_registro(dati["pmax"], dati["formato"], dati["inizio"])
+    for tipo, decimi in _EVENTO.iter_unpack(base64.b64decode(dati["eventi"])):
+        aggiungi_evento(reg, tipo, decimi)
+    return reg
+
+
+# ─── STATISTICHE ─────────────────────────────────────────────────────────────
+
+def statistiche(reg):
+    """Rally giocati, punti in battuta (break point) e serie più lunga per squadra."""
+    stats = {"rally": 0, "break": {1: 0, 2: 0}, "serie_max": {1: 0, 2: 0}, "durata_s": 0.0}
+    serie, ultimo = 0, None
+    for i, (tipo, decimi) in enumerate(_EVENTO.iter_unpack(bytes(reg["eventi"]))):
+        stats["durata_s"] = decimi / 10
+        if tipo not in (PUNTO_SQ1, PUNTO_SQ2):
+            continue
+        stats["rally"] += 1
+        if reg["stati"][i][4] == tipo:      # aveva già la battuta prima del rally
+            stats["break"][tipo] += 1
+        serie = serie + 1 if tipo == ultimo else 1
+        ultimo = tipo
+        stats["serie_max"][tipo] = max(stats["serie_max"][tipo], serie)
+    return stats
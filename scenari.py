@@ -0,0 +1,146 @@
+"""
+scenari.py — Simulazioni "what if" sul formato del torneo, in parallelo su più processi
+
+Per ogni scenario (numero gironi, punteggio massimo, Set Unico / Best of 3,
+con qualificate per girone e ripescate del torneo) si ripete il torneo
+completo con le squadre iscritte: genera_gironi, simula_partita su ogni
+match, poi il tabellone di genera_bracket_da_gironi fino alla finale. Le ripetizioni sono divise in blocchi indipendenti, ognuno
+con il proprio seed, ed eseguite da un ProcessPoolExecutor: il risultato non
+dipende da quale processo esegue quale blocco.
+"""
+import os, random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+
+from bracket_engine import avanza_vincitore, finale_tabellone
+from data_manager import genera_gironi, genera_bracket_da_gironi, simula_partita
+
+# Tornei per blocco: la suddivisione non dipende dal numero di worker,
+# quindi lo stesso seed dà lo stesso risultato con 1 o N processi.
+TORNEI_PER_BLOCCO = 50
+
+_executor = None
+_executor_workers = 0
+
+
+def griglia_scenari(num_gironi, punteggi_max, formati, qualificate_girone=2, ripescate=0):
+    """Tutte le combinazioni dei parametri come lista di scenari.
+
+    Qualificate e ripescate sono quelle del torneo pianificato, uguali per tutti.
+    """
+    return [
+        {"num_gironi": g, "punteggio_max": pm, "formato_set": f,
+         "qualificate_girone": qualificate_girone, "ripescate": ripescate}
+        for g, pm, f in product(num_gironi, punteggi_max, formati)
+    ]
+
+
+def _p_rally(forza, sq1, sq2):
+    f1, f2 = forza[sq1], forza[sq2]
+    num = f1 * (1 - f2)
+    return num / (num + f2 * (1 - f1))
+
+
+def _gioca(stato_sim, forza, partita, acc, rng):
+    simula_partita(stato_sim, partita, p=_p_rally(forza, partita["sq1"], partita["sq2"]), rng=rng)
+    acc["partite"] += 1
+    acc["rally"] += sum(a + b for a, b in partita["punteggi"])
+    f1, f2 = forza[partita["sq1"]], forza[partita["sq2"]]
+    if f1 != f2:
+        acc["partite_sbilanciate"] += 1
+        favorita = partita["sq1"] if f1 > f2 else partita["sq2"]
+        if partita["vincitore"] != favorita:
+            acc["sorprese"] += 1
+    return partita["vincitore"]
+
+
+def _torneo_simulato(sids, forza, scenario, acc, rng):
+    stato_sim = {"torneo": {"formato_set": scenario["formato_set"],
+                            "punteggio_max": scenario["punteggio_max"]}}
+    gironi = genera_gironi(stato_sim, sids, scenario["num_gironi"], rng=rng)
+
+    medie = [sum(forza[s] for s in g["squadre"]) / len(g["squadre"]) for g in gironi if g["squadre"]]
+    media = sum(medie) / len(medie)
+    acc["squilibrio_gironi"] += (sum((m - media) ** 2 for m in medie) / len(medie)) ** 0.5
+
+    for g in gironi:
+        for p in g["partite"]:
+            _gioca(stato_sim, forza, p, acc, rng)
+
+    # il tabellone è ordinato per turno: ogni partita ha già entrambe le squadre
+    stato_sim["bracket"] = genera_bracket_da_gironi(
+        stato_sim, gironi, scenario["qualificate_girone"], scenario["ripescate"])
+    for p in stato_sim["bracket"]:
+        _gioca(stato_sim, forza, p, acc, rng)
+        avanza_vincitore(stato_sim, p)
+
+    finale = finale_tabellone(stato_sim["bracket"])
+    if finale and finale["vincitore"] == max(sids, key=lambda s: forza[s]):
+        acc["vittorie_favorita"] += 1
+    acc["tornei"] += 1
+
+
+def _esegui_blocco(sids, forza, scenario, n_rep, seed):
+    """Unità di lavoro eseguita nel processo worker."""
+    rng = random.Random(seed)
+    acc = dict.fromkeys(("tornei", "partite", "rally", "partite_sbilanciate", "sorprese",
+                         "vittorie_favorita", "squilibrio_gironi"), 0)
+    for _ in range(n_rep):
+        _torneo_simulato(sids, forza, scenario, acc, rng)
+    return acc
+
+
+def _get_executor(max_workers):
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != max_workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        # "spawn": i worker non ereditano i thread del server Streamlit
+        _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn"))
+        _executor_workers = max_workers
+    return _executor
+
+
+def _riepilogo(scenario, acc):
+    tornei = max(acc["tornei"], 1)
+    partite = max(acc["partite"], 1)
+    return {
+        **scenario,
+        "tornei_simulati": acc["tornei"],
+        "partite_per_torneo": acc["partite"] / tornei,
+        "rally_per_torneo": acc["rally"] / tornei,
+        "rally_per_partita": acc["rally"] / partite,
+        "tasso_sorprese": acc["sorprese"] / max(acc["partite_sbilanciate"], 1),
+        "vittoria_favorita": acc["vittorie_favorita"] / tornei,
+        "squilibrio_gironi": acc["squilibrio_gironi"] / tornei,
+    }
+
+
+def esegui_scenari(sids, forza, scenari, n_rep=200, seed=0, max_workers=None):
+    """Simula n_rep tornei per scenario e ritorna un riepilogo per ciascuno.
+
+    sids: id delle squadre iscritte; forza: {sid: prob. rally contro squadra media}.
+    """
+    sids = list(sids)
+    forza = {sid: float(forza[sid]) for sid in sids}
+    max_workers = max_workers or os.cpu_count() or 1
+
+    lavori = []
+    for i, scenario in enumerate(scenari):
+        for b, inizio in enumerate(range(0, n_rep, TORNEI_PER_BLOCCO)):
+            n = min(TORNEI_PER_BLOCCO, n_rep - inizio)
+            # seed del blocco derivato da (seed, scenario, blocco): riproducibile
+            lavori.append((i, (sids, forza, scenario, n, f"{seed}:{i}:{b}")))
+
+    totali = [dict.fromkeys(("tornei", "partite", "rally", "partite_sbilanciate", "sorprese",
+                             "vittorie_favorita", "squilibrio_gironi"), 0) for _ in scenari]
+    if max_workers == 1 or len(lavori) == 1:
+        risultati = [_esegui_blocco(*args) for _, args in lavori]
+    else:
+        executor = _get_executor(max_workers)
+        risultati = list(executor.map(_esegui_blocco, *zip(*(args for _, args in lavori))))
+    for (i, _), acc in zip(lavori, risultati):
+        for k, v in acc.items():
+            totali[i][k] += v
+    return [_riepilogo(sc, acc) for sc, acc in zip(scenari, totali)]
@@ -3,7 +3,14 @@ segnapunti_live.py — Segnapunti LIVE gigante a schermo intero
 """
 import streamlit as st
 from data_manager import (
-    save_state, get_squadra_by_id, aggiorna_classifica_squadra
+    get_squadra_by_id, aggiorna_classifica_squadra, nomi_atleti_squadra, segna_partita_modificata
+)
+from bracket_engine import avanza_vincitore
+from stato_condiviso import modifica_partita, revisione_partita, ConflittoRevisione
+import giornale_live as giornale
+from registro_punti import (
+    PUNTO_SQ1, PUNTO_SQ2, BATTUTA_SQ1, BATTUTA_SQ2, nuovo_registro, registra,
+    annulla_ultimo, annulla_set_corrente, ultimo_evento, stato, statistiche, serializza
 )
 
 
@@ -46,27 +53,36 @@ def render_segnapunti_live(state):
         st.success(f"✅ Partita conclusa. Vincitore: **{sq_v['nome'] if sq_v else '?'}**")
         return
     
+    _scoreboard_live(state, partita, f"live_{partita['id']}")
+
+
+@st.fragment
+def _scoreboard_live(state, partita, key_base):
+    """Scoreboard e pulsanti come fragment: punto, annulla e battuta rieseguono
+    solo questa funzione, non l'intera app (sidebar, fase corrente, salvataggio).
+    Ogni azione va anche nel giornale su disco (giornale_live.py)."""
     sq1 = get_squadra_by_id(state, partita["sq1"])
     sq2 = get_squadra_by_id(state, partita["sq2"])
     
-    # Inizializza stato live nella session
-    key_base = f"live_{partita['id']}"
-    if f"{key_base}_s1" not in st.session_state:
-        st.session_state[f"{key_base}_s1"] = 0  # set vinti sq1
-        st.session_state[f"{key_base}_s2"] = 0  # set vinti sq2
-        st.session_state[f"{key_base}_p1"] = 0  # punti set corrente sq1
-        st.session_state[f"{key_base}_p2"] = 0  # punti set corrente sq2
-        st.session_state[f"{key_base}_battuta"] = 1
-        st.session_state[f"{key_base}_punteggi_sets"] = []
-    
-    s1 = st.session_state[f"{key_base}_s1"]
-    s2 = st.session_state[f"{key_base}_s2"]
-    p1 = st.session_state[f"{key_base}_p1"]
-    p2 = st.session_state[f"{key_base}_p2"]
-    battuta = st.session_state[f"{key_base}_battuta"]
     pmax = state["torneo"]["punteggio_max"]
     formato = state["torneo"]["formato_set"]
     
+    # Registro rally della partita nella session: punteggio, set e battuta ne derivano.
+    # Sessione nuova (refresh, riavvio): si riprende dal giornale, se la partita era aperta
+    pid = partita["id"]
+    if f"{key_base}_registro" not in st.session_state:
+        reg = giornale.recupera(pid)
+        if reg is None:
+            reg = nuovo_registro(pmax, formato)     # nel giornale solo dal primo rally
+        elif reg["eventi"]:
+            st.toast("♻️ Punteggio live ripristinato")
+        st.session_state[f"{key_base}_registro"] = reg
+        st.session_state[f"{key_base}_rev"] = revisione_partita(partita)
+    reg = st.session_state[f"{key_base}_registro"]
+    live = stato(reg)
+    s1, s2, p1, p2, battuta = live["s1"], live["s2"], live["p1"], live["p2"], live["battuta"]
+    ultimo = (ultimo_evento(reg) or (None,))[0]
+    
     # ─── SCOREBOARD GIGANTE ──────────────────────────────────────────────────
     
     battuta_icon1 = "🏐" if battuta == 1 else ""
@@ -123,19 +139,15 @@ def render_segnapunti_live(state):
         st.markdown(f"<div style='text-align:center;color:var(--accent1);font-family:var(--font-display);font-weight:700;font-size:1.1rem;margin-bottom:8px'>{sq1['nome'] if sq1 else '?'}</div>", unsafe_allow_html=True)
         c1a, c1b, c1c = st.columns([2, 2, 1])
         with c1a:
-            if st.button("➕ PUNTO", key=f"{key_base}_add1", use_container_width=True):
-                st.session_state[f"{key_base}_p1"] += 1
-                st.session_state[f"{key_base}_battuta"] = 1
-                _check_set_win(state, key_base, pmax, formato)
-                st.rerun()
+            st.button("➕ PUNTO", key=f"{key_base}_add1", use_container_width=True,
+                      on_click=_registra, args=(pid, reg, PUNTO_SQ1))
         with c1b:
-            if st.button("➖ Annulla", key=f"{key_base}_sub1", use_container_width=True):
-                st.session_state[f"{key_base}_p1"] = max(0, st.session_state[f"{key_base}_p1"] - 1)
-                st.rerun()
+            st.button("➖ Annulla", key=f"{key_base}_sub1", use_container_width=True,
+                      disabled=ultimo != PUNTO_SQ1, help="Annulla l'ultimo punto, se è di questa squadra",
+                      on_click=_annulla, args=(pid, reg))
         with c1c:
-            if st.button("🏐", key=f"{key_base}_batt1", use_container_width=True, help="Assegna battuta"):
-                st.session_state[f"{key_base}_battuta"] = 1
-                st.rerun()
+            st.button("🏐", key=f"{key_base}_batt1", use_container_width=True, help="Assegna battuta",
+                      disabled=battuta == 1, on_click=_registra, args=(pid, reg, BATTUTA_SQ1))
     
     with col_mid:
         st.markdown("<div style='text-align:center;padding-top:40px;color:var(--text-secondary)'>|</div>", unsafe_allow_html=True)
@@ -144,23 +156,19 @@ def render_segnapunti_live(state):
         st.markdown(f"<div style='text-align:center;color:var(--accent2);font-family:var(--font-display);font-weight:700;font-size:1.1rem;margin-bottom:8px'>{sq2['nome'] if sq2 else '?'}</div>", unsafe_allow_html=True)
         c2a, c2b, c2c = st.columns([2, 2, 1])
         with c2a:
-            if st.button("➕ PUNTO", key=f"{key_base}_add2", use_container_width=True):
-                st.session_state[f"{key_base}_p2"] += 1
-                st.session_state[f"{key_base}_battuta"] = 2
-                _check_set_win(state, key_base, pmax, formato)
-                st.rerun()
+            st.button("➕ PUNTO", key=f"{key_base}_add2", use_container_width=True,
+                      on_click=_registra, args=(pid, reg, PUNTO_SQ2))
         with c2b:
-            if st.button("➖ Annulla", key=f"{key_base}_sub2", use_container_width=True):
-                st.session_state[f"{key_base}_p2"] = max(0, st.session_state[f"{key_base}_p2"] - 1)
-                st.rerun()
+            st.button("➖ Annulla", key=f"{key_base}_sub2", use_container_width=True,
+                      disabled=ultimo != PUNTO_SQ2, help="Annulla l'ultimo punto, se è di questa squadra",
+                      on_click=_annulla, args=(pid, reg))
         with c2c:
-            if st.button("🏐", key=f"{key_base}_batt2", use_container_width=True, help="Assegna battuta"):
-                st.session_state[f"{key_base}_battuta"] = 2
-                st.rerun()
+            st.button("🏐", key=f"{key_base}_batt2", use_container_width=True, help="Assegna battuta",
+                      disabled=battuta == 2, on_click=_registra, args=(pid, reg, BATTUTA_SQ2))
     
     # ─── SET HISTORY ─────────────────────────────────────────────────────────
     
-    sets_history = st.session_state.get(f"{key_base}_punteggi_sets", [])
+    sets_history = live["sets"]
     if sets_history:
         st.markdown("**Set Giocati:**")
         for i, (a, b) in enumerate(sets_history):
@@ -175,71 +183,81 @@ def render_segnapunti_live(state):
             </span>
             """, unsafe_allow_html=True)
     
+    if reg["eventi"]:
+        info = statistiche(reg)
+        minuti, secondi = divmod(int(info["durata_s"]), 60)
+        st.caption(f"📊 {info['rally']} rally in {minuti}:{secondi:02d} · "
+                   f"punti in battuta {info['break'][1]}–{info['break'][2]} · "
+                   f"serie più lunga {info['serie_max'][1]}–{info['serie_max'][2]}")
+    
     st.divider()
     
     # ─── AZIONI FINALI ───────────────────────────────────────────────────────
     
-    col_a, col_b, col_c = st.columns([2, 2, 2])
+    col_u, col_a, col_b, col_c = st.columns([2, 2, 2, 2])
+    
+    with col_u:
+        st.button("↩️ Annulla Ultimo", use_container_width=True, disabled=not reg["eventi"],
+                  on_click=_annulla, args=(pid, reg))
     
     with col_a:
-        if st.button("🔄 Reset Set Corrente", use_container_width=True):
-            st.session_state[f"{key_base}_p1"] = 0
-            st.session_state[f"{key_base}_p2"] = 0
-            st.rerun()
+        st.button("🔄 Reset Set Corrente", use_container_width=True,
+                  on_click=_reset_set, args=(pid, reg))
     
     with col_b:
-        if st.button("🔄 Reset TUTTO", use_container_width=True):
-            for k in [f"{key_base}_s1", f"{key_base}_s2", f"{key_base}_p1",
-                      f"{key_base}_p2", f"{key_base}_battuta", f"{key_base}_punteggi_sets"]:
-                if k in st.session_state:
-                    del st.session_state[k]
-            st.rerun()
+        st.button("🔄 Reset TUTTO", use_container_width=True,
+                  on_click=_reset_live, args=(key_base, pid))
     
     with col_c:
-        sets_giocati = st.session_state.get(f"{key_base}_punteggi_sets", [])
-        if sets_giocati and (s1 > s2 or s2 > s1):
+        if sets_history and s1 != s2:
             if st.button("📤 INVIA AL TABELLONE ✅", use_container_width=True):
-                _invia_al_tabellone(state, partita, key_base)
-                save_state(state)
+                # un altro campo può aver confermato la partita mentre si segnava
+                try:
+                    with modifica_partita(state, partita, st.session_state.get(f"{key_base}_rev")):
+                        _invia_al_tabellone(state, partita, key_base)
+                except ConflittoRevisione:
+                    st.error("⚠️ La partita è stata modificata da un'altra postazione: "
+                             "risultato non inviato. Controlla il tabellone.")
+                    return
                 st.success("✅ Dati inviati al tabellone!")
-                st.rerun()
+                # rerun dell'intera app: tabellone, classifiche e salvataggio
+                st.rerun(scope="app")
+
 
+# ─── AZIONI LIVE (callback: eseguite prima del rerun del fragment) ───────────
 
-def _check_set_win(state, key_base, pmax, formato):
-    """Controlla se un set è stato vinto e aggiorna contatori."""
-    p1 = st.session_state[f"{key_base}_p1"]
-    p2 = st.session_state[f"{key_base}_p2"]
-    s1 = st.session_state[f"{key_base}_s1"]
-    s2 = st.session_state[f"{key_base}_s2"]
-    
-    set_corrente = s1 + s2
-    # In Best of 3, il terzo set (tie-break) si gioca a 15
-    is_tiebreak = (formato == "Best of 3" and set_corrente == 2)
-    limit = 15 if is_tiebreak else pmax
-    
-    won = False
-    if p1 >= limit and p1 - p2 >= 2:
-        # Sq1 vince set
-        st.session_state[f"{key_base}_punteggi_sets"].append((p1, p2))
-        st.session_state[f"{key_base}_s1"] += 1
-        st.session_state[f"{key_base}_p1"] = 0
-        st.session_state[f"{key_base}_p2"] = 0
-        won = True
-    elif p2 >= limit and p2 - p1 >= 2:
-        # Sq2 vince set
-        st.session_state[f"{key_base}_punteggi_sets"].append((p1, p2))
-        st.session_state[f"{key_base}_s2"] += 1
-        st.session_state[f"{key_base}_p1"] = 0
-        st.session_state[f"{key_base}_p2"] = 0
-        won = True
+def _registra(pid, reg, tipo):
+    if not reg.get("nel_giornale"):
+        giornale.apri(pid, reg)
+    registra(reg, tipo)
+    giornale.evento(pid, reg)
+
+
+def _annulla(pid, reg):
+    if annulla_ultimo(reg):
+        giornale.annulla(pid, reg)
+
+
+def _reset_set(pid, reg):
+    giornale.annulla(pid, reg, annulla_set_corrente(reg))
+
+
+def _reset_live(key_base, pid):
+    reg = st.session_state.pop(f"{key_base}_registro", None)
+    st.session_state.pop(f"{key_base}_rev", None)
+    if reg is not None and reg.get("nel_giornale"):
+        giornale.chiudi(pid)
 
 
 def _invia_al_tabellone(state, partita, key_base):
     """Trasferisce i dati del segnapunti live alla partita nel torneo."""
-    sets = st.session_state.get(f"{key_base}_punteggi_sets", [])
+    reg = st.session_state.get(f"{key_base}_registro")
+    if reg is None:
+        return
+    live = stato(reg)
+    sets = live["sets"]
     # Aggiungi set corrente se ha punti
-    p1_curr = st.session_state.get(f"{key_base}_p1", 0)
-    p2_curr = st.session_state.get(f"{key_base}_p2", 0)
+    p1_curr, p2_curr = live["p1"], live["p2"]
     if p1_curr > 0 or p2_curr > 0:
         sets = sets + [(p1_curr, p2_curr)]
     
@@ -253,16 +271,17 @@ def _invia_al_tabellone(state, partita, key_base):
     partita["set_sq1"] = s1v
     partita["set_sq2"] = s2v
     partita["vincitore"] = partita["sq1"] if s1v >= s2v else partita["sq2"]
-    partita["in_battuta"] = st.session_state.get(f"{key_base}_battuta", 1)
+    partita["in_battuta"] = live["battuta"]
+    partita["registro_punti"] = serializza(reg)      # per statistiche e replay
     partita["confermata"] = True
+    segna_partita_modificata(partita)
     
     aggiorna_classifica_squadra(state, partita)
+    if partita["fase"] == "eliminazione":
+        avanza_vincitore(state, partita)
     
-    # Pulizia session
-    for k in [f"{key_base}_s1", f"{key_base}_s2", f"{key_base}_p1",
-              f"{key_base}_p2", f"{key_base}_battuta", f"{key_base}_punteggi_sets"]:
-        if k in st.session_state:
-            del st.session_state[k]
+    # Pulizia session e giornale
+    _reset_live(key_base, partita["id"])
 
 
 def _get_partite_disponibili(state):
@@ -296,6 +315,4 @@ def _get_partite_disponibili(state):
 
 def _players_str(state, sq):
     if not sq: return ""
-    from data_manager import get_atleta_by_id
-    names = [get_atleta_by_id(state, aid)["nome"] for aid in sq["atleti"] if get_atleta_by_id(state, aid)]
-    return " · ".join(names)
+    return " · ".join(nomi_atleti_squadra(state, sq))
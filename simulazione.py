@@ -0,0 +1,252 @@
+"""
+simulazione.py — Previsioni Monte Carlo vettorizzate (NumPy) sull'esito del torneo
+
+Simula in blocco migliaia di tornei completi: i match dei gironi non ancora
+confermati, la classifica di ogni girone (criteri di classifiche.py, con un
+sorteggio al posto dello scontro diretto), le qualificate e le ripescate del
+torneo e il tabellone con le stesse teste di serie di
+genera_bracket_da_gironi. Tutte le simulazioni avanzano in parallelo come
+righe di array NumPy: nessun loop Python sui singoli rally.
+
+Il campionatore di set è verificato contro il modello rally per rally in
+tests/test_simulazione.py.
+"""
+import numpy as np
+
+from bracket_engine import ordine_teste_di_serie
+from classifiche import ordine_tabellone
+from data_manager import get_squadra_by_id, get_atleta_by_id, distribuzione_set
+
+# Punti "virtuali" aggiunti a fatti/subiti: senza storico la forza resta 0.5
+PRIOR_PUNTI = 200
+
+
+# ─── FORZA SQUADRE ───────────────────────────────────────────────────────────
+
+def forza_squadre(state, sids):
+    """Probabilità stimata di vincere un rally contro una squadra media.
+
+    Deriva da punti_fatti/punti_subiti storici degli atleti (più quelli del
+    torneo in corso), con un prior che riporta verso 0.5 chi ha pochi dati.
+    """
+    forza = np.empty(len(sids))
+    for i, sid in enumerate(sids):
+        sq = get_squadra_by_id(state, sid)
+        pf = ps = PRIOR_PUNTI
+        if sq:
+            pf += sq["punti_fatti"]
+            ps += sq["punti_subiti"]
+            for aid in sq["atleti"]:
+                a = get_atleta_by_id(state, aid)
+                if a:
+                    pf += a["stats"]["punti_fatti"] / 2
+                    ps += a["stats"]["punti_subiti"] / 2
+        forza[i] = pf / (pf + ps)
+    return forza
+
+
+def matrice_rally(forza):
+    """p[i, j] = probabilità che i vinca un rally contro j (formula log5)."""
+    fi = forza[:, None]
+    fj = forza[None, :]
+    num = fi * (1 - fj)
+    return num / (num + fj * (1 - fi))
+
+
+# ─── SET E PARTITE IN BLOCCO ─────────────────────────────────────────────────
+
+def _tabella_cdf(p_unici, limit):
+    """Esiti di distribuzione_set e CDF per ogni p distinto: (esiti, array (U, 2*limit - 1))."""
+    esiti = distribuzione_set(limit)[0]
+    prob = np.array([distribuzione_set(limit, float(p))[1] for p in p_unici])
+    cdf = np.cumsum(prob, axis=1)
+    cdf /= cdf[:, -1:]
+    return esiti, cdf
+
+
+def simula_set_batch(p, limit, rng):
+    """Punteggi finali di tanti set in parallelo (p = prob. rally della squadra 1).
+
+    Campiona direttamente dalla distribuzione esatta (data_manager.distribuzione_set):
+    un'estrazione categoriale per set più una geometrica per i vantaggi.
+    """
+    p = np.asarray(p, dtype=float)
+    pf = p.reshape(-1)
+    p_unici, inv = np.unique(pf, return_inverse=True)
+    esiti, cdf = _tabella_cdf(p_unici, limit)
+    n_cat = cdf.shape[1]
+    # ricerca in un'unica passata: la riga r occupa l'intervallo [r, r+1]
+    piatta = (cdf + np.arange(len(p_unici))[:, None]).reshape(-1)
+    u = rng.random(pf.size)
+    cat = np.searchsorted(piatta, u + inv, side="right") - inv * n_cat
+    cat = np.minimum(cat, n_cat - 1)
+
+    # l'ultimo esito (None) è l'arrivo ai vantaggi
+    a = np.array([e[0] for e in esiti[:-1]] + [0], dtype=np.int32)[cat]
+    b = np.array([e[1] for e in esiti[:-1]] + [0], dtype=np.int32)[cat]
+    mv = cat == n_cat - 1
+    if mv.any():
+        pv = pf[mv]
+        qv = 1 - pv
+        extra = rng.geometric(np.maximum(1 - 2*pv*qv, 1e-12)) - 1
+        vince_1 = rng.random(pv.size) < pv*pv / (pv*pv + qv*qv)
+        w, l = limit + 1 + extra, limit - 1 + extra
+        a[mv] = np.where(vince_1, w, l)
+        b[mv] = np.where(vince_1, l, w)
+    return a.reshape(p.shape), b.reshape(p.shape)
+
+
+def simula_partite_batch(p, formato, pmax, rng):
+    """Ritorna (set_sq1, set_sq2, punti_sq1, punti_sq2) con la forma di p."""
+    if formato == "Set Unico":
+        a, b = simula_set_batch(p, pmax, rng)
+        return (a > b).astype(np.int32), (b > a).astype(np.int32), a, b
+    a1, b1 = simula_set_batch(p, pmax, rng)
+    a2, b2 = simula_set_batch(p, pmax, rng)
+    a3, b3 = simula_set_batch(p, 15, rng)
+    s1 = (a1 > b1).astype(np.int32) + (a2 > b2)
+    s2 = 2 - s1
+    terzo = s1 == 1                      # 1-1 dopo due set: si gioca il tie-break
+    s1 = s1 + (terzo & (a3 > b3))
+    s2 = np.where(terzo, 1 + (b3 > a3), s2)
+    return s1, s2, a1 + a2 + np.where(terzo, a3, 0), b1 + b2 + np.where(terzo, b3, 0)
+
+
+# ─── TORNEO COMPLETO ─────────────────────────────────────────────────────────
+
+def _classifica_girone(n_sim, k, partite, p_rally, formato, pmax, rng):
+    """Ordina le k squadre di un girone in ogni simulazione.
+
+    Ritorna (ordine, chiavi): ordine (n_sim, k) indici locali; chiavi per il
+    confronto tra gironi come classifiche._chiave_fascia (medie per partita,
+    quozienti), dalla meno alla più importante, ognuna (n_sim, k).
+    """
+    pts = np.zeros((n_sim, k), dtype=np.int32)
+    vit = np.zeros((n_sim, k), dtype=np.int32)
+    sv, sp, pf, ps = (np.zeros((n_sim, k), dtype=np.int32) for _ in range(4))
+    da_simulare = [m for m in partite if m[2] is None]
+    if da_simulare:
+        p = np.array([p_rally[m[0], m[1]] for m in da_simulare])
+        esiti = simula_partite_batch(np.broadcast_to(p, (n_sim, len(p))), formato, pmax, rng)
+    j = 0
+    for i1, i2, fisso, l1, l2 in partite:
+        if fisso is None:
+            s1, s2, p1, p2 = (x[:, j] for x in esiti)
+            j += 1
+        else:
+            s1, s2, p1, p2 = fisso
+        v1 = s1 > s2
+        pts[:, l1] += np.where(v1, 3, 1)
+        pts[:, l2] += np.where(v1, 1, 3)
+        vit[:, l1] += v1
+        vit[:, l2] += ~np.asarray(v1)
+        sv[:, l1] += s1; sp[:, l1] += s2
+        sv[:, l2] += s2; sp[:, l2] += s1
+        pf[:, l1] += p1; ps[:, l1] += p2
+        pf[:, l2] += p2; ps[:, l2] += p1
+    q_set, q_punti = _quoziente(sv, sp), _quoziente(pf, ps)
+    # lexsort: l'ultima chiave è la principale; rumore per gli arrivi a pari merito
+    ordine = np.lexsort((rng.random((n_sim, k)), q_punti, q_set, vit, pts), axis=-1)
+    giocate = max(k - 1, 1)
+    return ordine[:, ::-1], (q_punti, q_set, vit / giocate, pts / giocate)
+
+
+def _quoziente(fatti, subiti):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(subiti > 0, fatti / np.maximum(subiti, 1), np.where(fatti > 0, np.inf, 0.0))
+
+
+def _tabellone_batch(qualificate, p_rally, formato, pmax, rng):
+    """Eliminazione diretta come bracket_engine.genera_tabellone.
+
+    qualificate: (n_sim, Q) indici globali in ordine di testa di serie.
+    Ritorna (semifinaliste, vincitore).
+    """
+    n_sim, q = qualificate.shape
+    size = 1
+    while size < max(q, 2):
+        size *= 2
+    slot = np.full((n_sim, size), -1, dtype=np.int64)
+    for pos, seed in enumerate(ordine_teste_di_serie(size)):
+        if seed <= q:                        # le teste di serie oltre Q sono bye (-1)
+            slot[:, pos] = qualificate[:, seed - 1]
+    semifinaliste = slot if size <= 4 else None
+    while slot.shape[1] > 1:
+        a, b = slot[:, 0::2], slot[:, 1::2]
+        entrambi = (a >= 0) & (b >= 0)
+        p = np.where(entrambi, p_rally[np.maximum(a, 0), np.maximum(b, 0)], 0.5)
+        s1, s2, _, _ = simula_partite_batch(p, formato, pmax, rng)
+        slot = np.where(b < 0, a, np.where(a < 0, b, np.where(s1 > s2, a, b)))
+        if slot.shape[1] == 4:
+            semifinaliste = slot
+    return semifinaliste, slot[:, 0]
+
+
+def prevedi_torneo(state, n_sim=20000, seed=None, usa_forza=True):
+    """Probabilità per squadra di qualificarsi, arrivare in semifinale e vincere.
+
+    I match già confermati restano fissi; gli altri vengono simulati.
+    Ritorna {squadra_id: {"qualificazione", "semifinale", "vittoria"}}.
+    """
+    gironi = state["gironi"]
+    sids = [sid for g in gironi for sid in g["squadre"]]
+    if not sids:
+        return {}
+    idx = {sid: i for i, sid in enumerate(sids)}
+    n = len(sids)
+    rng = np.random.default_rng(seed)
+    forza = forza_squadre(state, sids) if usa_forza else np.full(n, 0.5)
+    p_rally = matrice_rally(forza)
+    torneo = state["torneo"]
+    formato, pmax = torneo["formato_set"], torneo["punteggio_max"]
+    q, ripescate = torneo["qualificate_girone"], torneo["ripescate"]
+
+    qualificate = []
+    candidate, chiavi_candidate = [], []     # (q+1)ª classificate, per le ripescate
+    for gi, g in enumerate(gironi):
+        locali = {sid: i for i, sid in enumerate(g["squadre"])}
+        globali = np.array([idx[sid] for sid in g["squadre"]])
+        partite = []
+        for pt in g["partite"]:
+            if pt["sq1"] not in locali or pt["sq2"] not in locali:
+                continue
+            i1, i2 = idx[pt["sq1"]], idx[pt["sq2"]]
+            fisso = None
+            if pt["confermata"]:
+                fisso = (pt["set_sq1"], pt["set_sq2"],
+                         sum(x[0] for x in pt["punteggi"]), sum(x[1] for x in pt["punteggi"]))
+            partite.append((i1, i2, fisso, locali[pt["sq1"]], locali[pt["sq2"]]))
+        ordine, chiavi = _classifica_girone(n_sim, len(globali), partite, p_rally, formato, pmax, rng)
+        qualificate.append(globali[ordine[:, :q]])
+        if ripescate and len(globali) > q:
+            locale = ordine[:, q:q + 1]
+            candidate.append(globali[locale[:, 0]])
+            chiavi_candidate.append([np.take_along_axis(c, locale, axis=1)[:, 0] for c in chiavi])
+    # teste di serie per (girone, posizione) come in teste_di_serie_da_gironi; dentro
+    # ogni fascia conta l'ordine dei gironi invece del confronto tra classifiche
+    inizio = np.cumsum([0] + [x.shape[1] for x in qualificate])
+    fasce = [[(gi, inizio[gi] + r) for gi, x in enumerate(qualificate) if x.shape[1] > r]
+             for r in range(q)]
+    qualificate = np.concatenate(qualificate, axis=1)
+    if candidate:
+        # migliori (q+1)ª tra i gironi, ognuna come girone a sé per il tabellone
+        candidate = np.stack(candidate, axis=1)
+        chiavi = [np.stack(c, axis=1) for c in zip(*chiavi_candidate)]
+        migliori = np.lexsort((rng.random(candidate.shape), *chiavi), axis=-1)[:, ::-1][:, :ripescate]
+        base = qualificate.shape[1]
+        qualificate = np.concatenate([qualificate, np.take_along_axis(candidate, migliori, axis=1)], axis=1)
+        fasce.append([(-1 - j, base + j) for j in range(migliori.shape[1])])
+    qualificate = qualificate[:, ordine_tabellone(fasce)]
+
+    semifinaliste, vincitore = _tabellone_batch(qualificate, p_rally, formato, pmax, rng)
+
+    def frequenze(arr):
+        arr = arr[arr >= 0]
+        return np.bincount(arr, minlength=n) / n_sim
+
+    f_q, f_s, f_v = frequenze(qualificate), frequenze(semifinaliste), frequenze(vincitore)
+    return {
+        sid: {"qualificazione": float(f_q[i]), "semifinale": float(f_s[i]), "vittoria": float(f_v[i])}
+        for sid, i in idx.items()
+    }
+
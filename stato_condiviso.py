@@ -0,0 +1,138 @@
+"""
+stato_condiviso.py — Stato del torneo condiviso tra le sessioni (più campi in contemporanea)
+
+Ogni browser apre una sessione Streamlit, ma tutte girano nello stesso
+processo: get_stato() restituisce a tutte la stessa copia autorevole dello
+stato, caricata una volta da disco. Un risultato confermato su un campo è
+subito visibile agli altri, e l'autosave non sovrascrive più il lavoro delle
+altre sessioni con una copia vecchia.
+
+Concorrenza:
+  - le modifiche passano da modifica() o da modifica_partita(), entrambe
+    sotto un unico lock globale tenuto solo per l'aggiornamento in memoria
+    (pochi microsecondi anche quando due campi confermano insieme);
+  - modifica_partita(), se riceve la revisione letta dal chiamante, rifiuta
+    la modifica con ConflittoRevisione quando nel frattempo un'altra sessione
+    ha cambiato risultato o squadre (concorrenza ottimistica, vedi
+    data_manager.segna_partita_modificata);
+  - salva() scrive su disco sotto lo stesso lock globale; se il debounce
+    dell'autosave rimanda la scrittura, un timer la completa allo scadere
+    (e all'uscita del processo), anche se nessuno interagisce più;
+  - le cache runtime (indici "_idx_*", registro degli id, tabella del
+    ranking) si aggiornano alla fine di ogni modifica, ancora sotto il lock:
+    chi legge le trova pronte e non scrive mai nello stato condiviso.
+"""
+import atexit, threading, time
+from contextlib import contextmanager
+
+from bracket_engine import ricostruisci_indice_prossime
+from data_manager import (
+    load_state, save_state, segna_modificato, stato_modificato, prepara_indici, AUTOSAVE_DEBOUNCE_S
+)
+from ranking_engine import build_ranking_data
+
+_stato = None
+_lock = threading.RLock()
+_timer = None           # salvataggio programmato per le modifiche rimandate dal debounce
+
+
+class ConflittoRevisione(Exception):
+    """La partita è stata modificata da un'altra sessione dopo la lettura."""
+
+
+def get_stato():
+    """Lo stato autorevole del processo, caricato da disco al primo accesso."""
+    global _stato
+    with _lock:
+        if _stato is None:
+            _stato = load_state()
+            _prepara_letture(_stato)
+        return _stato
+
+
+def _prepara_letture(stato):
+    """Aggiorna le cache runtime che le letture costruirebbero pigramente (sotto _lock)."""
+    prepara_indici(stato)
+    ricostruisci_indice_prossime(stato)
+    build_ranking_data(stato)
+
+
+def sostituisci_stato(nuovo):
+    """Nuovo torneo / reset: il contenuto cambia, l'oggetto condiviso resta lo stesso.
+
+    Le sessioni tengono un riferimento a get_stato(): sostituire il dict in
+    place fa vedere il nuovo stato a tutte senza ricaricarlo.
+    """
+    stato = get_stato()
+    with _lock:
+        stato.clear()
+        stato.update(nuovo)
+        _prepara_letture(stato)
+        save_state(stato, force=True)
+
+
+def salva(force=False):
+    """save_state() dello stato condiviso, senza modifiche concorrenti durante la scrittura."""
+    global _timer
+    with _lock:
+        stato = get_stato()
+        scritto = save_state(stato, force=force)
+        if not scritto and _timer is None and stato_modificato(stato):
+            # rimandato dal debounce: si scrive allo scadere, senza aspettare un'altra interazione
+            trascorsi = time.monotonic() - stato.get("_ultimo_salvataggio", 0.0)
+            _timer = threading.Timer(max(AUTOSAVE_DEBOUNCE_S - trascorsi, 0.0), _salva_rimandato)
+            _timer.daemon = True
+            _timer.start()
+        return scritto
+
+
+def _salva_rimandato():
+    global _timer
+    with _lock:
+        _timer = None
+        salva()
+
+
+@atexit.register
+def _salva_in_uscita():
+    """Ultime modifiche ancora rimandate dal debounce alla chiusura del processo."""
+    with _lock:
+        if _stato is not None and stato_modificato(_stato):
+            save_state(_stato, force=True)
+
+
+@contextmanager
+def modifica():
+    """Blocco di modifiche allo stato (es. simula tutti, genera tabellone)."""
+    with _lock:
+        stato = get_stato()
+        yield stato
+        segna_modificato(stato)
+        _prepara_letture(stato)
+
+
+@contextmanager
+def lettura():
+    """Lettura coerente dello stato da un thread che non è una sessione (es. tabellone pubblico)."""
+    with _lock:
+        yield get_stato()
+
+
+def revisione_partita(partita):
+    return partita.get("rev", 0)
+
+
+@contextmanager
+def modifica_partita(state, partita, rev_letta=None):
+    """Modifica di una partita; con rev_letta, solo se nessuno l'ha cambiata nel frattempo.
+
+    Controllo e modifica stanno sotto il lock globale: una conferma aggiorna
+    anche classifiche e partite a valle nel tabellone, che altre sessioni
+    possono toccare nello stesso momento.
+    """
+    with _lock:
+        if rev_letta is not None and revisione_partita(partita) != rev_letta:
+            raise ConflittoRevisione(partita["id"])
+        yield partita
+        segna_modificato(state)
+        _prepara_letture(state)
@@ -0,0 +1,418 @@
+"""
+storage_sqlite.py — Backend SQLite (WAL) per stato torneo e incassi
+
+Attivazione:  BV_STORAGE=sqlite streamlit run app.py
+Import una tantum dai file JSON esistenti:  python storage_sqlite.py
+
+Il salvataggio confronta ogni riga con l'ultima versione scritta e aggiorna
+solo quelle cambiate: confermare una partita tocca la sua riga in `partite`
+e i suoi set in `set_punteggi`, non l'intero archivio.
+
+Costo: a essere differenziale è solo la scrittura. Ogni salva() ricostruisce
+e confronta in memoria le tuple di tutti gli atleti, squadre, partite e
+tornei archiviati (_righe_*), quindi resta O(N) nella dimensione dello
+stato; le sole righe sporche non si possono individuare perché molte
+modifiche (calendario, squadra al servizio) non passano da
+segna_partita_modificata().
+"""
+import json, sqlite3, threading
+
+from data_manager import DATA_FILE, INCASSI_FILE, leggi_json_con_recupero
+
+DB_FILE = "beach_volley.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    chiave TEXT PRIMARY KEY,
+    valore TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS atleti (
+    id TEXT PRIMARY KEY,
+    ordine INTEGER NOT NULL,
+    nome TEXT NOT NULL,
+    tornei INTEGER, vittorie INTEGER, sconfitte INTEGER,
+    set_vinti INTEGER, set_persi INTEGER,
+    punti_fatti INTEGER, punti_subiti INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS storico_posizioni (
+    atleta_id TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    torneo TEXT,
+    posizione INTEGER,
+    torneo_id TEXT,                 -- chiave in archivio_tornei
+    PRIMARY KEY (atleta_id, n)
+);
+CREATE TABLE IF NOT EXISTS squadre (
+    id TEXT PRIMARY KEY,
+    ordine INTEGER NOT NULL,
+    nome TEXT,
+    atleta1 TEXT, atleta2 TEXT,
+    punti_classifica INTEGER,
+    set_vinti INTEGER, set_persi INTEGER,
+    punti_fatti INTEGER, punti_subiti INTEGER,
+    vittorie INTEGER, sconfitte INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS gironi (
+    idx INTEGER PRIMARY KEY,
+    nome TEXT,
+    squadre TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS partite (
+    id TEXT PRIMARY KEY,
+    contenitore TEXT NOT NULL,      -- 'g<idx>' per i gironi, 'bracket'
+    ordine INTEGER NOT NULL,
+    sq1 TEXT, sq2 TEXT,
+    fase TEXT, girone INTEGER,
+    set_sq1 INTEGER, set_sq2 INTEGER,
+    in_battuta INTEGER,
+    confermata INTEGER,
+    vincitore TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS partite_contenitore ON partite (contenitore, ordine);
+CREATE TABLE IF NOT EXISTS set_punteggi (
+    partita_id TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    p1 INTEGER, p2 INTEGER,
+    PRIMARY KEY (partita_id, n)
+);
+CREATE TABLE IF NOT EXISTS archivio_tornei (
+    id TEXT PRIMARY KEY,
+    dati TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS incassi_tornei (
+    nome TEXT PRIMARY KEY,
+    ordine INTEGER NOT NULL,
+    data TEXT,
+    quota_iscrizione REAL,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS pagamenti (
+    torneo TEXT NOT NULL,
+    squadra_id TEXT NOT NULL,
+    ordine INTEGER NOT NULL,
+    importo REAL,
+    pagato INTEGER,
+    note TEXT,
+    extra TEXT,
+    PRIMARY KEY (torneo, squadra_id)
+);
+"""
+
+STATS_ATLETA = ("tornei", "vittorie", "sconfitte", "set_vinti", "set_persi",
+                "punti_fatti", "punti_subiti")
+STATS_SQUADRA = ("punti_classifica", "set_vinti", "set_persi", "punti_fatti",
+                 "punti_subiti", "vittorie", "sconfitte")
+CAMPI_PARTITA = ("sq1", "sq2", "fase", "girone", "set_sq1", "set_sq2",
+                 "in_battuta", "confermata", "vincitore")
+
+# Chiavi top-level con tabelle dedicate; tutte le altre finiscono in `meta`
+CHIAVI_TABELLATE = {"atleti", "squadre", "gironi", "bracket", "archivio_tornei"}
+
+
+def _js(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _extra(obj, noti):
+    resto = {k: v for k, v in obj.items() if k not in noti}
+    return _js(resto) if resto else None
+
+
+def _da_extra(testo):
+    return json.loads(testo) if testo else {}
+
+
+# ─── RIGHE (stato → tuple) ───────────────────────────────────────────────────
+
+def _righe_atleti(state):
+    atleti, storico = {}, {}
+    for i, a in enumerate(state.get("atleti", [])):
+        s = a.get("stats", {})
+        extra = {k: v for k, v in a.items() if k not in ("id", "nome", "stats")}
+        altre_stats = {k: v for k, v in s.items() if k not in STATS_ATLETA and k != "storico_posizioni"}
+        if altre_stats:
+            extra["_stats"] = altre_stats
+        atleti[a["id"]] = (i, a["nome"], *(s.get(k, 0) for k in STATS_ATLETA),
+                           _js(extra) if extra else None)
+        storico[a["id"]] = tuple(
+            (v[0], v[1], v[2] if len(v) > 2 else None) for v in s.get("storico_posizioni", [])
+        )
+    return atleti, storico
+
+
+def _righe_squadre(state):
+    righe = {}
+    for i, sq in enumerate(state.get("squadre", [])):
+        a1, a2 = (list(sq.get("atleti", [])) + [None, None])[:2]
+        righe[sq["id"]] = (i, sq.get("nome"), a1, a2, *(sq.get(k, 0) for k in STATS_SQUADRA),
+                           _extra(sq, {"id", "nome", "atleti", *STATS_SQUADRA}))
+    return righe
+
+
+def _righe_partite(state):
+    partite, sets = {}, {}
+
+    def aggiungi(p, contenitore, ordine):
+        valori = [p.get(k) for k in CAMPI_PARTITA]
+        valori[CAMPI_PARTITA.index("confermata")] = int(bool(p.get("confermata")))
+        partite[p["id"]] = (contenitore, ordine, *valori,
+                            _extra(p, {"id", "punteggi", *CAMPI_PARTITA}))
+        sets[p["id"]] = tuple((ps[0], ps[1]) for ps in p.get("punteggi", []))
+
+    for gi, g in enumerate(state.get("gironi", [])):
+        for j, p in enumerate(g.get("partite", [])):
+            aggiungi(p, f"g{gi}", j)
+    for j, p in enumerate(state.get("bracket", [])):
+        aggiungi(p, "bracket", j)
+    return partite, sets
+
+
+def _righe_gironi(state):
+    return {
+        i: (g.get("nome"), _js(g.get("squadre", [])), _extra(g, {"nome", "squadre", "partite"}))
+        for i, g in enumerate(state.get("gironi", []))
+    }
+
+
+def _righe_meta(state):
+    return {k: (_js(v),) for k, v in state.items() if k not in CHIAVI_TABELLATE}
+
+
+def _righe_archivio(state):
+    return {tid: (_js(t),) for tid, t in state.get("archivio_tornei", {}).items()}
+
+
+def _righe_incassi(data):
+    tornei, pagamenti = {}, {}
+    for i, (nome, t) in enumerate(data.get("tornei", {}).items()):
+        tornei[nome] = (i, t.get("data"), t.get("quota_iscrizione"),
+                        _extra(t, {"data", "quota_iscrizione", "pagamenti"}))
+        for j, p in enumerate(t.get("pagamenti", [])):
+            pagamenti[(nome, p["squadra_id"])] = (
+                j, p.get("importo"), int(bool(p.get("pagato"))), p.get("note"),
+                _extra(p, {"squadra_id", "importo", "pagato", "note"}),
+            )
+    return tornei, pagamenti
+
+
+# ─── BACKEND ─────────────────────────────────────────────────────────────────
+
+class SQLiteBackend:
+    """Stato torneo su SQLite. Una sola istanza per file, condivisa tra le sessioni."""
+
+    # tabella → (colonne chiave, colonne valore)
+    TABELLE = {
+        "meta": (("chiave",), ("valore",)),
+        "atleti": (("id",), ("ordine", "nome", *STATS_ATLETA, "extra")),
+        "squadre": (("id",), ("ordine", "nome", "atleta1", "atleta2", *STATS_SQUADRA, "extra")),
+        "gironi": (("idx",), ("nome", "squadre", "extra")),
+        "partite": (("id",), ("contenitore", "ordine", *CAMPI_PARTITA, "extra")),
+        "archivio_tornei": (("id",), ("dati",)),
+        "incassi_tornei": (("nome",), ("ordine", "data", "quota_iscrizione", "extra")),
+        "pagamenti": (("torneo", "squadra_id"), ("ordine", "importo", "pagato", "note", "extra")),
+    }
+    # tabelle figlie: una riga per elemento della lista, riscritte per genitore
+    FIGLIE = {
+        "storico_posizioni": ("atleta_id", ("torneo", "posizione", "torneo_id")),
+        "set_punteggi": ("partita_id", ("p1", "p2")),
+    }
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._cache = {}      # tabella → {chiave: riga} com'è ora nel DB
+
+    # ── lettura ──────────────────────────────────────────────────────────────
+
+    def _leggi_tabella(self, tabella):
+        chiavi, valori = self.TABELLE[tabella]
+        n = len(chiavi)
+        righe = {}
+        for r in self.conn.execute(f"SELECT {', '.join(chiavi + valori)} FROM {tabella}"):
+            k = r[0] if n == 1 else tuple(r[:n])
+            righe[k] = tuple(r[n:])
+        self._cache[tabella] = righe
+        return righe
+
+    def _leggi_figlie(self, tabella):
+        genitore, valori = self.FIGLIE[tabella]
+        figlie = {}
+        for r in self.conn.execute(
+                f"SELECT {genitore}, {', '.join(valori)} FROM {tabella} ORDER BY {genitore}, n"):
+            figlie.setdefault(r[0], []).append(tuple(r[1:]))
+        figlie = {k: tuple(v) for k, v in figlie.items()}
+        self._cache[tabella] = figlie
+        return figlie
+
+    def _ordinate(self, righe):
+        return sorted(righe.items(), key=lambda kv: kv[1][0])
+
+    def carica(self):
+        """Ricostruisce lo stato (stessa forma del JSON). None se il DB è vuoto."""
+        with self.lock:
+            meta = self._leggi_tabella("meta")
+            if not meta:
+                for t in list(self.TABELLE) + list(self.FIGLIE):
+                    self._cache[t] = {}
+                return None
+            state = {k: json.loads(v[0]) for k, v in meta.items()}
+
+            storico = self._leggi_figlie("storico_posizioni")
+            state["atleti"] = []
+            for aid, r in self._ordinate(self._leggi_tabella("atleti")):
+                extra = _da_extra(r[-1])
+                stats = dict(zip(STATS_ATLETA, r[2:-1]))
+                stats.update(extra.pop("_stats", {}))
+                stats["storico_posizioni"] = [
+                    list(x) if x[2] is not None else list(x[:2]) for x in storico.get(aid, ())
+                ]
+                state["atleti"].append({"id": aid, "nome": r[1], "stats": stats, **extra})
+
+            state["squadre"] = []
+            for sid, r in self._ordinate(self._leggi_tabella("squadre")):
+                sq = {"id": sid, "nome": r[1], "atleti": [a for a in r[2:4] if a is not None]}
+                sq.update(zip(STATS_SQUADRA, r[4:-1]))
+                sq.update(_da_extra(r[-1]))
+                state["squadre"].append(sq)
+
+            sets = self._leggi_figlie("set_punteggi")
+            contenitori = {}
+            for pid, r in sorted(self._leggi_tabella("partite").items(), key=lambda kv: (kv[1][0], kv[1][1])):
+                p = {"id": pid, **dict(zip(CAMPI_PARTITA, r[2:-1]))}
+                p["confermata"] = bool(p["confermata"])
+                p["punteggi"] = [list(x) for x in sets.get(pid, ())]
+                p.update(_da_extra(r[-1]))
+                contenitori.setdefault(r[0], []).append(p)
+
+            state["gironi"] = []
+            for idx, r in sorted(self._leggi_tabella("gironi").items()):
+                g = {"nome": r[0], "squadre": json.loads(r[1]), "partite": contenitori.get(f"g{idx}", [])}
+                g.update(_da_extra(r[2]))
+                state["gironi"].append(g)
+            state["bracket"] = contenitori.get("bracket", [])
+
+            state["archivio_tornei"] = {
+                tid: json.loads(r[0]) for tid, r in self._leggi_tabella("archivio_tornei").items()
+            }
+            return state
+
+    # ── scrittura differenziale ──────────────────────────────────────────────
+
+    def _sincronizza(self, tabella, nuove):
+        """Upsert delle righe cambiate, delete di quelle sparite."""
+        chiavi, valori = self.TABELLE[tabella]
+        vecchie = self._cache.get(tabella)
+        if vecchie is None:
+            vecchie = self._leggi_tabella(tabella)
+        cambiate = [(k, r) for k, r in nuove.items() if vecchie.get(k) != r]
+        sparite = [k for k in vecchie if k not in nuove]
+        if cambiate:
+            colonne = chiavi + valori
+            sql = (f"INSERT OR REPLACE INTO {tabella} ({', '.join(colonne)}) "
+                   f"VALUES ({', '.join('?' * len(colonne))})")
+            self.conn.executemany(sql, [
+                (*(k if isinstance(k, tuple) else (k,)), *r) for k, r in cambiate
+            ])
+        if sparite:
+            where = " AND ".join(f"{c} = ?" for c in chiavi)
+            self.conn.executemany(f"DELETE FROM {tabella} WHERE {where}", [
+                k if isinstance(k, tuple) else (k,) for k in sparite
+            ])
+        self._cache[tabella] = nuove
+        return len(cambiate) + len(sparite)
+
+    def _sincronizza_figlie(self, tabella, nuove):
+        genitore, valori = self.FIGLIE[tabella]
+        vecchie = self._cache.get(tabella)
+        if vecchie is None:
+            vecchie = self._leggi_figlie(tabella)
+        toccati = [k for k in set(vecchie) | set(nuove) if vecchie.get(k, ()) != nuove.get(k, ())]
+        for k in toccati:
+            self.conn.execute(f"DELETE FROM {tabella} WHERE {genitore} = ?", (k,))
+            self.conn.executemany(
+                f"INSERT INTO {tabella} ({genitore}, n, {', '.join(valori)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(valori))})",
+                [(k, n, *r) for n, r in enumerate(nuove.get(k, ()))],
+            )
+        self._cache[tabella] = {k: v for k, v in nuove.items() if v}
+        return len(toccati)
+
+    def salva(self, state):
+        """Scrive solo le righe cambiate dall'ultimo salvataggio. Ritorna quante."""
+        atleti, storico = _righe_atleti(state)
+        partite, sets = _righe_partite(state)
+        with self.lock, self.conn:
+            n = self._sincronizza("meta", _righe_meta(state))
+            n += self._sincronizza("atleti", atleti)
+            n += self._sincronizza_figlie("storico_posizioni", storico)
+            n += self._sincronizza("squadre", _righe_squadre(state))
+            n += self._sincronizza("gironi", _righe_gironi(state))
+            n += self._sincronizza("partite", partite)
+            n += self._sincronizza_figlie("set_punteggi", sets)
+            n += self._sincronizza("archivio_tornei", _righe_archivio(state))
+        return n
+
+    # ── incassi ──────────────────────────────────────────────────────────────
+
+    def carica_incassi(self):
+        with self.lock:
+            pagamenti = {}
+            for (torneo, sid), r in sorted(self._leggi_tabella("pagamenti").items(), key=lambda kv: kv[1][0]):
+                p = {"squadra_id": sid, "importo": r[1], "pagato": bool(r[2]), "note": r[3]}
+                p.update(_da_extra(r[4]))
+                pagamenti.setdefault(torneo, []).append(p)
+            tornei = {}
+            for nome, r in self._ordinate(self._leggi_tabella("incassi_tornei")):
+                t = {"data": r[1], "quota_iscrizione": r[2], "pagamenti": pagamenti.get(nome, [])}
+                t.update(_da_extra(r[3]))
+                tornei[nome] = t
+            return {"tornei": tornei}
+
+    def salva_incassi(self, data):
+        tornei, pagamenti = _righe_incassi(data)
+        with self.lock, self.conn:
+            return (self._sincronizza("incassi_tornei", tornei)
+                    + self._sincronizza("pagamenti", pagamenti))
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(path=DB_FILE):
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = SQLiteBackend(path)
+        return _backends[path]
+
+
+# ─── IMPORT DAI FILE JSON ────────────────────────────────────────────────────
+
+def importa_da_json(json_path=DATA_FILE, incassi_path=INCASSI_FILE, db_path=DB_FILE):
+    """Copia una tantum i file JSON esistenti nel database SQLite."""
+    backend = get_backend(db_path)
+    n_stato = n_incassi = 0
+    state = leggi_json_con_recupero(json_path)
+    if state is not None:
+        state.setdefault("archivio_tornei", {})
+        n_stato = backend.salva(state)
+    incassi = leggi_json_con_recupero(incassi_path)
+    if incassi is not None:
+        n_incassi = backend.salva_incassi(incassi)
+    return n_stato, n_incassi
+
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv[1:]
+    n_stato, n_incassi = importa_da_json(*args)
+    print(f"Importate {n_stato} righe di stato e {n_incassi} righe di incassi in "
+          f"{args[2] if len(args) > 2 else DB_FILE}")
@@ -0,0 +1,277 @@
+"""
+tabellone_pubblico.py — Tabellone in sola lettura per pubblico e speaker (HTTP locale)
+
+Un piccolo server HTTP nello stesso processo di Streamlit (legge lo stato
+condiviso di stato_condiviso.py e i punteggi live di giornale_live.py):
+  GET /            pagina per il maxischermo, si aggiorna da sola
+  GET /stato.json  istantanea di punteggi live, classifiche gironi,
+                   tabellone e prossime partite
+
+L'istantanea si ricalcola solo quando cambia qualcosa (revisione dello
+stato o versione del giornale live) ed è servita con un ETag: gli schermi
+interrogano ogni pochi secondi con If-None-Match e, se nulla è cambiato,
+ricevono un 304 vuoto. Cento schermi non fanno rieseguire app.py né
+rileggere il file dati.
+
+Di default il server ascolta solo su 127.0.0.1: per i maxischermi in rete
+locale va esposto esplicitamente con BV_PUBBLICO_HOST=0.0.0.0 (o l'indirizzo
+della scheda di rete).
+"""
+import json, os, secrets, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from data_manager import nome_squadra
+from classifiche import classifiche_gironi
+from bracket_engine import turni_tabellone
+from stato_condiviso import lettura
+from giornale_live import punteggi_live
+
+# 0 = server disattivato
+PORTA = int(os.environ.get("BV_PUBBLICO_PORTA", "8502") or 0)
+HOST = os.environ.get("BV_PUBBLICO_HOST", "127.0.0.1")
+POLLING_MS = 2000
+PROSSIME_PARTITE = 6
+
+_cache = None            # (chiave, etag, corpo json)
+# La versione del giornale live riparte da 0 a ogni avvio: senza questo
+# prefisso uno schermo potrebbe ricevere 304 per un ETag di prima del riavvio.
+_AVVIO = secrets.token_hex(4)
+_cache_lock = threading.Lock()
+_server = None
+_server_lock = threading.Lock()
+
+
+# ─── ISTANTANEA ──────────────────────────────────────────────────────────────
+
+def _partita_pubblica(state, p, etichetta):
+    return {"id": p["id"], "etichetta": etichetta, "campo": p.get("campo"),
+            "orario": p.get("orario"),
+            "sq1": nome_squadra(state, p["sq1"]), "sq2": nome_squadra(state, p["sq2"])}
+
+
+def costruisci_istantanea(state, live):
+    """Dict JSON-serializzabile di ciò che vede il pubblico; live = {pid: stato} del giornale."""
+    t = state["torneo"]
+    etichette = {}
+    for g in state["gironi"]:
+        for p in g["partite"]:
+            etichette[p["id"]] = (p, g["nome"])
+    tabellone = []
+    for nome, partite in turni_tabellone(state["bracket"]):
+        righe = []
+        for p in partite:
+            etichette[p["id"]] = (p, nome)
+            if p.get("non_necessaria"):
+                continue
+            riga = _partita_pubblica(state, p, nome)
+            riga.update({"punteggi": [list(x) for x in p["punteggi"]],
+                         "vincitore": (1 if p["vincitore"] == p["sq1"] else 2) if p["confermata"] else None})
+            righe.append(riga)
+        tabellone.append({"turno": nome, "partite": righe})
+
+    in_campo = []
+    for pid, (p1, p2, s1, s2, battuta, sets) in live.items():
+        if pid not in etichette or etichette[pid][0]["confermata"]:
+            continue
+        riga = _partita_pubblica(state, *etichette[pid])
+        riga.update({"p1": p1, "p2": p2, "s1": s1, "s2": s2, "battuta": battuta,
+                     "sets": [list(x) for x in sets]})
+        in_campo.append(riga)
+    in_campo.sort(key=lambda r: (r["campo"] is None, r["campo"] or 0))
+
+    prossime = sorted(
+        (p for p, _ in etichette.values()
+         if not p["confermata"] and p.get("slot") is not None and p["id"] not in live
+         and p["sq1"] and p["sq2"]),
+        key=lambda p: (p["slot"], p.get("campo") or 0),
+    )[:PROSSIME_PARTITE]
+
+    return {
+        "torneo": t["nome"],
+        "fase": state["fase"],
+        "live": in_campo,
+        "gironi": [
+            {"nome": g["nome"], "righe": [
+                {"pos": r["posizione"], "squadra": nome_squadra(state, r["id"]),
+                 "punti": r["punti"], "v": r["vittorie"], "p": r["sconfitte"],
+                 "sv": r["set_vinti"], "sp": r["set_persi"],
+                 "pf": r["punti_fatti"], "ps": r["punti_subiti"], "qualifica": r["qualifica"]}
+                for r in righe]}
+            for g, righe in classifiche_gironi(state["gironi"], t["qualificate_girone"], t["ripescate"])
+        ],
+        "tabellone": tabellone,
+        "prossime": [_partita_pubblica(state, p, etichette[p["id"]][1]) for p in prossime],
+    }
+
+
+def istantanea():
+    """(etag, corpo json) aggiornati: si ricalcola solo se stato o punteggi live sono cambiati."""
+    global _cache
+    versione_live, live = punteggi_live()
+    with lettura() as state:
+        chiave = (state["torneo"]["seed"], state.get("revisione", 0), versione_live)
+        with _cache_lock:
+            if _cache is None or _cache[0] != chiave:
+                corpo = json.dumps(costruisci_istantanea(state, live), ensure_ascii=False,
+                                   separators=(",", ":")).encode("utf-8")
+                _cache = (chiave, '"%s-%s-%s-%s"' % (_AVVIO, *chiave), corpo)
+            return _cache[1], _cache[2]
+
+
+# ─── SERVER HTTP ─────────────────────────────────────────────────────────────
+
+class _Gestore(BaseHTTPRequestHandler):
+    def do_GET(self):
+        percorso = self.path.split("?", 1)[0]
+        if percorso == "/":
+            self._rispondi(200, PAGINA.replace("__POLLING_MS__", str(POLLING_MS)).encode("utf-8"),
+                           "text/html; charset=utf-8")
+        elif percorso == "/stato.json":
+            etag, corpo = istantanea()
+            if self.headers.get("If-None-Match") == etag:
+                self._rispondi(304, b"", None, etag)
+            else:
+                self._rispondi(200, corpo, "application/json; charset=utf-8", etag)
+        else:
+            self._rispondi(404, b"", None)
+
+    def _rispondi(self, codice, corpo, tipo, etag=None):
+        self.send_response(codice)
+        if tipo:
+            self.send_header("Content-Type", tipo)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass        # una riga per ogni polling di ogni schermo: troppo rumore
+
+
+def avvia_server(porta=PORTA, host=HOST):
+    """Avvia il server una volta per processo; ritorna (host, porta), o None se disattivato/occupata."""
+    global _server
+    with _server_lock:
+        if _server is None and porta:
+            try:
+                _server = ThreadingHTTPServer((host, porta), _Gestore)
+            except OSError:
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="tabellone-pubblico",
+                             daemon=True).start()
+        return _server.server_address[:2] if _server else None
+
+
+# ─── PAGINA ──────────────────────────────────────────────────────────────────
+# Nomi e punteggi entrano nel DOM con textContent: niente HTML dai dati.
+
+PAGINA = """<!doctype html>
+<html lang="it"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width,initial-scale=1">
+<title>🏐 Tabellone</title>
+<style>
+body{margin:0;padding:24px;background:#0a0a0f;color:#f0f0f5;font-family:"Barlow Condensed",Arial,sans-serif}
+h1{margin:0 0 20px;text-align:center;font-size:2.6rem;letter-spacing:3px;text-transform:uppercase}
+h2{color:#e8002d;font-size:1.2rem;letter-spacing:4px;text-transform:uppercase;margin:28px 0 10px}
+.griglia{display:grid;grid-template-columns:repeat(auto-fill,minmax(420px,1fr));gap:16px}
+.card{background:#13131a;border:1px solid #2a2a38;border-radius:10px;padding:14px 18px}
+.etichetta{color:#8888a0;font-size:.9rem;letter-spacing:2px;text-transform:uppercase}
+.live{display:grid;grid-template-columns:1fr auto 1fr;align-items:center;gap:12px;text-align:center}
+.nome{font-size:1.5rem;font-weight:700}.sq1{color:#e8002d}.sq2{color:#0070f3}
+.punti{font-size:4.5rem;font-weight:800;line-height:1}
+.set{color:#8888a0;font-size:1rem}
+table{width:100%;border-collapse:collapse;font-size:1.15rem}
+th{color:#8888a0;font-weight:600;font-size:.85rem;text-align:center;padding:4px}
+td{text-align:center;padding:5px 4px;border-top:1px solid #2a2a38}
+td.sq{text-align:left;font-weight:600}.pts{color:#ffd700;font-weight:800}
+.diretta td:first-child{border-left:4px solid #00c853}.ripescata td:first-child{border-left:4px solid #ffd700}
+.vinta{font-weight:800;color:#ffd700}
+#stato{position:fixed;right:12px;bottom:8px;color:#55556a;font-size:.8rem}
+</style></head><body>
+<h1 id="torneo">🏐</h1>
+<div id="contenuto"></div>
+<div id="stato"></div>
+<script>
+let etag = null;
+function el(tag, cls, testo) {
+  const e = document.createElement(tag);
+  if (cls) e.className = cls;
+  if (testo !== undefined && testo !== null) e.textContent = testo;
+  return e;
+}
+function sezione(titolo, figli) {
+  const s = el("section"); s.append(el("h2", null, titolo));
+  const g = el("div", "griglia"); figli.forEach(f => g.append(f)); s.append(g);
+  return s;
+}
+function cardLive(m) {
+  const c = el("div", "card");
+  c.append(el("div", "etichetta", (m.campo ? "Campo " + m.campo + " · " : "") + m.etichetta));
+  const r = el("div", "live");
+  const lato = (n, p, s, cls, batt) => {
+    const d = el("div"); d.append(el("div", "nome " + cls, (batt ? "🏐 " : "") + n));
+    d.append(el("div", "punti " + cls, p)); d.append(el("div", "set", "set " + s)); return d;
+  };
+  r.append(lato(m.sq1, m.p1, m.s1, "sq1", m.battuta === 1), el("div", "set", "–"),
+           lato(m.sq2, m.p2, m.s2, "sq2", m.battuta === 2));
+  c.append(r);
+  if (m.sets.length) c.append(el("div", "set", m.sets.map(s => s[0] + "-" + s[1]).join("  ")));
+  return c;
+}
+function cardGirone(g) {
+  const c = el("div", "card"); c.append(el("div", "etichetta", g.nome));
+  const t = el("table"), h = el("tr");
+  ["#", "SQUADRA", "PTS", "V", "P", "SV", "SP", "PF", "PS"].forEach(x => h.append(el("th", null, x)));
+  t.append(h);
+  g.righe.forEach(r => {
+    const tr = el("tr", r.qualifica || "");
+    [[r.pos], [r.squadra, "sq"], [r.punti, "pts"], [r.v], [r.p], [r.sv], [r.sp], [r.pf], [r.ps]]
+      .forEach(([v, cls]) => tr.append(el("td", cls, v)));
+    t.append(tr);
+  });
+  c.append(t); return c;
+}
+function cardTurno(t) {
+  const c = el("div", "card"); c.append(el("div", "etichetta", t.turno));
+  const tab = el("table");
+  t.partite.forEach(p => {
+    const tr = el("tr");
+    tr.append(el("td", "sq" + (p.vincitore === 1 ? " vinta" : ""), p.sq1),
+              el("td", null, p.punteggi.map(s => s[0] + "-" + s[1]).join(" ")),
+              el("td", "sq" + (p.vincitore === 2 ? " vinta" : ""), p.sq2));
+    tab.append(tr);
+  });
+  c.append(tab); return c;
+}
+function cardProssima(p) {
+  const c = el("div", "card");
+  c.append(el("div", "etichetta", [p.orario, p.campo ? "Campo " + p.campo : null, p.etichetta]
+    .filter(Boolean).join(" · ")));
+  c.append(el("div", "nome", p.sq1 + "  vs  " + p.sq2));
+  return c;
+}
+function mostra(d) {
+  document.getElementById("torneo").textContent = "🏐 " + (d.torneo || "Beach Volley");
+  const sezioni = [];
+  if (d.live.length) sezioni.push(sezione("🔴 In campo", d.live.map(cardLive)));
+  if (d.prossime.length) sezioni.push(sezione("⏭️ Prossime partite", d.prossime.map(cardProssima)));
+  if (d.tabellone.length) sezioni.push(sezione("⚡ Tabellone", d.tabellone.map(cardTurno)));
+  if (d.gironi.length) sezioni.push(sezione("📊 Classifiche gironi", d.gironi.map(cardGirone)));
+  document.getElementById("contenuto").replaceChildren(...sezioni);
+}
+async function aggiorna() {
+  try {
+    const r = await fetch("/stato.json", {cache: "no-store", headers: etag ? {"If-None-Match": etag} : {}});
+    if (r.status === 200) { etag = r.headers.get("ETag"); mostra(await r.json()); }
+    document.getElementById("stato").textContent = "aggiornato " + new Date().toLocaleTimeString();
+  } catch (e) {
+    document.getElementById("stato").textContent = "⚠️ connessione persa, riprovo…";
+  }
+  setTimeout(aggiorna, __POLLING_MS__);
+}
+aggiorna();
+</script></body></html>
+"""
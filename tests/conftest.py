@@ -0,0 +1,5 @@
+import os
+import sys
+
+# i moduli dell'app stanno nella radice del repository, non in un pacchetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+"""
+Podio del tabellone a doppia eliminazione, anche con meno di tre squadre.
+"""
+import itertools
+
+import pytest
+
+from bracket_engine import avanza_vincitore, genera_doppia_eliminazione, giocabile, podio_da_tabellone
+from data_manager import empty_state, imposta_risultato
+
+
+def _gioca(squadre, esiti, spareggio=True):
+    """Tabellone giocato fino in fondo; esiti[i] = True se vince sq1 nell'i-esima partita."""
+    state = empty_state()
+    state["bracket"] = genera_doppia_eliminazione(state, squadre, spareggio=spareggio)
+    esiti = iter(esiti)
+    giocata = True
+    while giocata:
+        giocata = False
+        for p in state["bracket"]:
+            if giocabile(p):
+                imposta_risultato(p, [(21, 15)] if next(esiti) else [(15, 21)])
+                avanza_vincitore(state, p)
+                giocata = True
+    return state["bracket"]
+
+
+@pytest.mark.parametrize("spareggio", [True, False])
+@pytest.mark.parametrize("esiti", list(itertools.product([True, False], repeat=3)))
+def test_podio_due_squadre(esiti, spareggio):
+    podio = podio_da_tabellone(_gioca(["sq_1", "sq_2"], itertools.cycle(esiti), spareggio))
+    assert [pos for pos, _ in podio] == [1, 2]
+    assert {sid for _, sid in podio} == {"sq_1", "sq_2"}
+
+
+@pytest.mark.parametrize("n", [3, 4, 5, 8])
+def test_podio_tre_squadre_distinte(n):
+    squadre = [f"sq_{i}" for i in range(1, n + 1)]
+    for esiti in itertools.product([True, False], repeat=4):
+        podio = podio_da_tabellone(_gioca(squadre, itertools.cycle(esiti)))
+        assert [pos for pos, _ in podio] == [1, 2, 3]
+        assert len({sid for _, sid in podio}) == 3
+
+
+def test_podio_senza_slot_vuoti():
+    # finale perdenti con un bye: non ha uno sconfitto da mettere terzo
+    bracket = [
+        {"id": "p_1", "tabellone": "vincenti", "sq1": "sq_1", "sq2": "sq_2", "vincitore": "sq_1",
+         "confermata": True, "prossima": "p_3"},
+        {"id": "p_2", "tabellone": "perdenti", "sq1": "sq_2", "sq2": None, "vincitore": "sq_2",
+         "confermata": True, "prossima": "p_3"},
+        {"id": "p_3", "tabellone": "finale", "sq1": "sq_1", "sq2": "sq_2", "vincitore": "sq_1",
+         "confermata": True, "prossima": None},
+    ]
+    assert podio_da_tabellone(bracket) == [(1, "sq_1"), (2, "sq_2")]
+
+
+@pytest.mark.parametrize("vince_sq1", [True, False])
+def test_avanza_cambia_revisione_delle_partite_toccate(vince_sq1):
+    state = empty_state()
+    state["bracket"] = genera_doppia_eliminazione(state, ["sq_1", "sq_2"])
+    primo, finale, spareggio = state["bracket"]
+    imposta_risultato(primo, [(21, 15)])
+    prima = finale.get("rev", 0)
+    avanza_vincitore(state, primo)
+    assert finale.get("rev", 0) > prima
+
+    # la finalissima decide se lo spareggio si gioca: anche lui cambia revisione
+    prima = spareggio.get("rev", 0)
+    imposta_risultato(finale, [(21, 15)] if vince_sq1 else [(15, 21)])
+    avanza_vincitore(state, finale)
+    assert spareggio["non_necessaria"] is vince_sq1
+    assert spareggio.get("rev", 0) > prima
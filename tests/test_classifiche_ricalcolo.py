@@ -0,0 +1,69 @@
+"""
+ricalcola_classifiche() dà gli stessi contatori degli aggiornamenti
+incrementali, anche dopo correzioni e annullamenti nei gironi e nel tabellone.
+"""
+import random
+
+from bracket_engine import avanza_vincitore, giocabile
+from data_manager import (
+    CONTATORI_SQUADRA, aggiorna_classifica_squadra, aggiungi_atleta, aggiungi_squadra,
+    annulla_risultato, correggi_risultato, empty_state, genera_bracket_da_gironi, genera_gironi,
+    new_atleta, new_squadra, ricalcola_classifiche, simula_partita
+)
+
+
+def _contatori(state):
+    return {sq["id"]: [sq[c] for c in CONTATORI_SQUADRA] for sq in state["squadre"]}
+
+
+def _torneo(n_squadre=10, seed=7):
+    state = empty_state()
+    for i in range(n_squadre):
+        a1 = aggiungi_atleta(state, new_atleta(state, f"A{i}a"))
+        a2 = aggiungi_atleta(state, new_atleta(state, f"A{i}b"))
+        aggiungi_squadra(state, new_squadra(state, f"S{i}", a1["id"], a2["id"]))
+    state["gironi"] = genera_gironi(state, [sq["id"] for sq in state["squadre"]], 2,
+                                    rng=random.Random(seed))
+    return state
+
+
+def _gioca(state, partita, rng):
+    simula_partita(state, partita, p=rng.uniform(0.4, 0.6), rng=rng)
+    aggiorna_classifica_squadra(state, partita)
+
+
+def test_ricalcolo_uguale_agli_incrementali():
+    rng = random.Random(3)
+    state = _torneo()
+    partite_gironi = [p for g in state["gironi"] for p in g["partite"]]
+    for p in partite_gironi:
+        _gioca(state, p, rng)
+    # correzioni (anche con cambio di vincitore) e annullamenti nei gironi
+    for p in partite_gironi[::3]:
+        correggi_risultato(state, p, [(15, 21)] if p["vincitore"] == p["sq1"] else [(21, 15)])
+    for p in partite_gironi[1::5]:
+        annulla_risultato(state, p)
+        _gioca(state, p, rng)
+    annulla_risultato(state, partite_gironi[2])
+
+    state["bracket"] = genera_bracket_da_gironi(state, state["gironi"], 2, 2)
+    for p in state["bracket"]:
+        if giocabile(p):
+            _gioca(state, p, rng)
+            avanza_vincitore(state, p)
+    primo_turno = [p for p in state["bracket"] if p["confermata"]][:4]
+    # cambio di vincitore: le partite a valle tornano da giocare
+    p = primo_turno[0]
+    correggi_risultato(state, p, [(15, 21)] if p["vincitore"] == p["sq1"] else [(21, 15)])
+    correggi_risultato(state, primo_turno[1], [(25, 23)] if primo_turno[1]["vincitore"] == primo_turno[1]["sq1"]
+                       else [(23, 25)])
+    annulla_risultato(state, primo_turno[2])
+    for p in state["bracket"]:
+        if giocabile(p):
+            _gioca(state, p, rng)
+            avanza_vincitore(state, p)
+
+    incrementali = _contatori(state)
+    assert any(any(v) for v in incrementali.values())
+    ricalcola_classifiche(state)
+    assert _contatori(state) == incrementali
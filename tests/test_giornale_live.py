@@ -0,0 +1,64 @@
+"""
+Compattazione del giornale live: per righe scritte, anche all'avvio.
+"""
+import json
+import time
+
+import pytest
+
+import giornale_live
+from registro_punti import nuovo_registro, registra
+
+
+@pytest.fixture
+def giornale(tmp_path, monkeypatch):
+    monkeypatch.setattr(giornale_live, "GIORNALE_FILE", str(tmp_path / "live.jsonl"))
+    monkeypatch.setattr(giornale_live, "COMPATTA_OLTRE", 100)
+    for nome, valore in [("_file", None), ("_righe", 0), ("_righe_compatte", 0), ("_live", None)]:
+        monkeypatch.setattr(giornale_live, nome, valore)
+    yield giornale_live
+    if giornale_live._file is not None:
+        giornale_live._file.close()
+
+
+def _righe(g):
+    with open(g.GIORNALE_FILE, encoding="utf-8") as f:
+        return [json.loads(r) for r in f]
+
+
+def _gioca(g, pid, punti, chiudi=True):
+    reg = nuovo_registro(21, "Set Unico", time.time())
+    for i in range(punti):
+        registra(reg, 1 + i % 2)
+        if i == 0:
+            g.apri(pid, reg)
+        g.evento(pid, reg)
+    if chiudi:
+        g.chiudi(pid)
+    return reg
+
+
+def test_compatta_all_avvio(giornale):
+    # giornale lasciato da un processo precedente: molte partite chiuse e una aperta
+    righe = []
+    for i in range(60):
+        righe += [{"p": f"p_{i}", "o": "apri", "pmax": 21, "formato": "Set Unico", "inizio": 0},
+                  {"p": f"p_{i}", "o": "chiudi"}]
+    righe += [{"p": "p_aperta", "o": "apri", "pmax": 21, "formato": "Set Unico", "inizio": 0},
+              {"p": "p_aperta", "o": "e", "t": 1, "d": 10}]
+    with open(giornale.GIORNALE_FILE, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(r) + "\n" for r in righe)
+
+    reg = giornale.recupera("p_aperta")
+    assert reg["stati"][-1][:2] == (1, 0)
+    assert [r["p"] for r in _righe(giornale)] == ["p_aperta", "p_aperta"]
+
+
+def test_compatta_durante_il_gioco(giornale):
+    # 5 partite da 31 righe: la compattazione scatta a 100 righe, senza contare le partite chiuse
+    for n in range(5):
+        _gioca(giornale, f"p_{n}", 29)
+    reg = _gioca(giornale, "p_aperta", 10, chiudi=False)
+    righe = _righe(giornale)
+    assert len(righe) < giornale.COMPATTA_OLTRE
+    assert giornale.recupera("p_aperta")["stati"] == reg["stati"]
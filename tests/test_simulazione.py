@@ -0,0 +1,90 @@
+"""
+Campionatori di set (simulazione.simula_set_batch e data_manager.simula_set)
+contro il modello di riferimento rally per rally, con un test chi quadro a
+due campioni su ogni punteggio finale: anche i punteggi ai vantaggi (22-20,
+23-21, ...) restano categorie separate.
+"""
+import math
+import random
+
+import numpy as np
+import pytest
+
+from data_manager import simula_set
+from simulazione import simula_set_batch
+
+CASI = [(21, 0.5), (21, 0.55), (15, 0.45), (11, 0.6)]
+
+
+def _set_rally_batch(p, limit, rng):
+    """Modello di riferimento: un rally alla volta finché qualcuno arriva a limit con 2 di scarto."""
+    p = np.asarray(p, dtype=float)
+    a = np.zeros(p.shape, dtype=np.int32)
+    b = np.zeros(p.shape, dtype=np.int32)
+    attivi = np.arange(p.size)
+    while attivi.size:
+        vince_a = rng.random(attivi.size) < p[attivi]
+        a[attivi] += vince_a
+        b[attivi] += ~vince_a
+        sa, sb = a[attivi], b[attivi]
+        finito = ((sa >= limit) | (sb >= limit)) & (np.abs(sa - sb) >= 2)
+        attivi = attivi[~finito]
+    return a, b
+
+
+def _conteggi(a, b):
+    """{(punti squadra 1, punti squadra 2): occorrenze}."""
+    punteggi, n = np.unique(np.stack([a, b], axis=1), axis=0, return_counts=True)
+    return {(int(x), int(y)): int(c) for (x, y), c in zip(punteggi, n)}
+
+
+def _chi2_due_campioni(a1, b1, a2, b2):
+    """(chi2, gradi di libertà); le categorie con meno di 10 osservazioni sono accorpate."""
+    c1, c2 = _conteggi(a1, b1), _conteggi(a2, b2)
+    n1, n2 = len(a1), len(a2)
+    x, y = [], []
+    resto1 = resto2 = 0
+    for k in c1.keys() | c2.keys():
+        o1, o2 = c1.get(k, 0), c2.get(k, 0)
+        if o1 + o2 >= 10:
+            x.append(o1); y.append(o2)
+        else:
+            resto1 += o1; resto2 += o2
+    if resto1 + resto2:
+        x.append(resto1); y.append(resto2)
+    x, y = np.array(x, dtype=float), np.array(y, dtype=float)
+    k1, k2 = math.sqrt(n2 / n1), math.sqrt(n1 / n2)
+    chi2 = float(((k1 * x - k2 * y)**2 / (x + y)).sum())
+    return chi2, len(x) - 1
+
+
+def _compatibili(chi2, gdl):
+    # soglia ~4 deviazioni standard sopra la media della chi quadro
+    return chi2 < gdl + 4 * math.sqrt(2 * gdl)
+
+
+@pytest.mark.parametrize("limit, p", CASI)
+def test_simula_set_batch(limit, p):
+    n = 200_000
+    rng = np.random.default_rng(limit * 1000 + int(p * 100))
+    a1, b1 = simula_set_batch(np.full(n, p), limit, rng)
+    a2, b2 = _set_rally_batch(np.full(n, p), limit, rng)
+    chi2, gdl = _chi2_due_campioni(a1, b1, a2, b2)
+    assert _compatibili(chi2, gdl), (chi2, gdl)
+
+
+@pytest.mark.parametrize("limit, p", CASI)
+def test_simula_set_scalare(limit, p):
+    rng = random.Random(limit * 1000 + int(p * 100))
+    a1, b1 = np.array([simula_set(limit, p=p, rng=rng) for _ in range(50_000)]).T
+    a2, b2 = _set_rally_batch(np.full(200_000, p), limit, np.random.default_rng(rng.getrandbits(32)))
+    chi2, gdl = _chi2_due_campioni(a1, b1, a2, b2)
+    assert _compatibili(chi2, gdl), (chi2, gdl)
+
+
+def test_vantaggi_oltre_il_limite():
+    rng = np.random.default_rng(1)
+    a, b = simula_set_batch(np.full(100_000, 0.5), 21, rng)
+    lunghi = np.maximum(a, b) > 22
+    assert lunghi.any()
+    assert (np.abs(a - b)[lunghi] == 2).all()
@@ -0,0 +1,51 @@
+"""
+Concorrenza ottimistica di modifica_partita(): una revisione letta prima
+della modifica di un'altra sessione fa rifiutare la conferma.
+"""
+import random
+
+import pytest
+
+import stato_condiviso
+from data_manager import (
+    aggiungi_atleta, aggiungi_squadra, empty_state, genera_gironi, imposta_risultato,
+    new_atleta, new_squadra
+)
+from stato_condiviso import ConflittoRevisione, modifica_partita, revisione_partita
+
+
+@pytest.fixture
+def stato(monkeypatch):
+    state = empty_state()
+    for i in range(4):
+        a1 = aggiungi_atleta(state, new_atleta(state, f"A{i}a"))
+        a2 = aggiungi_atleta(state, new_atleta(state, f"A{i}b"))
+        aggiungi_squadra(state, new_squadra(state, f"S{i}", a1["id"], a2["id"]))
+    state["gironi"] = genera_gironi(state, [sq["id"] for sq in state["squadre"]], 1,
+                                    rng=random.Random(1))
+    monkeypatch.setattr(stato_condiviso, "_stato", state)
+    return state
+
+
+def test_revisione_vecchia_rifiutata(stato):
+    partita = stato["gironi"][0]["partite"][0]
+    letta_da_a = letta_da_b = revisione_partita(partita)
+
+    with modifica_partita(stato, partita, letta_da_a):
+        imposta_risultato(partita, [(21, 15)])
+    revisione = stato["revisione"]
+
+    with pytest.raises(ConflittoRevisione):
+        with modifica_partita(stato, partita, letta_da_b):
+            imposta_risultato(partita, [(10, 21)])
+    assert partita["punteggi"] == [(21, 15)]
+    assert stato["revisione"] == revisione
+
+
+def test_revisione_aggiornata_accettata(stato):
+    partita = stato["gironi"][0]["partite"][0]
+    with modifica_partita(stato, partita, revisione_partita(partita)):
+        imposta_risultato(partita, [(21, 15)])
+    with modifica_partita(stato, partita, revisione_partita(partita)):
+        imposta_risultato(partita, [(19, 21)])
+    assert partita["vincitore"] == partita["sq2"]
@@ -0,0 +1,88 @@
+"""
+Backend SQLite: lo stato salvato torna identico da carica(), il salvataggio
+scrive solo le righe cambiate e l'import una tantum copia i file JSON.
+"""
+import json
+import random
+
+import pytest
+
+from bracket_engine import avanza_vincitore, giocabile
+from data_manager import (
+    aggiorna_classifica_squadra, aggiungi_atleta, aggiungi_squadra, archivia_torneo, empty_state,
+    genera_bracket_da_gironi, genera_gironi, imposta_risultato, new_atleta, new_squadra, simula_partita
+)
+from storage_sqlite import SQLiteBackend, importa_da_json
+
+
+def _persistibile(state):
+    """Come lo scrive save_state(): senza chiavi runtime, tipi JSON."""
+    return json.loads(json.dumps({k: v for k, v in state.items() if not k.startswith("_")}))
+
+
+@pytest.fixture
+def stato():
+    rng = random.Random(5)
+    state = empty_state()
+    state["torneo"]["nome"] = "Summer Cup"
+    for i in range(8):
+        a1 = aggiungi_atleta(state, new_atleta(state, f"A{i}a"))
+        a2 = aggiungi_atleta(state, new_atleta(state, f"A{i}b"))
+        aggiungi_squadra(state, new_squadra(state, f"S{i}", a1["id"], a2["id"]))
+    state["gironi"] = genera_gironi(state, [sq["id"] for sq in state["squadre"]], 2, rng=rng)
+    for g in state["gironi"]:
+        for p in g["partite"]:
+            simula_partita(state, p, rng=rng)
+            aggiorna_classifica_squadra(state, p)
+    state["bracket"] = genera_bracket_da_gironi(state, state["gironi"])
+    for p in state["bracket"][:2]:
+        if giocabile(p):
+            simula_partita(state, p, rng=rng)
+            avanza_vincitore(state, p)
+    archivia_torneo(state, [(1, "sq_1"), (2, "sq_2"), (3, "sq_3")])
+    stats = state["atleti"][0]["stats"]
+    # voce storica nel vecchio formato a due elementi, accanto a una nuova
+    stats["storico_posizioni"] = [["Torneo 2023", 2], ["Summer Cup", 1, state["torneo"]["id"]]]
+    return state
+
+
+INCASSI = {"tornei": {"Summer Cup": {
+    "data": "2025-07-01", "quota_iscrizione": 20.0, "sponsor": "Bar Spiaggia",
+    "pagamenti": [{"squadra_id": "sq_1", "importo": 20.0, "pagato": True, "note": ""},
+                  {"squadra_id": "sq_2", "importo": 10.0, "pagato": False, "note": "metà", "ricevuta": 7}],
+}}}
+
+
+def test_round_trip(tmp_path, stato):
+    db = tmp_path / "bv.db"
+    atteso = _persistibile(stato)
+    SQLiteBackend(str(db)).salva(atteso)
+    SQLiteBackend(str(db)).salva_incassi(INCASSI)
+
+    riaperto = SQLiteBackend(str(db))
+    assert riaperto.carica() == atteso
+    assert riaperto.carica_incassi() == INCASSI
+
+
+def test_salva_solo_righe_cambiate(tmp_path, stato):
+    backend = SQLiteBackend(str(tmp_path / "bv.db"))
+    assert backend.carica() is None
+    backend.salva(_persistibile(stato))
+    assert backend.salva(_persistibile(stato)) == 0
+
+    partita = next(p for p in stato["bracket"] if giocabile(p))
+    imposta_risultato(partita, [(21, 17)])
+    # la riga in `partite` e quella del set in `set_punteggi`
+    assert backend.salva(_persistibile(stato)) == 2
+
+
+def test_importa_da_json(tmp_path, stato):
+    json_path, incassi_path, db = tmp_path / "dati.json", tmp_path / "incassi.json", tmp_path / "bv.db"
+    json_path.write_text(json.dumps(_persistibile(stato)), encoding="utf-8")
+    incassi_path.write_text(json.dumps(INCASSI), encoding="utf-8")
+
+    n_stato, n_incassi = importa_da_json(str(json_path), str(incassi_path), str(db))
+    assert n_stato > 0 and n_incassi == 3
+    riaperto = SQLiteBackend(str(db))
+    assert riaperto.carica() == _persistibile(stato)
+    assert riaperto.carica_incassi() == INCASSI
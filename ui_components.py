@@ -2,7 +2,7 @@
 ui_components.py — Stile DAZN Dark Mode + componenti riutilizzabili
 """
 import streamlit as st
-from data_manager import nome_squadra, get_squadra_by_id
+from data_manager import nome_squadra, get_squadra_by_id, nomi_atleti_squadra
 
 # ─── CSS DARK MODE STILE DAZN ────────────────────────────────────────────────
 
@@ -393,16 +393,15 @@ def render_match_card(state, partita, label=""):
         return
     
     def players_str(sq):
-        from data_manager import get_atleta_by_id
-        names = [get_atleta_by_id(state, aid)["nome"] for aid in sq["atleti"] if get_atleta_by_id(state, aid)]
-        return " / ".join(names)
+        return " / ".join(nomi_atleti_squadra(state, sq))
     
     parziali = " | ".join([f"{p[0]}-{p[1]}" for p in partita["punteggi"]]) if partita["punteggi"] else "—"
     confirmed_class = "confirmed" if partita["confermata"] else ""
+    orario = f" · 🕒 {partita['orario']} Campo {partita['campo']}" if partita.get("orario") else ""
     
     st.markdown(f"""
     <div class="match-card {confirmed_class}">
-        <div class="match-card-header">{label} {'✅ CONFERMATA' if partita["confermata"] else '🔴 LIVE'}</div>
+        <div class="match-card-header">{label}{orario} {'✅ CONFERMATA' if partita["confermata"] else '🔴 LIVE'}</div>
         <div class="match-body">
             <div class="team-side team-red">
                 <div class="team-name">{sq1['nome']}</div>
@@ -425,15 +424,119 @@ def render_match_card(state, partita, label=""):
     """, unsafe_allow_html=True)
 
 
+# ─── CONFERMA CONCORRENTE (più campi) ────────────────────────────────────────
+
+def revisione_letta(partita, key_prefix):
+    """Revisione della partita vista quando il form è comparso in questa sessione."""
+    from stato_condiviso import revisione_partita
+    return st.session_state.setdefault(f"{key_prefix}_rev", revisione_partita(partita))
+
+
+def applica_a_partita(state, partita, key_prefix, azione):
+    """Esegue azione() sulla partita se nessun altro campo l'ha modificata da
+    quando il form è comparso (revisione_letta); False, con avviso, se in conflitto."""
+    from stato_condiviso import modifica_partita, ConflittoRevisione
+    rev = st.session_state.pop(f"{key_prefix}_rev", None)
+    try:
+        with modifica_partita(state, partita, rev):
+            azione()
+    except ConflittoRevisione:
+        st.error("⚠️ Nel frattempo la partita è stata modificata da un'altra postazione: "
+                 "controlla il risultato e riprova.")
+        return False
+    return True
+
+
+# ─── CORREZIONE RISULTATO ────────────────────────────────────────────────────
+
+def render_correzione_risultato(state, partita, key_prefix):
+    """Modifica o annulla il risultato di una partita già confermata."""
+    from data_manager import correggi_risultato, annulla_risultato, partite_a_valle
+    
+    key_prefix = f"{key_prefix}_fix"
+    revisione_letta(partita, key_prefix)
+    with st.expander("✏️ Correggi Risultato", expanded=False):
+        n_set = max(len(partita["punteggi"]), 1 if state["torneo"]["formato_set"] == "Set Unico" else 3)
+        punteggi = []
+        for s in range(n_set):
+            p1_att, p2_att = partita["punteggi"][s] if s < len(partita["punteggi"]) else (0, 0)
+            col1, col2 = st.columns(2)
+            with col1:
+                p1 = st.number_input(f"Set {s+1} — {nome_squadra(state, partita['sq1'])}", 0, 50,
+                                     int(p1_att), key=f"{key_prefix}_s{s}_p1")
+            with col2:
+                p2 = st.number_input(f"Set {s+1} — {nome_squadra(state, partita['sq2'])}", 0, 50,
+                                     int(p2_att), key=f"{key_prefix}_s{s}_p2")
+            if p1 > 0 or p2 > 0:
+                punteggi.append((p1, p2))
+        
+        a_valle = partite_a_valle(state, partita)
+        if a_valle:
+            st.warning(f"⚠️ Se cambia il vincitore, {len(a_valle)} partite successive già giocate "
+                       "tornano da giocare.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("💾 Salva Correzione", key=f"{key_prefix}_ok", use_container_width=True):
+                if not punteggi:
+                    st.error("Inserisci almeno un set.")
+                    return
+                if applica_a_partita(state, partita, key_prefix,
+                                     lambda: correggi_risultato(state, partita, punteggi)):
+                    st.rerun()
+        with col2:
+            if st.button("↩️ Annulla Conferma", key=f"{key_prefix}_undo", use_container_width=True):
+                if applica_a_partita(state, partita, key_prefix,
+                                     lambda: annulla_risultato(state, partita)):
+                    st.rerun()
+
+
+# ─── CALENDARIO ──────────────────────────────────────────────────────────────
+
+def render_calendario(state):
+    """Griglia orari × campi delle partite pianificate, con ripianificazione."""
+    from calendario import pianifica_torneo, tabella_orari
+    from stato_condiviso import modifica
+    
+    torneo = state["torneo"]
+    if st.button("🔄 Ripianifica partite da giocare", key="btn_ripianifica", use_container_width=True):
+        with modifica():
+            n_slot = pianifica_torneo(state)
+        st.success(f"✅ Calendario aggiornato: {n_slot} turni su {torneo['campi']} campi")
+    
+    tabella = tabella_orari(state)
+    if not tabella:
+        st.info("Nessuna partita pianificata.")
+        return
+    
+    campi = range(1, max(max(c) for c in tabella.values()) + 1)
+    html = '<table class="rank-table"><tr><th>ORARIO</th>'
+    html += "".join(f"<th>CAMPO {c}</th>" for c in campi) + "</tr>"
+    for slot, per_campo in tabella.items():
+        orario = next(iter(per_campo.values()))["orario"]
+        html += f"<tr><td style='font-weight:700'>{orario}</td>"
+        for c in campi:
+            p = per_campo.get(c)
+            if p is None:
+                html += "<td>—</td>"
+                continue
+            nomi = " vs ".join(nome_squadra(state, p[k]) if p[k] else "da definire" for k in ("sq1", "sq2"))
+            stile = "color:var(--text-secondary)" if p["confermata"] else ""
+            html += f"<td style='{stile}'>{'✅ ' if p['confermata'] else ''}{nomi}</td>"
+        html += "</tr>"
+    html += "</table>"
+    st.markdown(html, unsafe_allow_html=True)
+    st.caption(f"Turni da {torneo['durata_slot']} min · riposo minimo {torneo['riposo_slot']} turno/i tra due partite")
+
+
 # ─── PODIO ───────────────────────────────────────────────────────────────────
 
 def render_podio(state, podio):
     """podio = [(pos, sq_id), ...]"""
     def sq_info(sid):
         sq = get_squadra_by_id(state, sid)
-        from data_manager import get_atleta_by_id
         if not sq: return "?", "?"
-        names = [get_atleta_by_id(state, aid)["nome"] for aid in sq["atleti"] if get_atleta_by_id(state, aid)]
+        names = nomi_atleti_squadra(state, sq)
         return sq["nome"], " / ".join(names)
     
     podio_dict = {pos: sid for pos, sid in podio}
@@ -463,8 +566,7 @@ def render_podio(state, podio):
 def render_winner_banner(state, vincitore_sq_id):
     sq = get_squadra_by_id(state, vincitore_sq_id)
     if not sq: return
-    from data_manager import get_atleta_by_id
-    names = [get_atleta_by_id(state, aid)["nome"] for aid in sq["atleti"] if get_atleta_by_id(state, aid)]
+    names = nomi_atleti_squadra(state, sq)
     st.markdown(f"""
     <div class="winner-banner">
         <div class="winner-title">🏆 Campioni del Torneo 🏆</div>